@@ -1,8 +1,6 @@
-from Model.Model import Model
-from Model.Model import LaserSettings
+import multiprocessing
 from ConfigFiles.TestSettings import TestSettings
 from ConfigFiles.MachineSettings import MachineSettings
-from time import sleep
 
 try:
     from ctypes import windll  # Only exists on Windows.
@@ -11,12 +9,16 @@ try:
 except ImportError:
     pass
 
-c = TestSettings()
-s = MachineSettings()
-l = LaserSettings()
-m = Model(s,c,l)
-
 if __name__ == '__main__':
+    # in the frozen exe the post processing worker process starts this executable again, freeze_support runs the worker there and returns only in the app
+    multiprocessing.freeze_support()
+    # the model is only imported and built in the main process, the post processing worker process imports this script again
+    from Model.Model import Model
+    from Model.Model import LaserSettings
+    c = TestSettings()
+    s = MachineSettings()
+    l = LaserSettings()
+    m = Model(s,c,l)
     m.connectToPlc()
     
     # Monitor connection by checking heartbeat
@@ -24,7 +26,7 @@ if __name__ == '__main__':
         previousHeartbeat = -1 # initial value that won't match the unsigned heartbeat tag
         while previousHeartbeat != m.heartBeatIntag.value:
             previousHeartbeat = m.heartBeatIntag.value
-            sleep(2)
+            m.camera.pumpFrameEvents(2) # sleeps, delivering the camera's DataReady events meanwhile
         print("Loss of connection detected; exiting application")
 
     except Exception as e:
@@ -34,6 +36,10 @@ if __name__ == '__main__':
 
     finally:
         # Disconnect the client so its threads (and by extension, this script) terminate
+        print("Reaction dispatcher: " + str(m.reactionDispatcher.stats()))
+        m.reactionDispatcher.shutdown(wait=False)
+        if m.postProcessing is not None:
+            m.postProcessing.stop()
         try:
             m.client.disconnect()
         except:
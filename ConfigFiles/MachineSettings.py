@@ -1,3 +1,5 @@
+import os
+
 
 class MachineSettings():
     _simulation = False
@@ -10,6 +12,38 @@ class MachineSettings():
     '192.168.210.52', 
     '192.168.210.53', 
     '192.168.210.54']# [The IP addresses to the laser racks [1,2,3,4]]
+    _simulatePyrometer = False # use the fake Juno COM object (Model.DeviceSimulators) instead of the device
+    _pyroBackgroundAcquisition = False # poll the Juno from a background thread instead of on each capture command
+    _pyroPollIntervalSec = 0.05 # GetData polling interval of the background acquisition
+    _pyroAcquisitionQueueSize = 256 # decoded chunks held before the oldest is dropped as an overrun
+    _pyroStreamStartDelaySec = 5.0 # fixed wait before starting the pyrometer stream of a pixel when the readiness probe is off or fails
+    _pyroReadyProbe = True # start the stream of a pixel as soon as the Juno returns pulse data instead of after the fixed wait
+    _pyroReadyTimeoutSec = 1.0 # longest readiness probe before falling back to the fixed wait
+    _pyroContinuousStream = False # keep the Juno stream running for the whole calibration and split it into levels by device timestamp, instead of restarting it for every pixel
+    _reactionWorkers = 2 # worker threads running the PLC tag reactions: one for the serialized command queue, one for the heartbeat
+    _reactionQueueSize = 256 # queued tag changes before the OPC-UA receive thread has to wait
+    _lutBankStorePath = os.path.join("tmp", "LUT_Bank.sqlite") # SQLite store of every generated LUT bank by machine and calibration ID, used to upload earlier calibrations again
+    _cameraPersistentSession = True # initialize the DataRay camera once and again only when a health check fails, instead of after every frame
+    _cameraFrameEvents = True # wait for the DataReady event of the DataRay control before reading a frame
+    _cameraFrameTimeoutSec = 5.0 # longest wait for a DataReady event
+    _postProcessingWorker = True # run the end of test processing (results, LUTs, CSV files) in a separate process so the PLC handshakes stay responsive
+    # OPC-UA monitoring tiers: publishing interval (ms) of the tier's subscription, sampling interval (ms), queue size and absolute deadband of its tags
+    # command tags queue a few samples so a quick True/False pulse of a command is never sampled away.
+    # Values that scale measurements (calibration factors) go in the scale tier, no deadband so no change is ever filtered out
+    _opcuaTiers = {
+        "command": {"publishingInterval": 20, "samplingInterval": 10, "queueSize": 4, "deadband": 0},
+        "heartbeat": {"publishingInterval": 100, "samplingInterval": 50, "queueSize": 1, "deadband": 0},
+        "telemetry": {"publishingInterval": 500, "samplingInterval": 250, "queueSize": 1, "deadband": 0.01},
+        "scale": {"publishingInterval": 500, "samplingInterval": 250, "queueSize": 1, "deadband": 0}
+        }
+    # plcTags key -> tier, monitored tags not listed are commands. Parameters read by a command (Zaber targets) stay in the command tier
+    _opcuaTagTiers = {
+        "HeartbeatOut": "heartbeat",
+        "GantryXPositionStatus": "telemetry",
+        "GantryYPositionStatus": "telemetry",
+        "PyroMultiplicationFactor": "scale",
+        "ComPortNumber": "telemetry"
+        }
     def __init__(self) -> None:
         pass
     
\ No newline at end of file
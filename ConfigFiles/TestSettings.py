@@ -26,6 +26,11 @@ class TestSettings():
         self._coefficients = np.full((1,84), 1, dtype=float)[0]
         self._processTolerance = 5
         self._junoPlusSerial = ""
+        self._adaptiveSampling = False # tell the PLC (LevelSampleComplete) when a power level has enough pulses instead of always firing _numPulsesPerLevel
+        self._adaptiveConfidence = 0.95 # confidence level of the interval of the mean power of a level
+        self._adaptiveMinPulses = 5 # pulses needed before a level can be complete
+        self._adaptivePrecisionPercent = 1.0 # largest half width of the confidence interval, in percent of the mean
+        self._adaptivePollIntervalSec = 0.05 # how often the pulses of the level are checked
 
     def settingsAsDict(self):
         return {'Pulse Delay (ms)': self._pulseDelayMsec,
@@ -40,7 +45,11 @@ class TestSettings():
         'Tolerance Band (%)': self._tolerancePercent,
         'Process Tolerance (%)': self._processTolerance,
         'Test Type': self._testType,
-        'Pixel List': self._pixelList}
+        'Pixel List': self._pixelList,
+        'Adaptive Sampling': self._adaptiveSampling,
+        'Adaptive Confidence': self._adaptiveConfidence,
+        'Adaptive Min Pulses': self._adaptiveMinPulses,
+        'Adaptive Precision (%)': self._adaptivePrecisionPercent}
 
     def updateTestSettings(self,_pulseDelayMsec,_pulseOnMsec,_pulseOffMsec,_availableLaserPowerWatts,_safePowerLimitWatts,_numPulsesPerLevel,_startingPowerLevel,_numPowerLevelSteps,_powerLevelIncrement,_tolerancePercent,_testType,_pixelList, _processTolerance):
         self._pulseDelayMsec = _pulseDelayMsec
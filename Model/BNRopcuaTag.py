@@ -8,6 +8,8 @@ from ast import Sub
 from opcua import ua
 import numpy as np
 from threading import Thread
+from collections.abc import Mapping
+from time import time
 from time import sleep
 
 class SubHandler():
@@ -24,8 +26,12 @@ class SubHandler():
         def datachange_notification(self, node, val, data):
             if (self.tag.name != "ns=6;s=::AsGlobalPV:gOpcData_ToCalibApp.HeartbeatOut"):
                 print(self.tag.name + " changed to " + str(val))
-            t = Thread(target=self.updateTag, args=(val,))
-            t.start()
+            if self.tag.dispatcher is not None:
+                # value update and reactions run in order on the tag's serial queue
+                self.tag.dispatcher.submit(self.tag.reactionKey, self.updateTag, val)
+            else:
+                t = Thread(target=self.updateTag, args=(val,))
+                t.start()
             pass
 
         def event_notification(self, event):
@@ -36,12 +42,109 @@ class SubHandler():
             pass
 
 
+## One shared OPC-UA subscription for a group of monitored tags
+## All the tags are registered as monitored items with a single CreateMonitoredItems request and
+## notifications are routed to the tag that owns the monitored item (by client handle)
+## Every monitored item can have its own sampling interval, queue size and absolute deadband
+class BNRopcuaSubscription:
+    def __init__(self, client, publishingInterval=200, dispatcher=None):
+        self.client = client
+        self.publishingInterval = publishingInterval
+        self.dispatcher = dispatcher  # ReactionDispatcher the subscribed tags run their reactions on
+        self.subscription = None
+        self._tags = {}  # client handle of the monitored item -> tag
+        self._lastClientHandle = 0
+
+    ## samplingInterval defaults to the publishing interval, a deadband of 0 reports every change
+    def subscribe(self, tags, samplingInterval=None, queueSize=0, deadband=0):
+        tags = [tag for tag in tags if not tag.subscription]
+        if len(tags) == 0:
+            return []
+        if self.subscription is None:
+            self.subscription = self.client.create_subscription(self.publishingInterval, self)
+        requests = []
+        for tag in tags:
+            self._lastClientHandle += 1
+            tag._clientHandle = self._lastClientHandle
+            # registered before the request, the initial value can arrive before the response
+            tag.subscription = True
+            tag.VarHandler = SubHandler(tag)
+            tag.VariableSub = self.subscription
+            tag.subscriptionManager = self
+            if self.dispatcher is not None:
+                tag.dispatcher = self.dispatcher
+            self._tags[tag._clientHandle] = tag
+            requests.append(self._monitoredItemRequest(tag, samplingInterval, queueSize, deadband))
+        handles = self.subscription.create_monitored_items(requests)
+        for tag, handle in zip(tags, handles):
+            if isinstance(handle, ua.StatusCode): # monitored item rejected by the server, tag stays polled
+                print(tag.name + " subscription failed: " + str(handle))
+                del self._tags[tag._clientHandle]
+                tag.subscription = False
+                tag.subscriptionManager = None
+                continue
+            tag.SubHandle = handle
+        return handles
+
+    def _monitoredItemRequest(self, tag, samplingInterval, queueSize, deadband):
+        itemToMonitor = ua.ReadValueId()
+        itemToMonitor.NodeId = tag.node.nodeid
+        itemToMonitor.AttributeId = ua.AttributeIds.Value
+        parameters = ua.MonitoringParameters()
+        parameters.ClientHandle = tag._clientHandle
+        parameters.SamplingInterval = self.publishingInterval if samplingInterval is None else samplingInterval
+        parameters.QueueSize = queueSize
+        parameters.DiscardOldest = True
+        if deadband > 0:
+            dataChangeFilter = ua.DataChangeFilter()
+            dataChangeFilter.Trigger = ua.DataChangeTrigger.StatusValue
+            dataChangeFilter.DeadbandType = ua.DeadbandType.Absolute
+            dataChangeFilter.DeadbandValue = deadband
+            parameters.Filter = dataChangeFilter
+        request = ua.MonitoredItemCreateRequest()
+        request.ItemToMonitor = itemToMonitor
+        request.MonitoringMode = ua.MonitoringMode.Reporting
+        request.RequestedParameters = parameters
+        return request
+
+    def unsubscribe(self, tag):
+        if self._tags.get(getattr(tag, "_clientHandle", None)) is tag:
+            self.subscription.unsubscribe(tag.SubHandle)
+            del self._tags[tag._clientHandle]
+        tag.subscription = False
+        tag.subscriptionManager = None
+
+    def delete(self):
+        if self.subscription is not None:
+            self.subscription.delete()
+        for tag in self._tags.values():
+            tag.subscription = False
+            tag.subscriptionManager = None
+        self._tags = {}
+        self.subscription = None
+
+    def datachange_notification(self, node, val, data):
+        tag = self._tags.get(data.subscription_data.client_handle)
+        if tag is not None:
+            tag.VarHandler.datachange_notification(node, val, data)
+
+    def event_notification(self, event):
+        pass
+
+
 class BNRopcuaTag:
     def __init__(self, client, VarName):
        self.client = client
        self.name = VarName
        self.node=client.get_node(VarName)
        self.subscription = False
+       self.subscriptionManager = None
+       self.dispatcher = None       # ReactionDispatcher for the reactions, a thread per reaction without one
+       self.reactionKey = VarName   # tags with the same key react one at a time, in order
+       self._variantType = None     # data type of the node, read once on the first write
+       self._arrayLength = None     # 0 for scalars, read once on the first array write
+       self._children = None        # element nodes of an array, only needed when the server can't write index ranges
+       self._indexRangeWrites = None # None until the first index range write is read back, then whether the server honours index ranges
        self._value = None
        self._observers = []
 
@@ -64,24 +167,81 @@ class BNRopcuaTag:
         if self.subscription:
             print('Variable not Settable\n')
         else:
-            vartype=self.node.get_data_type_as_variant_type()
-            if isinstance(val,bool):
-                self.node.set_value(ua.DataValue(ua.Variant(val,vartype)))
-            elif isinstance(val,int):
-                self.node.set_value(ua.DataValue(ua.Variant(int(val),vartype)))
-            elif isinstance(val,float):
-                self.node.set_value(ua.DataValue(ua.Variant(val,ua.VariantType.Float)))
-            elif isinstance(val, list) and self.node.get_array_dimensions()[0] > 0:
-                pixels = self.node.get_children()
-                if len(val) < len(pixels):
-                    for i in range(len(val)):
-                        pixels[i].set_value(ua.DataValue(ua.Variant(int(val[i]),vartype)))
+            variant = self._toVariant(val)
+            if variant is not None:
+                self.node.set_value(ua.DataValue(variant))
+            elif isinstance(val, list) and self.arrayLength() > 0:
+                if len(val) < self.arrayLength():
+                    self._writeArray(val)
             else:
                 print(self.name + " Value: " + str(val) + " Type: " + str(type(val)) + ' Invalid Data Type\n')
             self.value = val
 
 
 
+    ## Variant type of the node, only read from the server the first time
+    def variantType(self):
+        if self._variantType is None:
+            self._variantType = self.node.get_data_type_as_variant_type()
+        return self._variantType
+
+    ## Declared length of an array node, 0 for scalars
+    def arrayLength(self):
+        if self._arrayLength is None:
+            dimensions = self.node.get_array_dimensions()
+            self._arrayLength = dimensions[0] if dimensions else 0
+        return self._arrayLength
+
+    def children(self):
+        if self._children is None:
+            self._children = self.node.get_children()
+        return self._children
+
+    ## Writes the first len(val) elements of the array as one array Variant with an index range
+    ## The first index range write is read back: some servers answer Good but ignore the range and truncate the array to the written elements.
+    ## Servers that reject or ignore index ranges get the elements written to the child nodes instead, still in a single request,
+    ## or the whole array with the other elements as they were when the node has no element nodes
+    def _writeArray(self, val):
+        vartype = self.variantType()
+        if len(val) == 0:
+            return
+        values = [int(v) for v in val]
+        before = None
+        if self._indexRangeWrites is not False:
+            if self._indexRangeWrites is None:
+                before = list(self.node.get_value())
+            indexRange = "0" if len(values) == 1 else "0:" + str(len(values) - 1)
+            result = _writeRequest(self.client, [_writeValue(self.node, ua.Variant(values, vartype), indexRange)])[0]
+            if result.is_good() and self._indexRangeWrites:
+                return
+            if result.is_good():
+                after = list(self.node.get_value())
+                if len(after) == len(before) and after[:len(values)] == values:
+                    self._indexRangeWrites = True
+                    return
+                print(self.name + " array write ignored the index range (" + str(len(after)) + " of " + str(len(before)) + " elements left), writing the elements one by one")
+            else:
+                print(self.name + " array write rejected (" + str(result) + "), writing the elements one by one")
+            self._indexRangeWrites = False
+        children = self.children()
+        if len(children) >= len(values):
+            results = _writeRequest(self.client, [_writeValue(children[i], ua.Variant(values[i], vartype)) for i in range(len(values))])
+        else:
+            current = before if before is not None else list(self.node.get_value())
+            results = _writeRequest(self.client, [_writeValue(self.node, ua.Variant(values + current[len(values):], vartype))])
+        for result in results:
+            result.check()
+
+    ## Scalar value as the Variant written to the node, None for values setPlcValue has to handle itself
+    def _toVariant(self, val):
+        if isinstance(val,bool):
+            return ua.Variant(val,self.variantType())
+        elif isinstance(val,int):
+            return ua.Variant(int(val),self.variantType())
+        elif isinstance(val,float):
+            return ua.Variant(val,ua.VariantType.Float)
+        return None
+
     def _setAsUpdating(self):
         sleep(0.1)
         self.subscription = True
@@ -90,13 +250,19 @@ class BNRopcuaTag:
         self.SubHandle=self.VariableSub.subscribe_data_change(self.node)
                         
     def _removeUpdates(self):
-        if self.subscription:
+        if self.subscriptionManager is not None:
+            self.subscriptionManager.unsubscribe(self)
+        elif self.subscription:
             self.VariableSub.unsubscribe(self.SubHandle)
             self.VariableSub.delete() 
 
     def react(self):
         """Run reactions"""
-        [Thread(target=func).start() for func in self._observers]
+        if self.dispatcher is not None:
+            # already on the tag's serial queue when the change came from the subscription
+            [func() for func in self._observers]
+        else:
+            [Thread(target=func).start() for func in self._observers]
  
     def attachReaction(self, observer):
         """If the observer is not in the list,
@@ -110,11 +276,111 @@ class BNRopcuaTag:
             self._observers.remove(observer)
         except ValueError:
             pass
-                    
-    
 
-                 
-           
-        
-            
-        
\ No newline at end of file
+
+def _writeValue(node, variant, indexRange=None):
+    writeValue = ua.WriteValue()
+    writeValue.NodeId = node.nodeid
+    writeValue.AttributeId = ua.AttributeIds.Value
+    writeValue.Value = ua.DataValue(variant)
+    if indexRange is not None:
+        writeValue.IndexRange = indexRange
+    return writeValue
+
+## One Write service call for all the values, returns a StatusCode per value
+def _writeRequest(client, writeValues):
+    params = ua.WriteParameters()
+    params.NodesToWrite = writeValues
+    return client.uaclient.write(params)
+
+
+## Read only values of a group of tags, all read by the same OPC-UA Read request
+## Values are accessed by tag name, snapshot["ActivePixel"] or snapshot.ActivePixel
+class BNRopcuaSnapshot(Mapping):
+    __slots__ = ("_values", "timestamp")
+
+    def __init__(self, values, timestamp):
+        object.__setattr__(self, "_values", dict(values))
+        object.__setattr__(self, "timestamp", timestamp) # time.time() when the values were read
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __getattr__(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("snapshot values can't be changed")
+
+    def __repr__(self):
+        return "BNRopcuaSnapshot(" + repr(self._values) + ")"
+
+
+## plcTags dictionary (name -> BNRopcuaTag) that can read and write many tags at once
+class BNRopcuaTagDict(dict):
+    def __init__(self, client, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.client = client
+        self.groups = {}  # group name -> tag names read together by readSnapshot
+
+    ## Names a group of tags so hot paths can read them with readSnapshot(groupName)
+    def defineGroup(self, groupName, names):
+        for name in names:
+            self[name] # unknown tags fail here instead of on the first read
+        self.groups[groupName] = list(names)
+
+    ## Reads a group name or a list of tag names in a single OPC-UA Read request
+    ## The values of unsubscribed tags are cached on the tags as if they had been read one by one
+    def readSnapshot(self, names):
+        if isinstance(names, str):
+            names = self.groups[names]
+        tags = [self[name] for name in names]
+        params = ua.ReadParameters()
+        for tag in tags:
+            readValue = ua.ReadValueId()
+            readValue.NodeId = tag.node.nodeid
+            readValue.AttributeId = ua.AttributeIds.Value
+            params.NodesToRead.append(readValue)
+        results = self.client.uaclient.read(params)
+        timestamp = time()
+        values = {}
+        for name, tag, result in zip(names, tags, results):
+            result.StatusCode.check() # raise like a failed single tag read
+            values[name] = result.Value.Value
+            if not tag.subscription:
+                tag._value = values[name]
+        return BNRopcuaSnapshot(values, timestamp)
+
+    ## Writes {tag name: value} in a single OPC-UA Write request, values are written in the order given
+    ## Subscribed tags, arrays and unsupported types go through the tag's own setPlcValue
+    def setPlcValues(self, values):
+        writes = []
+        for name, val in values.items():
+            tag = self[name]
+            variant = None if tag.subscription else tag._toVariant(val)
+            if variant is None:
+                tag.setPlcValue(val)
+            else:
+                writes.append((tag, val, variant))
+        if len(writes) == 0:
+            return
+        results = _writeRequest(self.client, [_writeValue(tag.node, variant) for tag, val, variant in writes])
+        failed = None
+        for (tag, val, variant), result in zip(writes, results):
+            if result.is_good():
+                tag.value = val
+            else:
+                print(tag.name + " write failed: " + str(result))
+                if failed is None:
+                    failed = result
+        if failed is not None:
+            failed.check() # raise like a failed single tag write
@@ -8,6 +8,13 @@ import zaber.serial
 import wx
 import wx.lib.activex
 import logging
+from Model.FrameBuffer import FrameBuffer
+from Model.FrameReadyEvent import FrameReadyEvent
+
+try:
+    import comtypes.client # delivers the COM events of the DataRay control, comes with wx.lib.activex on Windows
+except ImportError:
+    comtypes = None
 
 """ set up python logger"""
 
@@ -25,12 +32,33 @@ logger.addHandler(ch)
 
 
 class CameraDriver:
-    
+
+    ## With persistentSession the camera is initialized once and only initialized again when a health check fails,
+    ## and the frame metadata uses the properties cached at initialization instead of querying them every frame
+    ## With frame events connected (connectFrameEvents) fetchFrame waits up to frameTimeoutSec for the DataReady of a new frame
+    def __init__(self, persistentSession=False, frameTimeoutSec=5.0) -> None:
+        self.frameBuffer = FrameBuffer() # frames returned by fetchFrame stay valid until the second fetch after them
+        self.frameReady = FrameReadyEvent()
+        self.frameTimeoutSec = frameTimeoutSec
+        self._frameEvents = None # event connection, the DataReady events stop when it is released
+        self._fetchedFrame = 0 # DataReady count of the last frame fetched
+        self.captureTimes = None # seconds of the last fetchFrame: waiting for DataReady, reading and converting the frame, total
+        self.persistentSession = persistentSession
+        self.isConnected = False
+        self.sessionSettings = {} # initialize arguments of the session, with the last exposure and gain set
+        self.sessionProperties = None # camera NID, resolution and frame size cached at initialization, None until the session is healthy
+        self.exposure = None # last exposure and gain read back after setting them
+        self.gain = None
+        self.initializations = 0
+
     def zaberConnect(self):
         ZaberConnect = zaber.serial.AsciiSerial("COM11")
         return ZaberConnect
     
     def initialize(self,gdCtrl, exposure=1.0, gain=1.0, triggerMode=3, fullResolution=1, topLeft=(0,0), dimensions=(2048,2048)): #dimensions= (width, height)
+        self.initializations += 1
+        self.sessionSettings = {"exposure": exposure, "gain": gain, "triggerMode": triggerMode, "fullResolution": fullResolution, "topLeft": topLeft, "dimensions": dimensions}
+        self.sessionProperties = None
         flag_stop = gdCtrl.ctrl.StopDevice()
         logger.debug(f"gdCtrl.ctrl.StopDevice {flag_stop}")
         flag_start = gdCtrl.ctrl.StartDriver()
@@ -48,6 +76,8 @@ class CameraDriver:
             self.softwareVersion = gdCtrl.ctrl.GetSoftwareVersion() # 8.0D92 is expected here
             #gdCtrl.ctrl.LoadThisJobFile('ConfigFiles\wincam_settings.ojf')
             self.cameraNID = gdCtrl.ctrl.GetCameraNID(0)
+            self.sessionProperties = {'CameraNID': self.cameraNID, 'FullRes': gdCtrl.ctrl.CaptureIsFullResolution(),
+                                      'HRes': gdCtrl.ctrl.GetHorizontalPixels(), 'VRes': gdCtrl.ctrl.GetVerticalPixels()}
         else:
             print("An error occurred initializing camera. Check Camera connection is ok")    
     
@@ -67,14 +97,56 @@ class CameraDriver:
         
     def setExposure(self, newExposure,gdCtrl):
         gdCtrl.ctrl.SetTargetCameraExposure(0, newExposure)
-        return gdCtrl.ctrl.GetTargetCameraExposure(0)==newExposure
+        self.exposure = gdCtrl.ctrl.GetTargetCameraExposure(0)
+        self.sessionSettings["exposure"] = newExposure
+        return self.exposure==newExposure
     
     def getGain(self,gdCtrl):
         return gdCtrl.ctrl.GetTargetCameraGain(0)
         
     def setGain(self, newGain,gdCtrl):
         gdCtrl.ctrl.SetTargetCameraGain(0, newGain)
-        return gdCtrl.ctrl.GetTargetCameraGain(0)==newGain
+        self.gain = gdCtrl.ctrl.GetTargetCameraGain(0)
+        self.sessionSettings["gain"] = newGain
+        return self.gain==newGain
+
+    ## Connects the DataReady events of the control to frameReady, getEvents is comtypes.client.GetEvents unless given (e.g. FakeDataRayCOM.GetEvents)
+    ## Returns False if there is no way to get the events, fetchFrame then reads the frame without waiting
+    def connectFrameEvents(self, gdCtrl, getEvents=None):
+        if getEvents is None and comtypes is not None:
+            getEvents = comtypes.client.GetEvents
+        if getEvents is None:
+            return False
+        try:
+            self._frameEvents = getEvents(gdCtrl.ctrl, self.frameReady)
+        except Exception as e:
+            logger.error('could not connect the DataReady events, frames are read without waiting')
+            logger.error(e, exc_info=True)
+            return False
+        self._fetchedFrame = self.frameReady.count
+        return True
+
+    ## COM events are delivered by the message loop of the thread that created the control, that thread calls this instead of sleeping
+    def pumpFrameEvents(self, timeoutSec):
+        if self._frameEvents is not None and comtypes is not None:
+            comtypes.client.PumpEvents(timeoutSec)
+        else:
+            time.sleep(timeoutSec)
+
+    ## Waits for the DataReady of a frame newer than the last one fetched, returns immediately if it already came
+    ## Returns False on timeout or without frame events
+    def waitForNextFrame(self, timeoutSec=None):
+        if self._frameEvents is None:
+            return False
+        frameCount = self.frameReady.waitForFrame(self._fetchedFrame, self.frameTimeoutSec if timeoutSec is None else timeoutSec)
+        if frameCount is None:
+            return False
+        self._fetchedFrame = frameCount
+        return True
+
+    ## Health check of the persistent session: it was initialized and the device still runs
+    def sessionHealthy(self, gdCtrl):
+        return self.sessionProperties is not None and gdCtrl.ctrl.StartDevice()
     
     def fetchFrame(self,activePixel,gantryXPosition,gantryYPosition,zaberPosition,pulseOnMsec,CurrentPowerLevel,machineName,gdCtrl):
 
@@ -82,13 +154,20 @@ class CameraDriver:
         # Com Error, Exposure, Gain, Full Res, H Res, V Res, and 2D Image.
         print('start fetch frame')
         logger.info('start fetch frame')
-        deviceOK = gdCtrl.ctrl.StartDevice()
-        # if Error, re-initialize with default values
-        if not deviceOK:
-            logger.info('reinialize camera device since deviceOK is Falsed')
-            self.initialize(gdCtrl)
-            # TODO: I don't want to error here, but something should happen
-            # assert self.isConnected, 'Failed to connect to camera; check hardware connection'
+        fetchStart = time.perf_counter()
+        if self.persistentSession:
+            # initialize again with the session settings only when the health check fails
+            if not self.sessionHealthy(gdCtrl):
+                logger.info('reinitialize camera session since the health check failed')
+                self.initialize(gdCtrl, **self.sessionSettings)
+        else:
+            deviceOK = gdCtrl.ctrl.StartDevice()
+            # if Error, re-initialize with default values
+            if not deviceOK:
+                logger.info('reinialize camera device since deviceOK is Falsed')
+                self.initialize(gdCtrl)
+                # TODO: I don't want to error here, but something should happen
+                # assert self.isConnected, 'Failed to connect to camera; check hardware connection'
         
         metadata = dict()
         metadata['ActivePixel'] = activePixel
@@ -98,12 +177,20 @@ class CameraDriver:
         metadata['PulseOnMsec'] = pulseOnMsec
         metadata['PowerLevel'] = CurrentPowerLevel
         metadata['MachineName'] = machineName
-        metadata['CameraNID'] = gdCtrl.ctrl.GetCameraNID(0)
-        metadata['Exposure'] = self.getExposure(gdCtrl)
-        metadata['Gain'] = self.getGain(gdCtrl)
-        metadata['FullRes'] = gdCtrl.ctrl.CaptureIsFullResolution()
-        metadata['HRes'] = gdCtrl.ctrl.GetHorizontalPixels()
-        metadata['VRes'] = gdCtrl.ctrl.GetVerticalPixels()
+        if self.persistentSession and self.sessionProperties is not None:
+            metadata['CameraNID'] = self.sessionProperties['CameraNID']
+            metadata['Exposure'] = self.exposure
+            metadata['Gain'] = self.gain
+            metadata['FullRes'] = self.sessionProperties['FullRes']
+            metadata['HRes'] = self.sessionProperties['HRes']
+            metadata['VRes'] = self.sessionProperties['VRes']
+        else:
+            metadata['CameraNID'] = gdCtrl.ctrl.GetCameraNID(0)
+            metadata['Exposure'] = self.getExposure(gdCtrl)
+            metadata['Gain'] = self.getGain(gdCtrl)
+            metadata['FullRes'] = gdCtrl.ctrl.CaptureIsFullResolution()
+            metadata['HRes'] = gdCtrl.ctrl.GetHorizontalPixels()
+            metadata['VRes'] = gdCtrl.ctrl.GetVerticalPixels()
         
         # Get timestamp and convert to various formats
 
@@ -112,28 +199,47 @@ class CameraDriver:
 
         metadata['TimeString'] = time_utc.strftime('%Y%m%dT%H%M%SZ%f')
 
+        # Wait for the DataReady of a new frame, read the frame anyway on timeout like without events
+        waitStart = time.perf_counter()
+        if self._frameEvents is not None and not self.waitForNextFrame():
+            logger.warning(f'no DataReady event within {self.frameTimeoutSec} s, reading the last frame')
+        waitSec = time.perf_counter() - waitStart
+
         # Convert WinCamData tuple to 2D numpy array
-        retry_counter = 1
+        # with frame events a failed read is retried once on the next frame instead of sleeping
+        retry_counter = 2 if self._frameEvents is not None else 1
         while retry_counter >=1:
             retry_counter -= 1
             try:
                 logger.info(f'try to fetch image. Counter {retry_counter}')
-                rawData = gdCtrl.ctrl.GetWinCamDataAsVariant()
-                imageData = np.array(rawData, dtype=np.uint16)
+                readStart = time.perf_counter()
+                rawData = self.frameBuffer.readFrame(gdCtrl.ctrl)
+                imageData = self.frameBuffer.convert(rawData)
                 logger.debug(f'image size: {imageData.shape}')
                 logger.debug(f"meta data Vres: {metadata['VRes']}")
                 logger.debug(f"meta data Hres: {metadata['HRes']}")
-                if metadata['VRes']*metadata['HRes'] == len(rawData):
+                if metadata['VRes']*metadata['HRes'] == imageData.size:
                     imageData = imageData.reshape((metadata['VRes'], metadata['HRes'])) # (numRows, numCols)
-                    self.initialize(gdCtrl)
+                    self.frameBuffer.keepFrame() # retries of a failed read reuse the buffer, the frame handed out is not overwritten
+                    self.captureTimes = {'wait': waitSec, 'read': time.perf_counter() - readStart, 'total': time.perf_counter() - fetchStart}
+                    logger.info(f"frame captured in {self.captureTimes['total'] * 1000:.1f} ms, {waitSec * 1000:.1f} ms waiting for DataReady")
+                    if not self.persistentSession:
+                        self.initialize(gdCtrl)
                     return metadata, imageData  
                 else:
                     imageData = imageData.reshape((1,-1)) # (numRows=1, numCols=any); if there's a mismatch in rows/cols for any reason, one row will at least contain everything. TODO: does image processing hate this?
+                    self.sessionProperties = None # the frame doesn't match the session, the next fetch initializes again
                               
             except Exception as e:
                 logger.error('error in capture the image')
                 logger.error(e, exc_info=True)
-            time.sleep(5)
+                self.sessionProperties = None
+            if self._frameEvents is None:
+                time.sleep(5)
+            elif retry_counter >= 1:
+                waitStart = time.perf_counter()
+                self.waitForNextFrame()
+                waitSec += time.perf_counter() - waitStart
         return None, None
             
         # TODO temporarily workaround: reintiailize the setting after image .
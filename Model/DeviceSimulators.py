@@ -0,0 +1,228 @@
+import threading
+import time
+import numpy as np
+
+## Stand-in for the OphirLMMeasurement.CoLMMeasurement COM object
+## Implements the calls OphirJunoCOM makes and produces a synthetic pulse train while streaming, so the pyrometer code
+## (and the background acquisition) can run and be benchmarked without the device or Windows.
+## Pulses arrive at pulseRateHz with energy powerWatts * pulseOnMsec plus gaussian noise; GetData returns everything since the last call.
+## Like a Juno, GetData returns empty data until the stream is armed armDelaySec after StartStream and the pulses before that are lost
+## (with raiseWhileArming it raises instead), and failStarts makes the next StartStream calls raise like a busy device
+class FakeOphirCOM:
+
+    def __init__(self, powerWatts=100.0, pulseOnMsec=5.0, pulseRateHz=15.0, noisePercent=1.0, getDataDelaySec=0.0, armDelaySec=0.0, raiseWhileArming=False, seed=None) -> None:
+        self.powerWatts = powerWatts            ## power of the simulated pulses, change it to follow the PLC power levels
+        self.pulseOnMsec = pulseOnMsec
+        self.pulseRateHz = pulseRateHz
+        self.noisePercent = noisePercent
+        self.getDataDelaySec = getDataDelaySec  ## simulated COM round trip per GetData call
+        self.armDelaySec = armDelaySec          ## time from StartStream until GetData returns pulses
+        self.raiseWhileArming = raiseWhileArming ## GetData raises instead of returning empty data before the stream is armed
+        self.failStarts = 0                     ## number of coming StartStream calls that fail
+        self.serialNumber = "FAKE0001"
+        self._random = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._streaming = False
+        self._streamStart = 0.0
+        self._pulsesSent = 0
+
+    def ScanUSB(self):
+        return (self.serialNumber,)
+
+    def OpenUSBDevice(self, device):
+        return 1
+
+    def IsSensorExists(self, deviceHandle, channel):
+        return True
+
+    def GetDeviceInfo(self, deviceHandle):
+        return ("Juno+", "1.0", self.serialNumber)
+
+    def GetDeviceCalibrationDueDate(self, deviceHandle):
+        return "2099-01-01 00:00:00"
+
+    def GetSensorInfo(self, deviceHandle, channel):
+        return ("FAKEPYRO", "Pyro", "Fake")
+
+    def GetSensorCalibrationDueDate(self, deviceHandle, channel):
+        return "2099-01-01 00:00:00"
+
+    def StartStream(self, deviceHandle, channel):
+        if self.failStarts > 0:
+            self.failStarts -= 1
+            raise RuntimeError("StartStream failed, device busy")
+        with self._lock:
+            self._streaming = True
+            self._streamStart = time.perf_counter()
+            self._pulsesSent = 0
+
+    def StopStream(self, deviceHandle, channel):
+        with self._lock:
+            self._streaming = False
+
+    def StopAllStreams(self):
+        self.StopStream(0, 0)
+
+    def CloseAll(self):
+        self.StopStream(0, 0)
+
+    def GetData(self, deviceHandle, channel):
+        if self.getDataDelaySec > 0:
+            time.sleep(self.getDataDelaySec)
+        with self._lock:
+            if not self._streaming:
+                return ((), (), ())
+            elapsedSec = time.perf_counter() - self._streamStart
+            if elapsedSec < self.armDelaySec:
+                if self.raiseWhileArming:
+                    raise RuntimeError("GetData failed, stream not armed")
+                return ((), (), ())
+            pulsesDue = int(elapsedSec * self.pulseRateHz)
+            first, self._pulsesSent = max(self._pulsesSent, int(self.armDelaySec * self.pulseRateHz)), pulsesDue
+            return self.makePulses(first, pulsesDue)
+
+    ## Pulses first..last-1 of the current stream in the COM result format: (values, timestamps, statuses) tuples
+    def makePulses(self, first, last):
+        count = max(last - first, 0)
+        energy = self.powerWatts * self.pulseOnMsec / 1000
+        values = energy * (1 + self._random.normal(0, self.noisePercent / 100, count))
+        timestamps = np.arange(first, last) * (1000.0 / self.pulseRateHz)
+        return tuple(values.tolist()), tuple(timestamps.tolist()), (0,) * count
+
+
+## Stand-in for the DataRay GetDataCtrl ActiveX control (the ctrl of the wx.lib.activex.ActiveXCtrl CameraDriver gets)
+## Implements the calls CameraDriver makes. Stopping and starting the driver or device takes restartDelaySec, every other call comCallDelaySec,
+## and GetWinCamDataAsVariant returns the frame as the tuple of Python ints the ActiveX control gives, so frame latency can be measured without the camera.
+## Set failStarts to make the next StartDevice calls fail like a disconnected camera.
+## Frames are exposed by triggerFrame (once) or startTrigger (periodic), each fires the DataReady event of the sinks connected with GetEvents
+## and writes its frame number into the first pixel. failReads makes the next reads return half a frame
+class FakeDataRayCOM:
+
+    def __init__(self, width=2048, height=2048, comCallDelaySec=0.002, restartDelaySec=0.5, seed=None) -> None:
+        self.comCallDelaySec = comCallDelaySec
+        self.restartDelaySec = restartDelaySec
+        self.running = False
+        self.failStarts = 0                     ## number of coming StartDevice calls that fail
+        self.failReads = 0                      ## number of coming GetWinCamDataAsVariant calls that return half a frame
+        self.frameNumber = 0                    ## frames exposed by a trigger so far
+        self.calls = {}                         ## method name -> number of calls
+        self.LCMTriggerMode = 0
+        self.AutoShutterOn = True
+        self._fullResolution = 1
+        self._width = width
+        self._height = height
+        self._exposure = 1.0
+        self._gain = 1.0
+        self._frame = tuple(np.random.default_rng(seed).integers(0, 4096, width * height).tolist())
+        self._readyFrame = self._frame
+        self._sinks = []
+        self._lock = threading.Lock()
+        self._triggerStop = threading.Event()
+        self._triggerThread = None
+
+    ## Same call as comtypes.client.GetEvents(source, sink): sink.DataReady() is called for every new frame
+    @staticmethod
+    def GetEvents(source, sink):
+        source._sinks.append(sink)
+        return sink
+
+    ## Exposes a frame readyDelaySec from now (exposure and readout) and fires DataReady
+    def triggerFrame(self, readyDelaySec=0.0):
+        threading.Timer(readyDelaySec, self._frameReady).start()
+
+    ## Exposes a frame every intervalSec until stopTrigger, like the laser pulses of a power level
+    def startTrigger(self, intervalSec):
+        self._triggerStop.clear()
+        def trigger():
+            while not self._triggerStop.wait(intervalSec):
+                self._frameReady()
+        self._triggerThread = threading.Thread(target=trigger, daemon=True)
+        self._triggerThread.start()
+
+    def stopTrigger(self):
+        self._triggerStop.set()
+        if self._triggerThread is not None:
+            self._triggerThread.join()
+
+    def _frameReady(self):
+        with self._lock:
+            self.frameNumber += 1
+            self._readyFrame = (self.frameNumber,) + self._frame[1:]
+        for sink in self._sinks:
+            sink.DataReady()
+
+    def _call(self, name, delaySec=None):
+        self.calls[name] = self.calls.get(name, 0) + 1
+        time.sleep(self.comCallDelaySec if delaySec is None else delaySec)
+
+    def StopDevice(self):
+        self._call("StopDevice", self.restartDelaySec)
+        self.running = False
+        return True
+
+    def StartDriver(self):
+        self._call("StartDriver", self.restartDelaySec)
+        return True
+
+    def ResetCamera(self, camera):
+        self._call("ResetCamera", self.restartDelaySec)
+
+    def SetResolutionAndROI(self, fullResolution, left, top, width, height):
+        self._call("SetResolutionAndROI")
+        self._fullResolution, self._width, self._height = fullResolution, width, height
+        self._frame = self._frame[:width * height] + (0,) * max(width * height - len(self._frame), 0)
+        self._readyFrame = self._frame
+
+    def StartDevice(self):
+        self._call("StartDevice", None if self.running else self.restartDelaySec)
+        if self.failStarts > 0:
+            self.failStarts -= 1
+            self.running = False
+            return False
+        self.running = True
+        return True
+
+    def GetSoftwareVersion(self):
+        self._call("GetSoftwareVersion")
+        return "8.0D92"
+
+    def GetCameraNID(self, camera):
+        self._call("GetCameraNID")
+        return 12345
+
+    def GetTargetCameraExposure(self, camera):
+        self._call("GetTargetCameraExposure")
+        return self._exposure
+
+    def SetTargetCameraExposure(self, camera, exposure):
+        self._call("SetTargetCameraExposure")
+        self._exposure = exposure
+
+    def GetTargetCameraGain(self, camera):
+        self._call("GetTargetCameraGain")
+        return self._gain
+
+    def SetTargetCameraGain(self, camera, gain):
+        self._call("SetTargetCameraGain")
+        self._gain = gain
+
+    def CaptureIsFullResolution(self):
+        self._call("CaptureIsFullResolution")
+        return self._fullResolution
+
+    def GetHorizontalPixels(self):
+        self._call("GetHorizontalPixels")
+        return self._width
+
+    def GetVerticalPixels(self):
+        self._call("GetVerticalPixels")
+        return self._height
+
+    def GetWinCamDataAsVariant(self):
+        self._call("GetWinCamDataAsVariant")
+        with self._lock:
+            frame = self._readyFrame if self.running else ()
+        if self.failReads > 0:
+            self.failReads -= 1
+            return frame[:len(frame) // 2]
+        return frame
@@ -0,0 +1,60 @@
+import itertools
+import numpy as np
+
+try:
+    from comtypes.safearray import safearray_as_ndarray # comtypes comes with wx.lib.activex on Windows, SAFEARRAYs are then read as numpy arrays
+except ImportError:
+    safearray_as_ndarray = None
+
+## Reused uint16 buffers for the DataRay frames
+## GetWinCamDataAsVariant returns the frame as a SAFEARRAY. With comtypes it is read straight into a numpy array and copied once into the buffer,
+## anything else with the buffer protocol is copied the same way, and a tuple of Python ints (the default conversion) is converted in small chunks.
+## Frames alternate between numberOfBuffers buffers (ping-pong). convert writes into the current buffer and keepFrame moves on to the next one,
+## so failed reads and retries reuse the same buffer and a kept frame stays valid until numberOfBuffers - 1 more frames are kept,
+## the previous frame can still be compared with the new one
+class FrameBuffer:
+
+    chunkSize = 65536 ## values converted at a time from a sequence, keeps the temporary arrays small
+
+    def __init__(self, numberOfBuffers=2) -> None:
+        self.numberOfBuffers = numberOfBuffers
+        self._buffers = [np.empty(0, dtype=np.uint16) for buffer in range(numberOfBuffers)]
+        self._next = 0
+        self.bufferFrames = 0   ## frames copied from an array or buffer
+        self.sequenceFrames = 0 ## frames converted from a sequence of ints
+
+    ## Frame data of the DataRay control, as a numpy array when comtypes can read the SAFEARRAY that way
+    @staticmethod
+    def readFrame(ctrl):
+        if safearray_as_ndarray is None:
+            return ctrl.GetWinCamDataAsVariant()
+        with safearray_as_ndarray:
+            return ctrl.GetWinCamDataAsVariant()
+
+    ## Copies the frame data into the current buffer and returns it as a 1D uint16 array, valid until the next convert unless kept
+    def convert(self, rawData):
+        try:
+            source = np.asarray(memoryview(rawData)).reshape(-1)
+        except TypeError: # no buffer protocol, e.g. a tuple
+            source = None
+        count = len(rawData) if source is None else source.size
+        frame = self._nextBuffer(count)
+        if source is not None:
+            np.copyto(frame, source, casting='unsafe')
+            self.bufferFrames += 1
+        else:
+            values = iter(rawData)
+            for start in range(0, count, self.chunkSize):
+                end = min(start + self.chunkSize, count)
+                frame[start:end] = np.fromiter(itertools.islice(values, end - start), dtype=np.uint16, count=end - start)
+            self.sequenceFrames += 1
+        return frame
+
+    ## The last converted frame is handed out, the next convert goes to the next buffer
+    def keepFrame(self):
+        self._next = (self._next + 1) % self.numberOfBuffers
+
+    def _nextBuffer(self, count):
+        if len(self._buffers[self._next]) < count:
+            self._buffers[self._next] = np.empty(count, dtype=np.uint16)
+        return self._buffers[self._next][:count]
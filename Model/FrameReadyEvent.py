@@ -0,0 +1,24 @@
+import threading
+import time
+
+## Counts the DataReady events of the DataRay control and lets a capture wait for the next frame
+## DataReady is the handler comtypes.client.GetEvents calls (on the thread running the wx message loop), waitForFrame blocks any other thread
+class FrameReadyEvent:
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self.count = 0          ## DataReady events so far
+        self.lastTime = None    ## perf_counter of the last DataReady
+
+    def DataReady(self):
+        with self._condition:
+            self.count += 1
+            self.lastTime = time.perf_counter()
+            self._condition.notify_all()
+
+    ## Waits up to timeoutSec for a frame after frame number frameCount, returns the latest frame number or None on timeout
+    def waitForFrame(self, frameCount, timeoutSec):
+        with self._condition:
+            if self._condition.wait_for(lambda: self.count > frameCount, timeoutSec):
+                return self.count
+            return None
@@ -0,0 +1,110 @@
+import json
+import sqlite3
+import zlib
+from contextlib import closing
+from datetime import datetime
+import numpy as np
+
+## Local store of every generated LUT bank, keyed by machine, calibration ID and version
+## One row per calibration with the quadratic coefficients, the uint16 LUT bank, the CRC of every LUT, the LUT status and the pixel map,
+## so any earlier calibration can be uploaded again without regenerating it. Arrays are stored as raw little endian blobs.
+## A calibration saved under an ID that is already stored becomes a new version of it, the earlier banks are kept for a rollback.
+## A connection is opened per call since the store is used from the reaction threads and the post processing process
+class LUTBankStore:
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS calibrations (
+            machineId TEXT NOT NULL,
+            calId INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            factoryId TEXT NOT NULL,
+            createdUtc TEXT NOT NULL,
+            numberOfPixels INTEGER NOT NULL,
+            lutPoints INTEGER NOT NULL,
+            coefficients BLOB NOT NULL,
+            luts BLOB NOT NULL,
+            crcs BLOB NOT NULL,
+            lutStatus TEXT NOT NULL,
+            vfpMap BLOB NOT NULL,
+            PRIMARY KEY (machineId, calId, version)
+        );
+        CREATE INDEX IF NOT EXISTS calibrationsByMachineDate ON calibrations (machineId, createdUtc);
+        CREATE INDEX IF NOT EXISTS calibrationsByDate ON calibrations (createdUtc);
+        """
+    summaryColumns = ["machineId", "calId", "version", "factoryId", "createdUtc", "numberOfPixels"]
+
+    def __init__(self, path) -> None:
+        self.path = path
+        self._execute(self.schema, script=True)
+
+    ## Runs one statement (or script) in its own connection and transaction, returns the fetched rows
+    def _execute(self, query, parameters=(), script=False):
+        with closing(sqlite3.connect(self.path, timeout=10)) as connection, connection:
+            if script:
+                connection.executescript(query)
+                return []
+            return connection.execute(query, parameters).fetchall()
+
+    ## CRC-32 of every LUT, the same checksum convertLUTDataToBinary appends to the binaries
+    @staticmethod
+    def lutCrcs(luts):
+        luts = np.ascontiguousarray(luts, dtype=np.uint16)
+        return np.array([zlib.crc32(lut.tobytes()) for lut in luts], dtype=np.uint32)
+
+    ## Adds a calibration as the next version of its machine and ID (1 for a new ID) and returns that version, stored versions are never replaced
+    def saveCalibration(self, machineId, calId, coefficients, luts, lutStatus, vfpMap, factoryId="", createdUtc=None):
+        luts = np.ascontiguousarray(luts, dtype=np.uint16)
+        createdUtc = datetime.utcnow() if createdUtc is None else createdUtc
+        key = (str(machineId), int(calId))
+        values = (str(factoryId), createdUtc.strftime("%Y-%m-%d %H:%M:%S.%f"), luts.shape[0], luts.shape[1],
+                  np.asarray(coefficients, dtype="<f8").tobytes(), luts.astype("<u2").tobytes(), self.lutCrcs(luts).astype("<u4").tobytes(),
+                  json.dumps([str(status) for status in lutStatus]), np.asarray(vfpMap, dtype="<i4").tobytes())
+        # the version is picked by the INSERT itself so two saves of the same ID can't get the same one
+        with closing(sqlite3.connect(self.path, timeout=10)) as connection, connection:
+            rowId = connection.execute("INSERT INTO calibrations SELECT ?, ?, COALESCE(MAX(version), 0) + 1, ?, ?, ?, ?, ?, ?, ?, ?, ? FROM calibrations WHERE machineId = ? AND calId = ?",
+                                       key + values + key).lastrowid
+            return connection.execute("SELECT version FROM calibrations WHERE rowid = ?", (rowId,)).fetchone()[0]
+
+    ## Calibration of a machine as a dict (calId, version, machineId, factoryId, createdUtc, coefficients, luts, crcs, lutStatus, vfpMap), None if it isn't stored
+    ## The newest version of the ID unless a version is given. Raises ValueError if a stored LUT doesn't match its CRC
+    def loadCalibration(self, machineId, calId, version=None):
+        if version is None:
+            rows = self._execute("SELECT * FROM calibrations WHERE machineId = ? AND calId = ? ORDER BY version DESC LIMIT 1", (str(machineId), int(calId)))
+        else:
+            rows = self._execute("SELECT * FROM calibrations WHERE machineId = ? AND calId = ? AND version = ?", (str(machineId), int(calId), int(version)))
+        return self._calibrationFromRow(rows[0]) if rows else None
+
+    ## Most recently stored calibration of a machine, None if there is none
+    def latestCalibration(self, machineId):
+        rows = self._execute("SELECT * FROM calibrations WHERE machineId = ? ORDER BY createdUtc DESC LIMIT 1", (str(machineId),))
+        return self._calibrationFromRow(rows[0]) if rows else None
+
+    ## Summaries (summaryColumns, no arrays) of the stored calibrations, newest first
+    ## Filtered by machine and by creation date (datetime, inclusive) when given
+    def calibrations(self, machineId=None, since=None, until=None):
+        conditions, parameters = [], []
+        if machineId is not None:
+            conditions.append("machineId = ?")
+            parameters.append(str(machineId))
+        if since is not None:
+            conditions.append("createdUtc >= ?")
+            parameters.append(since.strftime("%Y-%m-%d %H:%M:%S.%f"))
+        if until is not None:
+            conditions.append("createdUtc <= ?")
+            parameters.append(until.strftime("%Y-%m-%d %H:%M:%S.%f"))
+        query = "SELECT " + ", ".join(self.summaryColumns) + " FROM calibrations"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        rows = self._execute(query + " ORDER BY createdUtc DESC", parameters)
+        return [dict(zip(self.summaryColumns, row)) for row in rows]
+
+    def _calibrationFromRow(self, row):
+        machineId, calId, version, factoryId, createdUtc, numberOfPixels, lutPoints, coefficients, luts, crcs, lutStatus, vfpMap = row
+        luts = np.frombuffer(luts, dtype="<u2").reshape(numberOfPixels, lutPoints).astype(np.uint16)
+        crcs = np.frombuffer(crcs, dtype="<u4").astype(np.uint32)
+        if not np.array_equal(self.lutCrcs(luts), crcs):
+            raise ValueError("LUT bank " + str(calId).zfill(5) + " version " + str(version) + " of machine " + machineId + " is corrupt, CRC mismatch")
+        return {"calId": calId, "version": version, "machineId": machineId, "factoryId": factoryId, "createdUtc": datetime.strptime(createdUtc, "%Y-%m-%d %H:%M:%S.%f"),
+                "coefficients": np.frombuffer(coefficients, dtype="<f8").reshape(numberOfPixels, 3).astype(float),
+                "luts": luts, "crcs": crcs, "lutStatus": json.loads(lutStatus),
+                "vfpMap": np.frombuffer(vfpMap, dtype="<i4").reshape(numberOfPixels, 4).astype(int)}
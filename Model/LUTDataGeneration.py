@@ -9,7 +9,10 @@ from io import BytesIO
 from ConfigFiles.MachineSettings import MachineSettings
 import os
 from Model.FTP_Manager import FTP_Manager
+from Model.LUTBankStore import LUTBankStore
 from Model.LaserSettings import LaserSettings
+from Model.PulseStatistics import computePulseLevelStatistics
+from Model.QuadraticFit import fitQuadratics
 from io import BytesIO
 import numpy as np
 import os
@@ -17,10 +20,13 @@ import pandas as pd
 from datetime import datetime
 
 class LUTDataManager():
+
+    powerPercent = np.linspace(0,1,256) #LUT input points from 0 to 1 in 256 (8 bit) increments
+    failedLutStatuses = ["Power Tolerance Failure", "Power Called Failure"] #LUT statuses retested by a recalibration
     
     def __init__(self, testSettings:TestSettings) -> None:
         self.testSettings = testSettings
-        self.linearLut =np.round(np.linspace(0,1,256) * MachineSettings._16BitAnalogMaxPower,0) #convert to 65535 scale and apply threshold
+        self.linearLut =np.round(self.powerPercent * MachineSettings._16BitAnalogMaxPower,0) #convert to 65535 scale and apply threshold
         self.linearLut[self.linearLut>np.round(MachineSettings._16BitAnalogMaxPower * self.testSettings._powerModifiedLimit)] = np.round(MachineSettings._16BitAnalogMaxPower * self.testSettings._powerModifiedLimit,0)
         self.powerLuts = None
         self.lutStatus = []
@@ -28,12 +34,87 @@ class LUTDataManager():
         self.rawLaserData = None
         self.results_coeff = None
         self.results_lut = None
+        self.fitResiduals = None ## per pixel sum of squared residuals of the last LUT fit, NaN for pixels that were not fitted
+        self.fitConditionNumbers = None ## per pixel condition number of the last LUT fit, NaN for pixels that were not fitted
+        self.pixelFits = None ## per pixel fits made while the test runs, see startPixelFits
+        self.lutBank = None ## calibration ID, coefficients, LUTs, LUT status and pixel map of powerLuts and binaries, the base of a recalibration
         if not os.path.exists('tmp'):
                 os.makedirs('tmp', 0o700)
+        self.lutBankStore = LUTBankStore(MachineSettings._lutBankStorePath) ## every generated LUT bank of the machine by calibration ID
 
     def changeTestSettings(self, testSettings):
         self.testSettings = testSettings
 
+    ## Prepares the per pixel fits of a new test, fitPixel then fits every pixel as soon as it is processed
+    ## pixelFits holds the coefficients, residuals, condition numbers and the level averages each fit was made from (NaN where not fitted)
+    def startPixelFits(self, numberOfPixels):
+        self.pixelFits = {
+            "coefficients": np.full((numberOfPixels, 3), np.nan),
+            "residuals": np.full(numberOfPixels, np.nan),
+            "conditionNumbers": np.full(numberOfPixels, np.nan),
+            "levelAverages": np.full((numberOfPixels, self.testSettings._numPowerLevelSteps), np.nan)
+            }
+
+    ## Quadratic LUT fit of one pixel (0-indexed) from its level averages, same fit as convertLaserDataToLUTData
+    ## Only passed pixels with data at every power level are fitted, returns the coefficients or None
+    def fitPixel(self, pixel, pulseStatistics, testStatus):
+        if self.pixelFits is None or testStatus != 1 or not pulseStatistics.completePixels()[pixel]:
+            return None
+        MaxPower = self.testSettings._availableLaserPowerWatts
+        fit = fitQuadratics(pulseStatistics.mean[[pixel]] / MaxPower, pulseStatistics.commandedPowerLevels / MaxPower)
+        self.pixelFits["coefficients"][pixel] = fit.coefficients[0]
+        self.pixelFits["residuals"][pixel] = fit.residuals[0]
+        self.pixelFits["conditionNumbers"][pixel] = fit.conditionNumbers[0]
+        self.pixelFits["levelAverages"][pixel] = pulseStatistics.mean[pixel]
+        return fit.coefficients[0]
+
+    ## Mask of the pixels whose fit from fitPixel is still valid for the given level averages
+    def _reusablePixelFits(self, pixels, pulseStatistics):
+        if self.pixelFits is None or self.pixelFits["levelAverages"].shape[1] != pulseStatistics.numberOfLevels or len(pixels) == 0 or pixels.max() >= len(self.pixelFits["residuals"]):
+            return np.zeros(len(pixels), dtype=bool)
+        return np.all(self.pixelFits["levelAverages"][pixels] == pulseStatistics.mean[pixels], axis=1)
+
+    ## LUT bank of the last calibration, from this session or else the latest one of the machine in the LUT bank store. None if there is none
+    def loadLutBank(self):
+        if self.lutBank is not None:
+            return self.lutBank
+        return self.lutBankStore.latestCalibration(MachineSettings._machineID)
+
+    ## Stores the LUT bank as a new version of its calibration ID, the banks stored earlier under the same ID stay available
+    def saveLutBank(self):
+        self.lutBank["version"] = self.lutBankStore.saveCalibration(MachineSettings._machineID, self.lutBank["calId"], self.lutBank["coefficients"], self.lutBank["luts"],
+                                                                    self.lutBank["lutStatus"], self.lutBank["vfpMap"], factoryId=MachineSettings._factoryID)
+        if self.lutBank["version"] > 1:
+            print("WARNING: LUT " + str(self.lutBank["calId"]).zfill(5) + " was already in the LUT bank store, stored as version " + str(self.lutBank["version"])
+                  + ", the earlier versions are kept")
+
+    ## Makes a stored calibration of the machine the current LUT bank (LUTs, binaries and status) so it can be uploaded without regenerating it
+    ## Returns the stored bank (the newest version unless a version is given), None if the calibration ID isn't in the store
+    def loadStoredCalibration(self, calID, version=None):
+        lutBank = self.lutBankStore.loadCalibration(MachineSettings._machineID, calID, version)
+        if lutBank is not None:
+            self.lutBank = lutBank
+            self.powerLuts = lutBank["luts"]
+            self.lutStatus = list(lutBank["lutStatus"])
+            # the CRCs were checked against the LUTs when loading
+            self.binaries = [lut.tobytes() + int(crc).to_bytes(4, 'little') for lut, crc in zip(lutBank["luts"], lutBank["crcs"])]
+        return lutBank
+
+    ## Base LUT bank and 0-indexed retest pixels of a recalibration: the failed pixels of the last calibration and the pixels of pixelList (1-indexed,
+    ## entries outside the pixel map are ignored). Without a last calibration of the same pixel map the base is None and every pixel is retested
+    def recalibrationPixels(self, vfpMap, pixelList):
+        numberOfPixels = len(vfpMap)
+        lutBank = self.loadLutBank()
+        if lutBank is None or not np.array_equal(lutBank["vfpMap"], vfpMap):
+            return None, list(range(numberOfPixels))
+        selectedPixels = [pixel - 1 for pixel in pixelList if 1 <= pixel <= numberOfPixels]
+        return lutBank, sorted(set(self.failedPixels(lutBank).tolist()) | set(selectedPixels))
+
+    ## 0-indexed pixels of a LUT bank with a failed LUT status
+    def failedPixels(self, lutBank=None):
+        lutBank = self.lutBank if lutBank is None else lutBank
+        return np.flatnonzero(np.isin(np.array(lutBank["lutStatus"], dtype=object), self.failedLutStatuses))
+
     def convertLUTDataToBinary(self, lutData):
         bites=lutData.tobytes()
         crccode=zlib.crc32(bites)
@@ -43,29 +124,36 @@ class LUTDataManager():
         return binaryLUT
 
     def scaledLUTfromCoeff(self, coefficients, pixel):
-        #inialize an array with values of 0 to 256 (8bits) with increments of 1
-        powerperct=np.linspace(0,1,256)
+        #single pixel version of scaledLUTBankFromCoeff, updates the LUT status of the pixel
+        lutScaledData, powerScaled, powerCalledFailure = self.scaledLUTBankFromCoeff([coefficients])
+        if powerScaled[0]:
+            self.lutStatus[pixel] = ("Power Scaled")
+        if powerCalledFailure[0]:
+            self.lutStatus[pixel] = ("Power Called Failure") 
+        return lutScaledData[0]
+
+    def scaledLUTBankFromCoeff(self, coefficients):
+        #coefficients has one row of quadratic coefficients per pixel; Shape = [Pixels x 3]
+        coefficients = np.asarray(coefficients, dtype=float).reshape(-1, 3)
+        powerperct = self.powerPercent
         #convert the power modified limit into a 16 bit number for the output scaling 
         powerModifiedLimit16Bit = int(MachineSettings._16BitAnalogMaxPower  * self.testSettings._powerModifiedLimit) - 1
-        #adjust the linear values with the calculated best fit coefficients for that pixel
-        adjpower=coefficients[0]*powerperct*powerperct+coefficients[1]*powerperct+coefficients[2]
-        scaledpower=np.round_(adjpower*MachineSettings._16BitAnalogMaxPower,0) #scale all values to 0-65535 scale for VFLCR
+        #adjust the linear values with the calculated best fit coefficients of every pixel; Shape = [Pixels x 256]
+        adjpower=coefficients[:, [0]]*powerperct*powerperct+coefficients[:, [1]]*powerperct+coefficients[:, [2]]
+        scaledpower=np.round(adjpower*MachineSettings._16BitAnalogMaxPower,0) #scale all values to 0-65535 scale for VFLCR
         scaledpower[scaledpower > powerModifiedLimit16Bit] = powerModifiedLimit16Bit #apply upper threshold
         scaledpower[scaledpower < 0] = 0 # apply lower threshold
         scaledpower = scaledpower.astype(np.uint16)
-        if powerModifiedLimit16Bit in scaledpower:
-            powerCalledIndex = list(scaledpower).index(powerModifiedLimit16Bit)
-        else:
-            powerCalledIndex = len(scaledpower)
+        #first index of each LUT that reaches the power modified limit, the LUT length if it is never reached
+        reachesLimit = scaledpower == powerModifiedLimit16Bit
+        powerCalledIndex = np.where(reachesLimit.any(axis=1), reachesLimit.argmax(axis=1), scaledpower.shape[1])
         powerCalledThresholdIndex = int(np.round(self.testSettings._powerCalledLimit*255,0))
-        lutScaledData = scaledpower
-        if coefficients[1] != 1:
-            self.lutStatus[pixel] = ("Power Scaled")
-        if powerCalledIndex < powerCalledThresholdIndex:
-            self.lutStatus[pixel] = ("Power Called Failure") 
-        return lutScaledData
+        powerScaled = coefficients[:, 1] != 1
+        powerCalledFailure = powerCalledIndex < powerCalledThresholdIndex
+        return scaledpower, powerScaled, powerCalledFailure
         
-    def convertLaserDataToLUTData(self, laserCalibrationData, commandedPowerData, lasertestStatus, calID, laserSettings: LaserSettings, saveLocation=None,saveLocationNetwork=None,time=None):
+    ## With a baseLutBank (recalibration) only the retestPixels (0-indexed) get new fits, the other pixels keep the coefficients and status of the base bank
+    def convertLaserDataToLUTData(self, laserCalibrationData, commandedPowerData, lasertestStatus, calID, laserSettings: LaserSettings, saveLocation=None,saveLocationNetwork=None,time=None, pulseStatistics=None, baseLutBank=None, retestPixels=None):
         #Get current time for the purpose of file naming and database tags
         time=datetime.now()
         #Convert the test settings into distinct power levels in WATTS to be able to split the raw data up and compare the values 
@@ -79,38 +167,69 @@ class LUTDataManager():
         CFMatrix=np.asarray([linearCoefficients for pixel in range(laserSettings.numberOfPixels)], dtype=float)
         #initialize a default array of statuses with the default as untested and overwrite the index with the test status when the pixel is processed 
         self.lutStatus = ["Untested" for pixel in range(laserSettings.numberOfPixels)]
-        #Coefficient calculation for loop
-        #Loop through the laser data for each pixel splitting the data by its power levels and average value per power level. 
-        #Using the average value for each power level, make a quadratic best fit
-        for pixelNum, pixelrawdata in enumerate(laserCalibrationData):
-            if(lasertestStatus[pixelNum] == 1):   
-                pulseChangeIndexes = [pwrIdx + 1 for pwrIdx, powerDiff in enumerate(np.diff(commandedPowerData[pixelNum])) if powerDiff > 0]
-                pulseChangeIndexes.insert(0,0)
-                pulseChangeIndexes.append(len(pixelrawdata) + 1)
-                pulseSplitData = [pixelrawdata[pulseChangeIndexes[idx]:pulseChangeIndexes[idx+1]] for idx in range(len(pulseChangeIndexes)-1)]
-                if [] not in pulseSplitData:
-                    pulseAverages = [np.mean(pulses)/MaxPower for pulses in pulseSplitData]
-                    #quadratic solve for the needed coefficients
-                    ce=np.polyfit(pulseAverages,commandedPowerLevels/MaxPower,2)
-                    #store the coefficients in the appropriate matrix and row
-                    CFMatrix[pixelNum][0] = float(ce[0])
-                    CFMatrix[pixelNum][1] = float(ce[1])
-                    CFMatrix[pixelNum][2] = float(ce[2])
-            elif(lasertestStatus[pixelNum] == 5):
+        #Split the laser data of every pixel by its power levels and average value per power level (reuse the statistics of the results if they were already computed)
+        if pulseStatistics is None:
+            pulseStatistics = computePulseLevelStatistics(laserCalibrationData, commandedPowerData, commandedPowerLevels)
+        #Quadratic best fit of the average value for each power level
+        #pixels already fitted by fitPixel from the same averages keep their fit, the remaining valid pixels are solved at once
+        fitPixels = np.flatnonzero((np.asarray(lasertestStatus[:laserSettings.numberOfPixels]) == 1) & pulseStatistics.completePixels())
+        reusable = self._reusablePixelFits(fitPixels, pulseStatistics)
+        fittedPixels, refitPixels = fitPixels[reusable], fitPixels[~reusable]
+        fit = fitQuadratics(pulseStatistics.mean[refitPixels] / MaxPower, commandedPowerLevels / MaxPower)
+        #store the coefficients in the appropriate matrix rows
+        self.fitResiduals = np.full(laserSettings.numberOfPixels, np.nan)
+        self.fitConditionNumbers = np.full(laserSettings.numberOfPixels, np.nan)
+        if len(fittedPixels) > 0:
+            CFMatrix[fittedPixels] = self.pixelFits["coefficients"][fittedPixels]
+            self.fitResiduals[fittedPixels] = self.pixelFits["residuals"][fittedPixels]
+            self.fitConditionNumbers[fittedPixels] = self.pixelFits["conditionNumbers"][fittedPixels]
+        CFMatrix[refitPixels] = fit.coefficients
+        self.fitResiduals[refitPixels] = fit.residuals
+        self.fitConditionNumbers[refitPixels] = fit.conditionNumbers
+        for pixelNum in range(laserSettings.numberOfPixels):
+            if(lasertestStatus[pixelNum] == 5):
                 self.lutStatus[pixelNum] = "Untested"
-            else:
+            elif(lasertestStatus[pixelNum] != 1):
                 self.lutStatus[pixelNum] = "Power Tolerance Failure"
-        #Generate LUT Power data for each laser for each rack into a single numpy array (Shape = (7,21,256) for rack, laser, power data point)
-        luts = np.asarray([self.scaledLUTfromCoeff(CFMatrix[pixel], pixel) for pixel in range(laserSettings.numberOfPixels)], dtype = np.uint16)
+        #Merge the retested pixels into the base LUT bank of a recalibration
+        keptPixels = np.zeros(laserSettings.numberOfPixels, dtype=bool)
+        if baseLutBank is not None:
+            keptPixels[:] = True
+            keptPixels[np.asarray(retestPixels, dtype=int)] = False
+            CFMatrix[keptPixels] = np.asarray(baseLutBank["coefficients"], dtype=float)[keptPixels]
+            self.fitResiduals[keptPixels] = np.nan
+            self.fitConditionNumbers[keptPixels] = np.nan
+        #Generate LUT Power data for each laser for each rack into a single numpy array (Shape = (Pixels, 256) for pixel, power data point)
+        luts, powerScaled, powerCalledFailure = self.scaledLUTBankFromCoeff(CFMatrix)
+        lutStatus = np.array(self.lutStatus, dtype=object)
+        lutStatus[powerScaled] = "Power Scaled"
+        lutStatus[powerCalledFailure] = "Power Called Failure"
+        if baseLutBank is not None:
+            # the kept pixels keep their stored LUTs as they are, even if the LUT settings changed since the base calibration
+            luts[keptPixels] = np.asarray(baseLutBank["luts"])[keptPixels]
+            lutStatus[keptPixels] = np.array(baseLutBank["lutStatus"], dtype=object)[keptPixels]
+        self.lutStatus = lutStatus.tolist()
         self.powerLuts = luts
-        results_coeff = []
-        results_lut = []
-        for pixelNum in range(laserSettings.numberOfPixels):
-            pixel, enable, rack, laser = laserSettings.vfpMap[pixelNum]
-            results_coeff.append([pixel, rack, laser, CFMatrix[pixelNum][0], CFMatrix[pixelNum][1], CFMatrix[pixelNum][2]])
-            for dataPoint in range(0,256):
-                results_lut.append([time.strftime("%Y-%m-%d,%H:%M:%S"), MachineSettings._machineID, MachineSettings._factoryID, pixel, rack, laser, self.lutStatus[pixelNum], CFMatrix[pixelNum][0], CFMatrix[pixelNum][1], CFMatrix[pixelNum][2], dataPoint, np.int32(luts[pixelNum][dataPoint])])
-                #make this a single dataframe
+        vfpMap = np.asarray(laserSettings.vfpMap[:laserSettings.numberOfPixels])
+        self.lutBank = {"calId": int(calID), "coefficients": CFMatrix.copy(), "luts": luts, "lutStatus": list(self.lutStatus), "vfpMap": vfpMap}
+        self.saveLutBank()
+        pixels, racks, lasers = vfpMap[:, 0], vfpMap[:, 2], vfpMap[:, 3]
+        results_coeff = {"Pixel": pixels, "Rack": racks, "Laser": lasers, "a": CFMatrix[:, 0], "b": CFMatrix[:, 1], "c": CFMatrix[:, 2]}
+        lutPoints = luts.shape[1]
+        results_lut = {
+            "DateTime": time.strftime("%Y-%m-%d,%H:%M:%S"),
+            "Machine ID": MachineSettings._machineID,
+            "Factory ID": MachineSettings._factoryID,
+            "Pixel": np.repeat(pixels, lutPoints),
+            "Rack": np.repeat(racks, lutPoints),
+            "Laser": np.repeat(lasers, lutPoints),
+            "Status": np.repeat(np.array(self.lutStatus, dtype=object), lutPoints),
+            "a": np.repeat(CFMatrix[:, 0], lutPoints),
+            "b": np.repeat(CFMatrix[:, 1], lutPoints),
+            "c": np.repeat(CFMatrix[:, 2], lutPoints),
+            "BitNumber": np.tile(np.arange(lutPoints), len(luts)),
+            "BitPower": luts.astype(np.int32).ravel()
+            }
         self.results_coeff = pd.DataFrame(results_coeff, columns=["Pixel", "Rack", "Laser", "a", "b", "c"]) # add printer name, calibration, timestamp only this, power modified limit (round to 2), max power for each laser, bitpower and bitnumber
         self.results_lut = pd.DataFrame(results_lut, columns=["DateTime", "Machine ID", "Factory ID", "Pixel", "Rack", "Laser", "Status", "a", "b", "c", "BitNumber", "BitPower"]) 
         self.results_coeff.to_csv("tmp\\LUT_Coeff.csv", index=False)
@@ -174,7 +293,7 @@ class LUTDataManager():
 
     def uploadLinearLuts(self, laserSettings: LaserSettings):
         powerModifiedLimit16Bit = MachineSettings._16BitAnalogMaxPower  * self.testSettings._powerModifiedLimit
-        powerperct=np.linspace(0,1,256)
+        powerperct=self.powerPercent
         lineardata=np.round(powerperct * MachineSettings._16BitAnalogMaxPower,0) #convert to 65535 scale and apply threshold
         lineardata[lineardata>np.round(powerModifiedLimit16Bit)] = np.round(powerModifiedLimit16Bit,0)
         luts = np.asarray([lineardata for pixel in range(laserSettings.numberOfPixels)], dtype = np.uint16)
@@ -1,10 +1,11 @@
 import os
 import csv
 import time
+import threading
 import numpy as np
-import statistics as stat
 import pandas as pd
 from enum import Enum
+from functools import partial
 from datetime import datetime
 from minio import Minio
 from minio.error import S3Error
@@ -12,13 +13,21 @@ import urllib3
 import urllib3.exceptions
 from opcua import Client
 from ConfigFiles.MachineSettings import MachineSettings
-from Model.BNRopcuaTag import BNRopcuaTag
+from Model.BNRopcuaTag import BNRopcuaTag, BNRopcuaSubscription, BNRopcuaTagDict
+from Model.ReactionDispatcher import ReactionDispatcher
 from Model.LUTDataGeneration import LUTDataManager
+from Model.PulseStatistics import LevelConfidenceTracker, RunningPulseStatistics, evaluatePulseCapture, powerLevelIndex
+from Model.SampleStore import PyrometerSampleStore
+from Model import PostProcessing
+from Model.PostProcessing import PostProcessingJob, PostProcessingWorker, runPostProcessing
 from ConfigFiles.TestSettings import TestSettings
 from Model.Logger import Logger
 from Model.FTP_Manager import FTP_Manager
 from Model.CameraDriver import CameraDriver
 from Model.OphirCom import OphirJunoCOM
+from Model.PyroAcquisition import PyroAcquisitionWorker
+from Model.StreamSegmenter import StreamTimeline, closeLevelWindow, timelineStatistics
+from Model.DeviceSimulators import FakeOphirCOM
 from Model.LaserSettings import LaserSettings
 from Model.metadatawriter import MetadataFileWriter
 import zaber.serial
@@ -48,13 +57,15 @@ class TestType(Enum):
         DIRTY_POWER_VERIFICATION = 2
         LOW_POWER_CHECK = 3
         SOMS_TEST = 4
+        RECALIBRATION = 5
 
 ## Default tolerance percentages for each test type
 testTolerancePercents = {
         TestType.CALIBRATION: 30,
         TestType.CLEAN_POWER_VERIFICATION: 5,
         TestType.DIRTY_POWER_VERIFICATION: 5,
-        TestType.LOW_POWER_CHECK: 10
+        TestType.LOW_POWER_CHECK: 10,
+        TestType.RECALIBRATION: 30
     }
 
 ## Varaible that when changed calls a list of functions
@@ -80,17 +91,26 @@ class SubscribedVariable:
     def addReaction(self, reaction):
         self.reactions.append(reaction)
 
+## Entry of the PLC command table: what runs when the command is set and which tags answer it
+class PlcCommand:
+    def __init__(self, handler, responses, errors, logMessage) -> None:
+        self.handler = handler          ## called when the PLC sets the command
+        self.responses = responses      ## plcTags keys of the responses the handler sets
+        self.errors = errors            ## plcTags keys of the errors the handler can set
+        self.logMessage = logMessage    ## logged when the command arrives, None for no log
+
 ## Model tha defined the basis of the backend functionality and comminication with the PLC
 class Model:
 
     def __init__(self, machineSettings, configurationSettings: TestSettings, laserSettings: LaserSettings) -> None:
         self.laserSettings = laserSettings    # object that holds pixel map, number of pixels info
         self.testSettings = configurationSettings ## Current test settings given to the model through the user interface 
-        self.laserTestData = [[] for pixel in range(self.laserSettings.numberOfPixels)] ## Data array that is populated during a test with power measurements and postprocessed for later analysis. This array is consumed after data is saved.
-        self.laserTestEnergy = [[] for pixel in range(self.laserSettings.numberOfPixels)] ##Data array that is populated during a test with energy measurements and postprocessed for later analysis. This array is consumed after data is saved.
+        self.sampleStore = PyrometerSampleStore(self.laserSettings.numberOfPixels) ## Columnar store populated during a test with the measured power, energy and commanded power (W) of every pulse and postprocessed for later analysis.
         self.laserTestStatus = [5 for pixel in range(self.laserSettings.numberOfPixels)] ## Data array that is populated during a test with post test pixel status and postprocessed for later analysis. This array is consumed after data is saved.
-        self.commandedPowerData = [[] for pixel in range(self.laserSettings.numberOfPixels)] ## Data array that is populated during a test with commmanded Power Data(W) and postprocessed for later analysis. This array is consumed after data is saved.
         self.commandedPowerLevels = [] ## Array generated with the power levels derived from processing commanded power data
+        self.pulseStatistics = None ## PulseLevelStatistics of the last processed test, per pixel and power level arrays shared by the results and the LUT generation
+        self.runningStatistics = RunningPulseStatistics(self.laserSettings.numberOfPixels, []) ## Per pixel and power level statistics updated with every capture of the current test
+        self.pixelResults = {} ## active pixel -> results of the pixel (status, level averages, stdevs, deviations, LUT coefficients), available as soon as the pixel is processed
         self.results = None ## Pandas Dataframe with cols: ["Date", "Machine ID", "Factory ID", "Test Type", "Pixel", "Process Acceptance", "Status", "Commanded Power", "Pulse Power Average", "Pulse Power Stdv", "Pulse Power Deviation"]. Processed Results of a test
         self._lutDataManager = LUTDataManager(self.testSettings) ## Helper class to manage the LUT generation logic
         self.logger = Logger() ## Logger to give information to the gui about the current test status
@@ -99,10 +119,34 @@ class Model:
         self.timeStamp = None ## New timestamp is created at the start of each test. Type = datetime.datetime.now()
         #Set initial test type and test mode
         self.TestType = TestType.CALIBRATION
-        self.camera = CameraDriver()
-        self.pyrometer = OphirJunoCOM()
+        self.camera = CameraDriver(persistentSession=machineSettings._cameraPersistentSession, frameTimeoutSec=machineSettings._cameraFrameTimeoutSec)
+        self.pyrometer = OphirJunoCOM(FakeOphirCOM() if machineSettings._simulatePyrometer else None)
         self.pyrometer.connectToJuno()
         print("Juno connection:" + str(self.pyrometer.isConnected))
+        self.pyroAcquisition = None
+        self._reportedPyroOverruns = 0
+        self.pixelCycleTimes = {} ## active pixel -> seconds from the initialize pixel command to the pixel processed response
+        self.streamTimeline = StreamTimeline() ## continuous streaming: device time windows of the captured power levels
+        self.pyroStreamReclaimedSec = {} ## active pixel -> seconds saved against the fixed wait before starting the pyrometer stream, negative when the probe failed
+        self._pixelStartTime = None
+        self.postProcessing = None ## PostProcessingWorker running the end of test processing in a separate process
+        self._postProcessingJobId = None
+        self.adaptiveDecisions = [] ## one entry per power level with adaptive sampling: pixel, power level, pulses, mean, confidence half width, decision, seconds
+        self._levelTracker = None ## LevelConfidenceTracker of the power level being fired
+        self._levelStartTime = None
+        self._levelMultiplicationFactor = None ## pyrometer multiplication factor read when the level started, scales its pulses
+        self._levelCursor = 0
+        self._levelCheckPending = False
+        self._adaptiveSamplingThread = None
+        self.baseLutBank = None ## recalibration: LUT bank of the previous calibration the retested pixels are merged into
+        self.retestPixels = None ## recalibration: 0-indexed pixels the test measures again
+        if machineSettings._postProcessingWorker:
+            self.postProcessing = PostProcessingWorker(self._postProcessingProgress, self._postProcessingResult, self._postProcessingError)
+            self.postProcessing.start()
+        if machineSettings._pyroBackgroundAcquisition:
+            self.pyroAcquisition = PyroAcquisitionWorker(self.pyrometer, pollIntervalSec=machineSettings._pyroPollIntervalSec, maxQueuedChunks=machineSettings._pyroAcquisitionQueueSize)
+            self.pyrometer.attachAcquisitionWorker(self.pyroAcquisition)
+            self.pyroAcquisition.start()
         self.testName = ""
         self.currentPowerLevelIndex = 0 ## power level counter to adjust camera exposure
         self.exposureAt100W = 1 ## 1ms exposure at 100W pulse
@@ -116,6 +160,8 @@ class Model:
         p = wx.Panel(self.frame,wx.ID_ANY) # TODO: is this actually necessary?
         # Get Data
         self.gd = wx.lib.activex.ActiveXCtrl(p, 'DATARAYOCX.GetDataCtrl.1')
+        if machineSettings._cameraFrameEvents:
+            self.camera.connectFrameEvents(self.gd) # the main thread has to pump the events, see CameraDriver.pumpFrameEvents
         # Set some parameters to avoid potential AttributeErrors on failed connection
         self.softwareVersion = ''
         self.cameraNID = 0
@@ -132,10 +178,14 @@ class Model:
             self.client = Client(f'''opc.tcp://127.0.0.1:{machineSettings._portNumber}''', timeout=5)
         else: 
             self.client = Client(f'''opc.tcp://{machineSettings._ipAddress}:{machineSettings._portNumber}''', timeout=5)
+        # tag reactions run on a fixed worker pool, changes of the same tag (or key) are handled in order
+        self.reactionDispatcher = ReactionDispatcher(machineSettings._reactionWorkers, machineSettings._reactionQueueSize)
+        # one subscription per monitoring tier (MachineSettings._opcuaTiers), fast for the command handshakes and slow for telemetry
+        self.plcSubscriptions = {tier: BNRopcuaSubscription(self.client, settings["publishingInterval"], self.reactionDispatcher) for tier, settings in machineSettings._opcuaTiers.items()}
 
         # plcTags is a dictionary allowing the user to access the plc tags by string and perform a single action on all of them in a loop
-        # new tags can be added without changing the model code
-        self.plcTags = {
+        # new tags can be added without changing the model code, several tags can be written in one request with setPlcValues
+        self.plcTags = BNRopcuaTagDict(self.client, {
 
         # App version
         "AppMajorVersion":BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_FromGen3CalibApp.AppMajorVersion"),
@@ -168,6 +218,7 @@ class Model:
         "CaptureFrameInstance": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_ToGen3CalibApp.CaptureFrameInstance"),
         "FrameCaptureInstanceResponse": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_FromGen3CalibApp.FrameCaptureInstanceResponse"),
         "PixelCaptured": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_FromGen3CalibApp.PixelCaptured"),
+        "LevelSampleComplete": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_FromGen3CalibApp.LevelSampleComplete"),
         "pulseOnMsec": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_ToGen3CalibApp.LaserParameters.pulseOnTime_ms"),
         "numPulsesPerLevel":BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_ToGen3CalibApp.LaserParameters.numPulsesPerLevel"),
         "startingPowerLevel":BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_ToGen3CalibApp.LaserParameters.startingPowerLevel"),
@@ -183,6 +234,7 @@ class Model:
         # process calibration
         "ProcessCalibration": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_ToGen3CalibApp.ProcessCalibration"),
         "CalibrationProcessed": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_FromGen3CalibApp.CalibrationProcessed"),
+        "PostProcessingProgress": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_FromGen3CalibApp.PostProcessingProgress"),
 
         # pixel iteration
         "ActivePixel":BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_ToGen3CalibApp.ActivePixel"),
@@ -196,6 +248,8 @@ class Model:
         "UploadCalibratedLUTs": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_ToGen3CalibApp.UploadCalibratedLUTs"),
         "LUTsUploaded": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_FromGen3CalibApp.LUTsUploaded"),
         "CurrentLUTID": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_ToGen3CalibApp.CurrentLUTID"),
+        "GeneratedLUTID": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_FromGen3CalibApp.GeneratedLUTID"),
+        "RetestPixelMask": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_FromGen3CalibApp.RetestPixelMask"),
 
         # Process test data
         "UploadTestData": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_ToGen3CalibApp.UploadTestData"),
@@ -243,7 +297,7 @@ class Model:
         "PyroMultiplicationFactor": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_ToGen3CalibApp.PyroMultiplicationFactor"),
         "ComPortNumber": BNRopcuaTag(self.client, "ns=6;s=::AsGlobalPV:gOpcData_ToGen3CalibApp.ComPortNumber")
 
-        }
+        })
 
         # definition of all the plc tags as a variable bound to the dictionary element
         # this is redundant to the dictionary but give the option to use dot operators to access the tags rather than strings
@@ -266,6 +320,7 @@ class Model:
         self.pixelInitializedTag = self.plcTags["PixelInitialized"]
         
         self.pixelCapturedTag = self.plcTags["PixelCaptured"]
+        self.levelSampleCompleteTag = self.plcTags["LevelSampleComplete"] # adaptive sampling: the current power level has enough pulses
         self.pulseOnMsecTag = self.plcTags["pulseOnMsec"]
         self.numPulsesPerLevelTag = self.plcTags["numPulsesPerLevel"]
         self.startingPowerLevelTag = self.plcTags["startingPowerLevel"]
@@ -278,6 +333,7 @@ class Model:
         self.pixelResultTag = self.plcTags["PixelResult"]
 
         self.calibrationProcessedTag = self.plcTags["CalibrationProcessed"]
+        self.postProcessingProgressTag = self.plcTags["PostProcessingProgress"] # percent done of the end of test processing
 
         self.activePixelTag = self.plcTags["ActivePixel"]  # 1-indexed pixel that is currently being used
         self.vfpMapTag = self.plcTags["VFPMap"] 
@@ -287,6 +343,8 @@ class Model:
         self.UploadLinearLUTsTag = self.plcTags["UploadLinearLUTs"]
         self.UploadCalibratedLUTsTag = self.plcTags["UploadCalibratedLUTs"]
         self.LUTsUploadedTag = self.plcTags["LUTsUploaded"]
+        self.generatedLUTIDTag = self.plcTags["GeneratedLUTID"] # calibration ID of the LUT set a recalibration generates, the PLC sets CurrentLUTID to it to upload them
+        self.retestPixelMaskTag = self.plcTags["RetestPixelMask"] # 1 for the pixels (in VFPMap order) a recalibration measures
         
         self.testDataUploadedTag = self.plcTags["TestDataUploaded"]
         self.testResultsDownloadedTag = self.plcTags["TestResultsDownloaded"]
@@ -342,6 +400,20 @@ class Model:
 
         self.PyroMultiplicationFactorTag = self.plcTags["PyroMultiplicationFactor"]
         self.comPortNumberTag = self.plcTags["ComPortNumber"]
+
+        # Every tag reaction except the heartbeat runs on one serial queue on purpose: the commands and the power level reaction share
+        # laserTestData, the sample store and the response tags, and a parameter tag written by the PLC just before a command must be
+        # updated before that command reads it. So the commands are serialized globally, only the heartbeat runs beside them, and
+        # the dispatcher needs no more than the two workers of MachineSettings._reactionWorkers
+        for tag in self.plcTags.values():
+            tag.reactionKey = "command"
+        self.heartBeatOutTag.reactionKey = "heartbeat"
+        self.commands = self._commandRegistry() ## PLC command tag -> PlcCommand
+
+        # tag groups read together with plcTags.readSnapshot, one request per group instead of one per tag
+        self.plcTags.defineGroup("testSettings", ["pulseOnMsec", "numPulsesPerLevel", "startingPowerLevel", "numPowerLevelSteps", "powerLevelIncrement", "TestType", "VFPMap"])
+        self.plcTags.defineGroup("powerCapture", ["ActivePixel", "CurrentPowerWatts", "PyroMultiplicationFactor"])
+        self.plcTags.defineGroup("frameCapture", ["ActivePixel", "GantryXPositionStatus", "GantryYPositionStatus", "pulseOnMsec", "CurrentPowerWatts", "MachineName"])
     
         ### Lookup Tables for Data Outputs #####
         self.testStatusTable = ["In Progress", "Passed", "High Power Failure", "Low Power Failure", "No Power Failure", "Untested", "", "", "", "", "Abort"]
@@ -355,9 +427,11 @@ class Model:
     def connectToPlc(self):
         try:
             self.client.connect()
-            self.AppMajorVersionTag.setPlcValue(self.applicationMajorVersion)
-            self.AppMinorVersionTag.setPlcValue(self.applicationMinorVersion)
-            self.AppPatchVersionTag.setPlcValue(self.applicationPatchVersion) 
+            self.plcTags.setPlcValues({
+                "AppMajorVersion": self.applicationMajorVersion,
+                "AppMinorVersion": self.applicationMinorVersion,
+                "AppPatchVersion": self.applicationPatchVersion
+                })
 
         except:
             print("Could not connect to server")
@@ -366,60 +440,47 @@ class Model:
         try:
             self.logger.addNewLog("Connections made")
 
-            # monitor for change
-            #self.exampleCommandTag._setAsUpdating()
-            self.heartBeatOutTag._setAsUpdating()
-            self.initializeCalibrationTag._setAsUpdating()
-            self.initializePixelTag._setAsUpdating()
-            self.capturePixelTag._setAsUpdating()
-            self.captureFrameTag._setAsUpdating()
-            self.CaptureFrameInstanceTag._setAsUpdating()
-            self.processPixelTag._setAsUpdating()
-            self.processCalibrationTag._setAsUpdating()
-            self.UploadLinearLUTsTag._setAsUpdating()
-            self.UploadCalibratedLUTsTag._setAsUpdating()
-            self.uploadTestDataTag._setAsUpdating()
-            self.downloadTestResultsTag._setAsUpdating()
-            self.parseTestResultsTag._setAsUpdating()
-            self.ZaberRelativePosParTag._setAsUpdating()
-            self.ZaberAbsolutePosParTag._setAsUpdating()
-            self.ZaberHomeTag._setAsUpdating()
-            self.ZaberMoveRelativeTag._setAsUpdating()
-            self.ZaberMoveAbsoluteTag._setAsUpdating()
-            self.ZaberGetHomeStatusTag._setAsUpdating()
-            self.ZaberGetPosFeedbackTag._setAsUpdating()
-            self.GantryXPositionStatusTag._setAsUpdating()
-            self.GantryYPositionStatusTag._setAsUpdating()
-            self.StartOMSTestTag._setAsUpdating()
-            self.OMSTestCompleteTag._setAsUpdating()
-            self.OMSTestAbortedTag._setAsUpdating()
-            self.PyroMultiplicationFactorTag._setAsUpdating()
-            self.comPortNumberTag._setAsUpdating()
+            # monitor for change, the tags of a tier share one subscription and are registered in a single request
+            self._subscribeTags([
+                #self.exampleCommandTag,
+                self.heartBeatOutTag,
+                self.initializeCalibrationTag,
+                self.initializePixelTag,
+                self.capturePixelTag,
+                self.captureFrameTag,
+                self.CaptureFrameInstanceTag,
+                self.processPixelTag,
+                self.processCalibrationTag,
+                self.UploadLinearLUTsTag,
+                self.UploadCalibratedLUTsTag,
+                self.uploadTestDataTag,
+                self.downloadTestResultsTag,
+                self.parseTestResultsTag,
+                self.ZaberRelativePosParTag,
+                self.ZaberAbsolutePosParTag,
+                self.ZaberHomeTag,
+                self.ZaberMoveRelativeTag,
+                self.ZaberMoveAbsoluteTag,
+                self.ZaberGetHomeStatusTag,
+                self.ZaberGetPosFeedbackTag,
+                self.GantryXPositionStatusTag,
+                self.GantryYPositionStatusTag,
+                self.StartOMSTestTag,
+                self.OMSTestCompleteTag,
+                self.OMSTestAbortedTag,
+                self.PyroMultiplicationFactorTag,
+                self.comPortNumberTag,
+                self.currentPowerWattsTag
+                ])
         except:
             print("OPCUA subscription setup failed")
 
         try:
             # attach reaction on change
-            self.exampleCommandTag.attachReaction(self.exampleCommandReaction)
             self.heartBeatOutTag.attachReaction(self.heartBeatReaction)
-            self.initializeCalibrationTag.attachReaction(self.initializeCalibrationReaction)
-            self.initializePixelTag.attachReaction(self.initializePixelReaction)
-            self.capturePixelTag.attachReaction(self.capturePixelReaction)
-            self.captureFrameTag.attachReaction(self.captureFrameReaction)
-            self.processPixelTag.attachReaction(self.processPixelReaction)
-            self.processCalibrationTag.attachReaction(self.processCalibrationReaction)
-            self.UploadLinearLUTsTag.attachReaction(self.uploadLinearLUTsReaction)
-            self.UploadCalibratedLUTsTag.attachReaction(self.uploadCalibratedLUTsReaction)
-            self.uploadTestDataTag.attachReaction(self.uploadTestDataReaction)
-            self.downloadTestResultsTag.attachReaction(self.downloadTestResultsReaction)
-            self.parseTestResultsTag.attachReaction(self.parseTestResultsReaction)
-            self.ZaberHomeTag.attachReaction(self.ZaberHomeReaction)
-            self.ZaberMoveRelativeTag.attachReaction(self.ZaberMoveRelativeReaction)
-            self.ZaberMoveAbsoluteTag.attachReaction(self.ZaberMoveAbsoluteReaction)
-            self.ZaberGetHomeStatusTag.attachReaction(self.ZaberGetHomeStatusReaction)
-            self.ZaberGetPosFeedbackTag.attachReaction(self.ZaberGetPosFeedbackReaction)
-            self.OMSTestCompleteTag.attachReaction(self.OMSTestCompleteReaction)
-            self.OMSTestAbortedTag.attachReaction(self.OMSTestAbortedReaction)
+            self.currentPowerWattsTag.attachReaction(self.powerLevelReaction)
+            for commandName in self.commands:
+                self.plcTags[commandName].attachReaction(partial(self.commandReaction, commandName))
 
         except:
             print("OPCUA reaction setup failed")
@@ -430,6 +491,15 @@ class Model:
             MachineSettings._factoryID = self.FactoryNameTag.value
         MachineSettings._machineID = self.MachineNameTag.value
 
+    ## Subscribes the tags grouped by their MachineSettings._opcuaTagTiers tier with the sampling, queue and deadband settings of the tier
+    def _subscribeTags(self, tags):
+        tagTiers = {id(self.plcTags[name]): tier for name, tier in MachineSettings._opcuaTagTiers.items()}
+        for tier, subscription in self.plcSubscriptions.items():
+            tierTags = [tag for tag in tags if tagTiers.get(id(tag), "command") == tier]
+            if len(tierTags) > 0:
+                settings = MachineSettings._opcuaTiers[tier]
+                subscription.subscribe(tierTags, settings["samplingInterval"], settings["queueSize"], settings["deadband"])
+
     ## Takes care of creating the log file, also goes to printer info drive to give tester info about the test
     def createLogFile(self):
         with open(os.path.join('tmp', 'log.csv'), 'w', newline='') as csvfile:
@@ -465,106 +535,77 @@ class Model:
    
     ## Called at the end of the test. Calls the functions to post-process the data and the save the end of test files
     def endTest(self):
+        self._logTestEnd()
+        self._applyPostProcessingResult(runPostProcessing(self._postProcessingJob(), self._reportPostProcessingProgress))
+
+    def _logTestEnd(self):
         self.logger.addNewLog("Test Ended")
-        self.laserTestData = list([np.trim_zeros(np.array(pixelData)) for pixelData in self.laserTestData])
-        self.commandedPowerData = list([np.trim_zeros(np.array(pixelData)) for pixelData in self.commandedPowerData])
-        self.commandedPowerLevels = [(self.testSettings._startingPowerLevel + self.testSettings._powerLevelIncrement * powerLevel) * 525/255 for powerLevel in range(self.testSettings._numPowerLevelSteps)]
-        self.exportData()
-        self.generateTestResultDataFrame()
-        if self.testType == TestType.CALIBRATION:
-            self.generateLuts()
+        if len(self.pixelCycleTimes) > 0:
+            cycleTimes = list(self.pixelCycleTimes.values())
+            self.logger.addNewLog("Pixel cycle time: mean " + str(round(np.mean(cycleTimes), 3)) + " s, max " + str(round(np.max(cycleTimes), 3)) + " s over " + str(len(cycleTimes)) + " pixels")
+        if len(self.pyroStreamReclaimedSec) > 0:
+            self.logger.addNewLog("Pyrometer stream start: " + str(round(sum(self.pyroStreamReclaimedSec.values()), 1)) + " s reclaimed over "
+                                  + str(len(self.pyroStreamReclaimedSec)) + " pixels")
+        if len(self.adaptiveDecisions) > 0:
+            completeLevels = [decision for decision in self.adaptiveDecisions if decision["decision"] is not None]
+            self.logger.addNewLog("Adaptive sampling: " + str(len(completeLevels)) + " of " + str(len(self.adaptiveDecisions)) + " levels complete early, "
+                                  + str(round(np.mean([decision["pulses"] for decision in self.adaptiveDecisions]), 1)) + " pulses per level on average")
+        self.commandedPowerLevels = self._commandedPowerLevels()
+        self.pulseStatistics = self._pulseStatistics()
+
+    ## Statistics of the test aggregated capture by capture, or with continuous streaming split from the stored pulses by the device time windows of the levels
+    def _pulseStatistics(self):
+        if MachineSettings._pyroContinuousStream and len(self.streamTimeline) > 0 and self.streamTimeline.ordered:
+            return timelineStatistics(self.sampleStore.column("timestamp"), self.sampleStore.column("measuredPower"), self.streamTimeline,
+                                      self.laserSettings.numberOfPixels, self._commandedPowerLevels())
+        return self.runningStatistics.statistics()
+
+    ## Snapshot of the test data and settings for the post processing (Model.PostProcessing)
+    def _postProcessingJob(self):
+        if self.pulseStatistics is None:
+            self.pulseStatistics = self._pulseStatistics()
+        return PostProcessingJob(self.sampleStore.pixelColumns("measuredPower"), self.laserTestStatus, self.pulseStatistics, self._commandedPowerLevels(),
+                                 self.testSettings, self.laserSettings, self.testType, self.timeStamp, self.saveLocation, self.saveLocationNetwork,
+                                 self.testStatusTable, self.testType in (TestType.CALIBRATION, TestType.RECALIBRATION), self._lutDataManager.pixelFits,
+                                 self.baseLutBank, self.retestPixels)
+
+    def _applyPostProcessingResult(self, result):
+        self.results = result.results
+        for name, value in result.lutResults.items():
+            setattr(self._lutDataManager, name, value)
+        self.logger.addNewLog("Post processing took " + str(round(result.durationSec, 3)) + " s")
+
+    def _reportPostProcessingProgress(self, percent, message):
+        self.logger.addNewLog(message + " (" + str(percent) + "%)")
+        try:
+            self.postProcessingProgressTag.setPlcValue(percent)
+        except Exception as e: # progress is only informative, a PLC without the tag must not stop the post processing
+            print("PostProcessingProgress not written: " + str(e))
 
     ## Called by the end of test and abort sequences
     ## Saves the data into a project temporary folder
     def exportData(self):
         self.logger.addNewLog("Exporting data.......")
-        exportData = self.laserTestData.copy()
-        fullRankVal = max([len(pixelData) for pixelData in exportData])
-        exportData = [np.pad(np.array(pixelData), (0, fullRankVal - len(pixelData))) for pixelData in exportData]
-        with open('tmp\LPM_raw.csv', 'w', newline='') as csvfile:
-            rawOutputWriter = csv.writer(csvfile, delimiter=',')
-            for pixelIdx, pixelTested in enumerate(exportData):
-                rawOutputWriter.writerow([pixelIdx + 1] + [self.laserTestStatus[pixelIdx]] + list(pixelTested))
-        
-        with open(os.path.join(self.saveLocation, 'LPM_Raw.csv'), 'w', newline='') as csvfile:
-            rawOutputWriter = csv.writer(csvfile, delimiter=',')
-            for pixelIdx, pixelTested in enumerate(exportData):
-                rawOutputWriter.writerow([pixelIdx + 1] + [self.laserTestStatus[pixelIdx]] + list(pixelTested))
-
-        with open(os.path.join(self.saveLocationNetwork, 'LPM_Raw.csv'), 'w', newline='') as csvfile:
-            rawOutputWriter = csv.writer(csvfile, delimiter=',')
-            for pixelIdx, pixelTested in enumerate(exportData):
-                rawOutputWriter.writerow([pixelIdx + 1] + [self.laserTestStatus[pixelIdx]] + list(pixelTested))
+        PostProcessing.exportRawData(self._postProcessingJob())
         self.logger.addNewLog("Raw data saved to the tmp folder and " + self.saveLocation)
 
-    
-    
-    ## Creating the dataframe for the process team and the database team
-    ## Dataframe headers are ["DateTime", "Factory", "Machine", "TestType", "Pixel", "Rack", "Laser", "Status", "Commanded Power", "Pulse Power Average", "Pulse Power Stdv", "Pulse Power Deviation"]
-    ## saves to local temporary folder which is rewritten every test and the printerinfo drive     
+    ## Creating the dataframe for the process team and the database team, see PostProcessing.generateTestResultDataFrame
     def generateTestResultDataFrame(self):
         self.logger.addNewLog("Created processed data from raw test data......")
-        commandedPowerLevels = [(self.testSettings._startingPowerLevel + self.testSettings._powerLevelIncrement * powerLevel) * 525/255 for powerLevel in range(self.testSettings._numPowerLevelSteps)]
-        pulseSplitData = []
-        for pixelIdx, pixelrawdata in enumerate(self.laserTestData):
-            if len(pixelrawdata) == 0:
-                pulseSplitData.append([])
-            else:
-                pulseChangeIndexes = [pwrIdx + 1 for pwrIdx, powerDiff in enumerate(np.diff(self.commandedPowerData[pixelIdx])) if powerDiff > 0]
-                pulseChangeIndexes.insert(0, 0)
-                pulseChangeIndexes.append(len(pixelrawdata) + 1)
-                pulseSplitData.append([pixelrawdata[pulseChangeIndexes[idx]:pulseChangeIndexes[idx+1]] for idx in range(len(pulseChangeIndexes)-1)])
-        avg_daq_p_data = np.array([[stat.mean(pixelData[levelNum]) if (levelNum < len(pixelData) and len(pixelData[levelNum]) > 0)  else np.NaN for levelNum in range(len(commandedPowerLevels))] for pixelData in pulseSplitData]).round(decimals=3)
-        std_daq_p_data = np.array([[stat.stdev(pixelData[levelNum]) if (levelNum < len(pixelData) and len(pixelData[levelNum]) > 1) else np.NaN for levelNum in range(len(commandedPowerLevels))] for pixelData in pulseSplitData]).round(decimals=3)
-        dev_daq_p_data = np.array([[self.percentDiff(pulseAvgData, commandedPowerLevels[pulseNum]) if (not np.isnan(pulseAvgData)) else np.NaN for pulseNum, pulseAvgData in enumerate(pixelData)] for pixelData in avg_daq_p_data]).round(decimals=3)
-        outputData = []
-        for pixelIdx, data in enumerate(self.laserTestData):         
-            for powerLevelNum, powerLevelData in enumerate(avg_daq_p_data[pixelIdx]):
-                #["DateTime", "Factory", "Machine", "TestType", "Pixel", "Rack", "Laser", "Status", "Commanded Power", "Pulse Power Average", "Pulse Power Stdv", "Pulse Power Deviation"]
-                if self.laserTestStatus[pixelIdx] != 5:
-                    commandedPower = round(commandedPowerLevels[powerLevelNum], 2)
-                else:
-                    commandedPower = np.nan
-                if len(pulseSplitData[pixelIdx]) > powerLevelNum:
-                    numDataPoints = len(pulseSplitData[pixelIdx][powerLevelNum])
-                else:
-                    numDataPoints = 0
-                if pixelIdx < (self.laserSettings.numberOfPixels):
-                    outputData.append([self.timeStamp.strftime("%Y-%m-%d, %H:%M:%S"), MachineSettings._machineID, MachineSettings._factoryID, self.testType, pixelIdx + 1, self.laserSettings.vfpMap[pixelIdx][2], self.laserSettings.vfpMap[pixelIdx][3], dev_daq_p_data[pixelIdx][powerLevelNum] < 5, self.testStatusTable[self.laserTestStatus[pixelIdx]], commandedPower, avg_daq_p_data[pixelIdx][powerLevelNum], std_daq_p_data[pixelIdx][powerLevelNum], dev_daq_p_data[pixelIdx][powerLevelNum], numDataPoints])
-        cols =["Date", "Machine ID", "Factory ID", "Test Type", "Pixel", "Rack", "Laser", "Process Acceptance", "Status", "Commanded Power", "Pulse Power Average", "Pulse Power Stdv", "Pulse Power Deviation", "Data Points"] # add rack and laser printer name, name of test(CVER, DVER....), timestamp  
-        self.results = pd.DataFrame(outputData, columns=cols)
-        self.results.to_csv(os.path.join("tmp", "LPM_processed.csv"), index=False)
-        self.results.to_csv(os.path.join(self.saveLocation, "LPM_processed.csv"), index=False)
-        self.results.to_csv(os.path.join(self.saveLocationNetwork, "LPM_processed.csv"), index=False)
-        validRanges = ["ValidRanges"]
-        validRanges.append(self.getValidPixelRanges())
-        with open(os.path.join(self.saveLocation, 'summary.csv'), 'w', newline='') as summaryFile:
-            writer = csv.writer(summaryFile)
-            writer.writerows(self.getSummary())
-            writer.writerow(validRanges)
+        self.pulseStatistics = self._pulseStatistics()
+        self.results = PostProcessing.generateTestResultDataFrame(self._postProcessingJob())
         return self.results
 
     def getSummary(self):
-        summary = self.results.groupby("Commanded Power", as_index=False)[['Pulse Power Average', "Pulse Power Stdv", "Pulse Power Deviation"]].mean()
-        summary = np.round_(summary.to_numpy(), decimals=3).astype('str')
-        summary = np.insert(summary, 0, ['Commanded Power', 'Total Power Average', 'Total Average Power Stdv', 'Total Average Power Deviation'], axis=0).tolist()
-        return summary
+        return PostProcessing.testSummary(self.results)
     
     def getValidPixelRanges(self):
-        passedPixels = self.results.loc[self.results["Status"] == "Passed"]["Pixel"].to_numpy()
-        validRanges = []
-        startRange = 1
-        for pixel in range(1, self.laserSettings.numberOfPixels+1):
-            if pixel not in passedPixels and startRange is not None:
-                validRanges.append([startRange, pixel-1])
-                startRange = None
-            elif startRange is None and pixel in passedPixels:
-                startRange = pixel
-        return validRanges
+        return PostProcessing.validPixelRanges(self.results, self.laserSettings.numberOfPixels)
 
 
     def generateLuts(self):
-        luts = self._lutDataManager.convertLaserDataToLUTData(self.laserTestData, self.commandedPowerData, self.laserTestStatus, self.testSettings._CalId, self.laserSettings, saveLocation=self.saveLocation, saveLocationNetwork = self.saveLocationNetwork)
+        luts = self._lutDataManager.convertLaserDataToLUTData(self.sampleStore.pixelColumns("measuredPower"), self.sampleStore.pixelColumns("commandedPower"), self.laserTestStatus, self.testSettings._CalId, self.laserSettings, saveLocation=self.saveLocation, saveLocationNetwork = self.saveLocationNetwork, pulseStatistics=self.pulseStatistics,
+                                                              baseLutBank=self.baseLutBank, retestPixels=self.retestPixels)
         bins = self._lutDataManager.convertLUTDataToBinaries(luts)
 
     def uploadLinearLuts(self):
@@ -589,10 +630,11 @@ class Model:
 
     def uploadCalibratedLuts(self, calibrationID:int):
         
+        laserSettings = self._lutBankToUpload(calibrationID)
         self.logger.addNewLog("Writing binaries to folders and printer.......")
         
         binpath = os.path.join(self.saveLocation, "bin")
-        self._lutDataManager.writeBinariesToFolder(calibrationID, self.laserSettings, binPath=binpath)
+        self._lutDataManager.writeBinariesToFolder(calibrationID, laserSettings, binPath=binpath)
         
         # lutExistsStatus = [True for VFLCR in MachineSettings._vflcrIPs]
         # start = now = time.time()
@@ -611,11 +653,31 @@ class Model:
         os.makedirs(binpath, exist_ok=True)
         self.logger.addNewLog("Binaries written to folder complete")
 
-        self._lutDataManager.writeBinaryArraysToVFPLCs(calibrationID, self.laserSettings)
+        self._lutDataManager.writeBinaryArraysToVFPLCs(calibrationID, laserSettings)
         self.logger.addNewLog("Binaries written to printer complete")
 
         self.LUTsUploadedTag.setPlcValue(True)
 
+    ## Loads the LUT bank uploaded under calibrationID and returns the laser settings with its pixel map
+    ## That is the bank generated last unless calibrationID is another calibration in the LUT bank store, whose newest version is then uploaded as stored (rollback)
+    def _lutBankToUpload(self, calibrationID):
+        generatedBank = self._lutDataManager.lutBank
+        if generatedBank is not None and generatedBank["calId"] == calibrationID:
+            return self.laserSettings
+        lutBank = self._lutDataManager.loadStoredCalibration(calibrationID)
+        if lutBank is None:
+            self.logger.addNewLog("LUT " + str(calibrationID).zfill(5) + " is not in the LUT bank store, uploading the last generated LUTs")
+            return self.laserSettings
+        rollback = ("ROLLBACK: uploading stored LUT " + str(calibrationID).zfill(5) + " version " + str(lutBank["version"]) + " generated "
+                    + lutBank["createdUtc"].strftime("%Y-%m-%d %H:%M:%S") + " UTC")
+        if generatedBank is not None:
+            rollback += " instead of the last generated LUT " + str(generatedBank["calId"]).zfill(5)
+        print(rollback)
+        self.logger.addNewLog(rollback)
+        laserSettings = LaserSettings()
+        laserSettings.vfpMap = lutBank["vfpMap"].tolist()
+        return laserSettings
+
     ## Example Command
     def exampleCommand(self):
         camera = CameraDriver()
@@ -631,23 +693,38 @@ class Model:
         self.logger.addNewLog("Starting test")
 
         #TODO: link plc pulse settings to power limits
-        # overwrite test settings from plc values
-        self.testSettings._pulseOnMsec = self.pulseOnMsecTag.value
-        self.testSettings._numPulsesPerLevel = self.numPulsesPerLevelTag.value
-        self.testSettings._startingPowerLevel = self.startingPowerLevelTag.value
-        self.testSettings._numPowerLevelSteps = self.numPowerLevelStepsTag.value
-        self.testSettings._powerLevelIncrement = self.powerLevelIncrementTag.value
+        # overwrite test settings from plc values, read together in one request
+        plcSettings = self.plcTags.readSnapshot("testSettings")
+        self.testSettings._pulseOnMsec = plcSettings.pulseOnMsec
+        self.testSettings._numPulsesPerLevel = plcSettings.numPulsesPerLevel
+        self.testSettings._startingPowerLevel = plcSettings.startingPowerLevel
+        self.testSettings._numPowerLevelSteps = plcSettings.numPowerLevelSteps
+        self.testSettings._powerLevelIncrement = plcSettings.powerLevelIncrement
         self._lutDataManager.changeTestSettings(self.testSettings) 
 
         # read test type
-        self.testType = TestType(self.TestTypeTag.value)
+        self.testType = TestType(plcSettings.TestType)
         self.testSettings._tolerancePercent = testTolerancePercents[self.testType] # this is not used by LUT generation, so setting it after changing LUT test settings is OK
 
         self.timeStamp = datetime.utcnow()
+
+        # Get pixel mapping
+        self.laserSettings.vfpMap = plcSettings.VFPMap
+
+        # calibration ID of the generated LUTs, a recalibration gets a new one
+        self.baseLutBank = None
+        self.retestPixels = None
+        if self.testType == TestType.CALIBRATION:
+            self.testSettings._CalId = self.CurrentLUTIDTag.value
+        elif self.testType == TestType.RECALIBRATION:
+            self._prepareRecalibration()
         
         if MachineSettings._simulation:
             self.saveLocation = os.path.join(".", "tmp", "output")
             self.resultsLocation = os.path.join(".", "tmp", "results")
+            self.saveLocationNetwork = os.path.join(".", "tmp", "network")
+            for location in [self.saveLocation, self.resultsLocation, self.saveLocationNetwork]:
+                os.makedirs(location, exist_ok=True)
         else:
             self.saveLocation = self._createoutputdirectory()
             os.makedirs(self.saveLocation)
@@ -656,28 +733,58 @@ class Model:
             self.saveLocationNetwork = self._createoutputdirectoryNetwork()
             os.makedirs(self.saveLocationNetwork) 
 
-        # Get pixel mapping
-        self.laserSettings.vfpMap = self.vfpMapTag.value
-
         self.createLogFile()
         self.results = None
-        self.laserTestData = [[] for pixel in range(self.laserSettings.numberOfPixels)] ## Data array that is populated during a test with power measurements and postprocessed for later analysis. This array is consumed after data is saved.
-        self.laserTestEnergy = [[] for pixel in range(self.laserSettings.numberOfPixels)] ##Data array that is populated during a test with energy measurements and postprocessed for later analysis. This array is consumed after data is saved.
+        self.pulseStatistics = None
+        expectedPulses = self.laserSettings.numberOfPixels * self.testSettings._numPowerLevelSteps * self.testSettings._numPulsesPerLevel
+        self.sampleStore = PyrometerSampleStore(self.laserSettings.numberOfPixels, initialCapacity=expectedPulses) ## preallocated for the expected number of pulses, grows if the PLC sends more
         self.laserTestStatus = [5 for pixel in range(self.laserSettings.numberOfPixels)] ## Data array that is populated during a test with post test pixel status and postprocessed for later analysis. This array is consumed after data is saved.
-        self.commandedPowerData = [[] for pixel in range(self.laserSettings.numberOfPixels)] ## Data array that is populated during a test with commmanded Power Data(W) and postprocessed for later analysis. This array is consumed after data is saved.
-        self.commandedPowerLevels = [] ## Array generated with the power levels derived from processing commanded power data
+        self.commandedPowerLevels = self._commandedPowerLevels() ## Array generated with the power levels derived from the test settings
+        self.runningStatistics = RunningPulseStatistics(self.laserSettings.numberOfPixels, self.commandedPowerLevels)
+        self._lutDataManager.startPixelFits(self.laserSettings.numberOfPixels)
+        self.pixelResults = {}
+        self.pixelCycleTimes = {}
+        self.pyroStreamReclaimedSec = {}
+        self.streamTimeline.clear()
+        if self.pyrometer.isStreaming: # stream left over from an aborted test, the first pixel starts a new one
+            self.pyrometer.endDataCollection()
+        self._postProcessingJobId = None
+        self.adaptiveDecisions = []
+        self._levelTracker = None
 
       #  if not self.camera.isConnected:
       #  self.camera.initialize()
         
         self.calibrationInitializedTag.setPlcValue(1)
 
+    ## Recalibration: retests the failed pixels of the last LUT bank plus the pixels selected in the test settings (_pixelList, 1-indexed)
+    ## and merges the new fits into that bank under a new calibration ID. Every pixel is retested if there is no bank for this pixel map
+    def _prepareRecalibration(self):
+        numberOfPixels = self.laserSettings.numberOfPixels
+        vfpMap = np.asarray(self.laserSettings.vfpMap[:numberOfPixels])
+        self.baseLutBank, self.retestPixels = self._lutDataManager.recalibrationPixels(vfpMap, self.testSettings._pixelList)
+        if self.baseLutBank is None:
+            self.logger.addNewLog("No LUT bank of a previous calibration with this pixel map, recalibrating every pixel")
+            baseCalId = 0
+        else:
+            baseCalId = self.baseLutBank["calId"]
+        calId = max(baseCalId, self.CurrentLUTIDTag.value) + 1
+        self.testSettings._CalId = calId if calId <= 99999 else 1 # calibration IDs are 5 digits
+        retestMask = [0 for pixel in range(numberOfPixels)]
+        for pixel in self.retestPixels:
+            retestMask[pixel] = 1
+        self.retestPixelMaskTag.setPlcValue(retestMask)
+        self.generatedLUTIDTag.setPlcValue(self.testSettings._CalId)
+        self.logger.addNewLog("Recalibrating pixels " + str([pixel + 1 for pixel in self.retestPixels]) + " of LUT " + str(baseCalId).zfill(5) + " into LUT " + str(self.testSettings._CalId).zfill(5))
+
     def initializePixel(self):
         print("initializePixel()")
+        self._pixelStartTime = time.perf_counter()
 
-        print("Active Pixel: " + str(self.activePixelTag.value))
+        activePixel = self.activePixelTag.value
+        print("Active Pixel: " + str(activePixel))
 
-        if self.activePixelTag.value == 0:
+        if activePixel == 0:
             print("Active pixel is 0 which isn't really a thing so this is going to end up writing the data for this pixel as the last pixel :shrug:")
 
         ## update exposure counter, set starting exposure
@@ -686,15 +793,36 @@ class Model:
 
         if self.pyrometer.isConnected:
             print("pyrometer: connected")
-            print("pyrometer: clearing buffer")
-            self.pyrometer.clearData()
-            print("pyromter: starting streaming")
-            time.sleep(5)
-            self.pyrometer.startDataCollection()
+            if MachineSettings._pyroContinuousStream and self.pyrometer.isStreaming:
+                print("pyrometer: streaming since the previous pixel")
+            else:
+                print("pyrometer: clearing buffer")
+                self.pyrometer.clearData()
+                print("pyromter: starting streaming")
+                self._startPyrometerStream(activePixel)
+            if MachineSettings._pyroContinuousStream:
+                self.streamTimeline.openWindow(self.pyrometer.streamClock.deviceTime(self._pixelStartTime))
             self.pixelInitializedTag.setPlcValue(1)
         else:
             print("pyromter: failed - not connected")
 
+    ## Starts the pyrometer stream of a pixel once the Juno is armed, falls back to the fixed wait when the probe fails
+    def _startPyrometerStream(self, activePixel):
+        fixedDelaySec = MachineSettings._pyroStreamStartDelaySec
+        start = time.perf_counter()
+        if MachineSettings._pyroReadyProbe:
+            if self.pyrometer.startDataCollectionWhenReady(MachineSettings._pyroReadyTimeoutSec):
+                waitSec = time.perf_counter() - start
+                self.pyroStreamReclaimedSec[activePixel] = fixedDelaySec - waitSec
+                logger.info("pixel " + str(activePixel) + ": pyrometer stream armed in " + str(round(waitSec * 1000, 1)) + " ms, "
+                            + str(round(fixedDelaySec - waitSec, 3)) + " s reclaimed")
+                return
+            logger.warning("pixel " + str(activePixel) + ": pyrometer stream not armed after " + str(MachineSettings._pyroReadyTimeoutSec) + " s ("
+                           + str(self.pyrometer.lastStartError) + "), falling back to the fixed " + str(fixedDelaySec) + " s wait")
+        time.sleep(fixedDelaySec)
+        self.pyrometer.startDataCollection()
+        self.pyroStreamReclaimedSec[activePixel] = fixedDelaySec - (time.perf_counter() - start)
+
     def capturePixel(self):
         print("capturePixel()")
 
@@ -732,15 +860,76 @@ class Model:
 
     def processPixel(self):
         print("processPixel()")
-        self.pyrometer.endDataCollection()
-        self.pyrometer.clearData()
-        self.pixelResultTag.setPlcValue(1)  # autopass
-        self.pixelProcessedTag.setPlcValue(1)
+        if not MachineSettings._pyroContinuousStream:
+            self.pyrometer.endDataCollection()
+        self.pyrometer.clearData() # with continuous streaming only the samples after the last capture go, their timestamps are before the next level
+        self.plcTags.setPlcValues({"PixelResult": 1, "PixelProcessed": 1})  # autopass
+        activePixel = self.activePixelTag.value
+        self._updatePixelResults(activePixel)
+        if self._pixelStartTime is not None:
+            # initialize pixel command to pixel processed response, the per pixel cost of all the handshakes of the pixel
+            cycleTime = time.perf_counter() - self._pixelStartTime
+            self.pixelCycleTimes[activePixel] = cycleTime
+            self._pixelStartTime = None
+            self.logger.addNewLog("Pixel " + str(activePixel) + " cycle time: " + str(round(cycleTime, 3)) + " s")
+
+    ## Results of a pixel from the statistics aggregated during its captures, fits its LUT right away so the end of test only assembles them
+    def _updatePixelResults(self, activePixel):
+        pixelIdx = activePixel - 1
+        pulseStats = self.runningStatistics.statistics()
+        status = self.laserTestStatus[pixelIdx]
+        coefficients = self._lutDataManager.fitPixel(pixelIdx, pulseStats, status)
+        self.pixelResults[activePixel] = {
+            "Status": self.testStatusTable[status],
+            "Pulse Power Average": pulseStats.mean[pixelIdx],
+            "Pulse Power Stdv": pulseStats.stdev[pixelIdx],
+            "Pulse Power Deviation": pulseStats.deviation[pixelIdx],
+            "Data Points": pulseStats.count[pixelIdx],
+            "LUT Coefficients": coefficients
+            }
+        self.logger.addNewLog("Pixel " + str(activePixel) + " " + self.testStatusTable[status] + ", max deviation " + str(round(float(np.nanmax(pulseStats.deviation[pixelIdx], initial=0)), 2)) + " %")
 
     def processCalibration(self):
         print("processCalibration()")
+        if MachineSettings._pyroContinuousStream and self.pyrometer.isStreaming:
+            self.pyrometer.endDataCollection()
+            self.logger.addNewLog("Pyrometer streamed continuously over " + str(len(self.streamTimeline)) + " levels, " + str(self.pyrometer.streamStarts) + " stream starts since the connection")
+        if self.postProcessing is not None:
+            self._logTestEnd()
+            try:
+                self._postProcessingJobId = self.postProcessing.submit(self._postProcessingJob())
+                return # CalibrationProcessed is set once the worker process sends the result
+            except Exception as e:
+                self.logger.addNewLog("Post processing worker unavailable, processing in the app: " + str(e))
         self.endTest()
         self.calibrationProcessedTag.setPlcValue(1)
+
+    ## PostProcessingWorker callbacks, run on its listener thread. Results are applied in the command queue so they can't interleave with a command
+    def _postProcessingProgress(self, jobId, percent, message):
+        self.reactionDispatcher.submit("postProcessing", self._reportPostProcessingProgress, percent, message)
+
+    def _postProcessingResult(self, result):
+        self.reactionDispatcher.submit("command", self._postProcessingDone, result)
+
+    def _postProcessingError(self, jobId, message):
+        self.reactionDispatcher.submit("command", self._postProcessingFailed, jobId, message)
+
+    def _postProcessingDone(self, result):
+        if result.jobId != self._postProcessingJobId:
+            return # result of a test that was restarted in the meantime
+        self._postProcessingJobId = None
+        self._applyPostProcessingResult(result)
+        self.calibrationProcessedTag.setPlcValue(1)
+
+    ## The worker failed or died, the test is processed in the app instead
+    def _postProcessingFailed(self, jobId, message):
+        print("post processing job " + str(jobId) + " failed: " + message)
+        if jobId != self._postProcessingJobId:
+            return
+        self._postProcessingJobId = None
+        self.logger.addNewLog("Post processing worker failed, processing in the app")
+        self._applyPostProcessingResult(runPostProcessing(self._postProcessingJob(), self._reportPostProcessingProgress))
+        self.calibrationProcessedTag.setPlcValue(1)
         
     def uploadTestData(self):
         print("uploadTestData()")
@@ -824,201 +1013,142 @@ class Model:
         ... # TODO: implement
         self.testResultsParsedTag.setPlcValue(1)
     
-    ## Use this one function for a bunch of response resets if possible
-    def resetResponseTags(self):
-        self.exampleResultTag.setPlcValue(0)
-        self.pixelResultTag.setPlcValue(0)
-        self.calibrationInitializedTag.setPlcValue(0)
-        self.pixelInitializedTag.setPlcValue(0)
-        self.pixelCapturedTag.setPlcValue(0) 
-        self.pixelProcessedTag.setPlcValue(0)
-        self.calibrationProcessedTag.setPlcValue(0)
-        self.LUTsUploadedTag.setPlcValue(0)
-        self.testDataUploadedTag.setPlcValue(0)
-        self.testResultsDownloadedTag.setPlcValue(0)
-        self.testResultsParsedTag.setPlcValue(0)
-        self.errorBucketNotExistTag.setPlcValue(0)
-        self.errorS3ConnectionTag.setPlcValue(0)
-        self.errorCaptureFailedTag.setPlcValue(0)
-        self.errorFrameCaptureFailedTag.setPlcValue(0)
-        self.MetaDataWriterReadyTag.setPlcValue(0)
-        self.TestCompleteProcessedTag.setPlcValue(0)
-        self.TestAbortProcessedTag.setPlcValue(0)
-
     ##################################### TAG REACTIONS ###################################################################
 
     def heartBeatReaction(self):
         self.heartBeatIntag.setPlcValue(self.heartBeatOutTag.value + 1)
 
-    def exampleCommandReaction(self):
-        cmd = self.exampleCommandTag.value
-        if cmd == True:
-            self.logger.addNewLog("Example command sent by PLC ")
-            self.exampleCommand()
-        if cmd == False:
-            self.resetResponseTags()
-
-    def initializePixelReaction(self):
-        cmd = self.initializePixelTag.value
-        if cmd == True:
-            self.logger.addNewLog("Initialize pixel command received from PLC ")
-            self.initializePixel()
-        if cmd == False:
-            self.resetResponseTags()
-        
-    def capturePixelReaction(self):
-        cmd = self.capturePixelTag.value
-        if cmd == True:
-            self.logger.addNewLog("Capture pixel command received from  PLC ")
-            self.capturePixel()
-        if cmd == False:
-            self.resetResponseTags()
-
-    def captureFrameReaction(self):
-        cmd = self.captureFrameTag.value
-        if cmd == True:
-            self.logger.addNewLog("Capture Frame command received from  PLC ")
-            self.captureFrame()
-        if cmd == False:
-            self.resetResponseTags()        
-
-    def processPixelReaction(self):
-        cmd = self.processPixelTag.value
-        if cmd == True:
-            self.logger.addNewLog("Process pixel command received from  PLC ")
-            self.processPixel()
-        if cmd == False:
-            self.resetResponseTags()
-
-    def processCalibrationReaction(self):
-        cmd = self.processCalibrationTag.value
-        if cmd == True:
-            self.logger.addNewLog("Process calibration command received from  PLC ")
-            self.processCalibration()
-        if cmd == False:
-            self.resetResponseTags()
-
-    def initializeCalibrationReaction(self):
-        cmd = self.initializeCalibrationTag.value
-        if cmd == True:
-            self.logger.addNewLog("Initialize calibration command received from  PLC ")
-            self.initializeCalibration()
-        if cmd == False:
-            self.resetResponseTags()
-
-    def uploadLinearLUTsReaction(self):
-        cmd = self.UploadLinearLUTsTag.value
+    ## The PLC starts firing a new power level. With adaptive sampling the pulses of the level are checked every _adaptivePollIntervalSec
+    ## until the confidence interval of their mean settles, then LevelSampleComplete tells the PLC it can stop and capture
+    def powerLevelReaction(self):
+        if MachineSettings._pyroContinuousStream and self.pyrometer.isStreaming:
+            self.streamTimeline.openWindow(self.pyrometer.streamClock.deviceTime())
+        if not self.testSettings._adaptiveSampling or not self.pyrometer.isStreaming:
+            return
+        # power and factor read fresh like the capture reads them, the subscribed values can lag behind
+        levelContext = self.plcTags.readSnapshot("powerCapture")
+        self._levelMultiplicationFactor = levelContext.PyroMultiplicationFactor
+        self._levelTracker = LevelConfidenceTracker(levelContext.CurrentPowerWatts, self.testSettings._tolerancePercent, self.testSettings._adaptiveConfidence,
+                                                    self.testSettings._adaptiveMinPulses, self.testSettings._adaptivePrecisionPercent)
+        self._levelStartTime = time.perf_counter()
+        self._levelCursor = 0 # the buffer is cleared by every capture, all of its pulses belong to this level
+        if MachineSettings._pyroContinuousStream:
+            self._levelCursor = self.pyrometer.buffer.cursor # pulses of the previous level still to come are left out by timestamp
+        if self._adaptiveSamplingThread is None or not self._adaptiveSamplingThread.is_alive():
+            self._adaptiveSamplingThread = threading.Thread(target=self._adaptiveSamplingLoop, name="AdaptiveSampling", daemon=True)
+            self._adaptiveSamplingThread.start()
+
+    ## Queues the level checks in the command queue so they never run alongside a capture; stops when no level is being sampled
+    def _adaptiveSamplingLoop(self):
+        while True:
+            time.sleep(self.testSettings._adaptivePollIntervalSec)
+            tracker = self._levelTracker
+            if tracker is None or tracker.decision is not None:
+                return
+            if not self._levelCheckPending:
+                self._levelCheckPending = True
+                self.reactionDispatcher.submit("command", self._checkLevelConfidence, tracker)
+
+    def _checkLevelConfidence(self, tracker):
+        self._levelCheckPending = False
+        if tracker is not self._levelTracker or tracker.decision is not None or not self.pyrometer.isStreaming:
+            return
+        (values, timestamps, statuses), self._levelCursor = self.pyrometer.getDataSince(self._levelCursor)
+        if MachineSettings._pyroContinuousStream and self.streamTimeline.openStart is not None:
+            first = np.searchsorted(timestamps, self.streamTimeline.openStart)
+            values, timestamps, statuses = values[first:], timestamps[first:], statuses[first:]
+        pulses = evaluatePulseCapture(values, timestamps, statuses, self._levelMultiplicationFactor, self.testSettings._pulseOnMsec,
+                                      tracker.expectedPower, tracker.tolerancePercent)
+        tracker.addPulses(pulses.power)
+        if tracker.evaluate() is not None:
+            self._logLevelDecision(tracker)
+            self.levelSampleCompleteTag.setPlcValue(1)
+
+    ## Logs the adaptive sampling outcome of a level, decision is None when the PLC captured before the level was complete
+    def _logLevelDecision(self, tracker):
+        elapsedSec = time.perf_counter() - self._levelStartTime
+        decision = {"pixel": self.activePixelTag.value, "powerLevel": self._powerLevelIndex(tracker.expectedPower), "pulses": tracker.count,
+                    "mean": tracker.mean, "halfWidth": tracker.halfWidth(), "decision": tracker.decision, "seconds": elapsedSec}
+        self.adaptiveDecisions.append(decision)
+        self.logger.addNewLog("Pixel " + str(decision["pixel"]) + " level " + str(decision["powerLevel"]) + ": " + str(decision["decision"] or "incomplete") + " after " + str(tracker.count)
+                              + " pulses in " + str(round(elapsedSec, 3)) + " s, mean " + str(round(float(tracker.mean), 3)) + " +/- " + str(round(float(decision["halfWidth"]), 3)) + " W")
+
+    ## Command table: command tag -> handler run when the PLC sets the command, the response and error tags the handler sets,
+    ## and the message logged when the command arrives. When the PLC clears the command only its own responses and errors are reset,
+    ## in one batched write
+    def _commandRegistry(self):
+        return {
+            "ExampleCommand": PlcCommand(self.exampleCommand, ["ExampleResult"], [], "Example command sent by PLC "),
+            "InitializeCalibration": PlcCommand(self.initializeCalibration, ["CalibrationInitialized"], [], "Initialize calibration command received from  PLC "),
+            "InitializePixel": PlcCommand(self.initializePixel, ["PixelInitialized"], [], "Initialize pixel command received from PLC "),
+            "CapturePixel": PlcCommand(self.capturePixel, ["PixelCaptured", "LevelSampleComplete"], ["ErrorCaptureFailed"], "Capture pixel command received from  PLC "),
+            "CaptureFrame": PlcCommand(self.captureFrame, [], ["ErrorFrameCaptureFailed"], "Capture Frame command received from  PLC "),
+            "ProcessPixel": PlcCommand(self.processPixel, ["PixelResult", "PixelProcessed"], [], "Process pixel command received from  PLC "),
+            "ProcessCalibration": PlcCommand(self.processCalibration, ["CalibrationProcessed", "PostProcessingProgress"], [], "Process calibration command received from  PLC "),
+            "UploadLinearLUTs": PlcCommand(self.uploadLinearLuts, ["LUTsUploaded"], [], "Upload linear LUTs command received from  PLC "),
+            "UploadCalibratedLUTs": PlcCommand(lambda: self.uploadCalibratedLuts(self.CurrentLUTIDTag.value), ["LUTsUploaded"], [], "Upload calibrated LUTs command received from  PLC "),
+            "UploadTestData": PlcCommand(self.uploadTestData, ["TestDataUploaded"], ["ErrorBucketNotExist", "ErrorS3Connection"], "Upload test data command received from  PLC "),
+            "DownloadTestResults": PlcCommand(self.downloadTestResults, ["TestResultsDownloaded"], ["ErrorBucketNotExist", "ErrorS3Connection"], "Download test results command received from  PLC "),
+            "ParseTestResults": PlcCommand(self.parseTestResults, ["TestResultsParsed"], [], "Parse test results command received from  PLC "),
+            "ZaberHome": PlcCommand(self.zaberHome, ["MetaDataWriterReady"], [], "Zaber home command received from  PLC "),
+            "ZaberMoveRelative": PlcCommand(self.zaberMoveRelative, [], [], "Zaber move relative command received from  PLC "),
+            "ZaberMoveAbsolute": PlcCommand(self.zaberMoveAbsolute, [], [], "Zaber move absolute command received from  PLC "),
+            "ZaberGetHomeStatus": PlcCommand(self.zaberGetHomeStatus, [], [], "Zaber get home status command received from  PLC "),
+            "ZaberGetPosFeedback": PlcCommand(self.zaberGetPosFeedback, [], [], "Zaber get position feedback command received from  PLC "),
+            "OMSTestComplete": PlcCommand(self.omsTestComplete, ["TestCompleteProcessed"], [], None),
+            "OMSTestAborted": PlcCommand(self.omsTestAborted, ["TestAbortProcessed"], [], None)
+            }
+
+    ## Reaction of every command tag in the command table
+    def commandReaction(self, commandName):
+        command = self.commands[commandName]
+        cmd = self.plcTags[commandName].value
         if cmd == True:
-            self.logger.addNewLog("Upload linear LUTs command received from  PLC ")
-            self.uploadLinearLuts()
+            if command.logMessage is not None:
+                self.logger.addNewLog(command.logMessage)
+            command.handler()
         if cmd == False:
-            self.resetResponseTags()
+            self.plcTags.setPlcValues({tagName: 0 for tagName in command.responses + command.errors})
 
-    def uploadCalibratedLUTsReaction(self):
-        cmd = self.UploadCalibratedLUTsTag.value
-        if cmd == True:
-            self.logger.addNewLog("Upload calibrated LUTs command received from  PLC ")
-            self.uploadCalibratedLuts(self.CurrentLUTIDTag.value)
-        if cmd == False:
-            self.resetResponseTags()
-    
-    def uploadTestDataReaction(self):
-        cmd = self.uploadTestDataTag.value
-        if cmd == True:
-            self.logger.addNewLog("Upload test data command received from  PLC ")
-            self.uploadTestData()
-        if cmd == False:
-            self.resetResponseTags()
-    
-    def downloadTestResultsReaction(self):
-        cmd = self.downloadTestResultsTag.value
-        if cmd == True:
-            self.logger.addNewLog("Download test results command received from  PLC ")
-            self.downloadTestResults()
-        if cmd == False:
-            self.resetResponseTags()
-        
-    def parseTestResultsReaction(self):
-        cmd = self.parseTestResultsTag.value
-        if cmd == True:
-            self.logger.addNewLog("Parse test results command received from  PLC ")
-            self.parseTestResults()
-        if cmd == False:
-            self.resetResponseTags()
-
-    def ZaberHomeReaction(self):
-        cmd = self.ZaberHomeTag.value
-        if cmd == True:
-            self.logger.addNewLog("Zaber home command received from  PLC ")
-            camera = CameraDriver()
-            camera.homePositioner(self.comPortNumberTag.value)
-            self.camera.initialize(self.gd)
-            #Check camera directory
-            self.camera_dir = os.path.join(self.saveLocation, "cameraData")
-            if not os.path.exists(self.camera_dir):
-                os.makedirs(self.camera_dir, exist_ok=True)
-            # Meta Writer Init
-            time_start = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ%f')
-            self.metadatafilewriter = MetadataFileWriter(machine=self.MachineNameTag.value, datetime=time_start)
-            self.MetaDataWriterReadyTag.setPlcValue(1)
-        if cmd == False:
-            self.resetResponseTags()
-
-    def ZaberMoveRelativeReaction(self):
-        cmd = self.ZaberMoveRelativeTag.value
-        if cmd == True:
-            self.logger.addNewLog("Zaber move relative command received from  PLC ")
-            camera = CameraDriver()
-            camera.moveRelPositioner(self.ZaberRelativePosParTag.value,self.comPortNumberTag.value)
-        if cmd == False:
-            self.resetResponseTags()
+    def zaberHome(self):
+        camera = CameraDriver()
+        camera.homePositioner(self.comPortNumberTag.value)
+        self.camera.initialize(self.gd)
+        #Check camera directory
+        self.camera_dir = os.path.join(self.saveLocation, "cameraData")
+        if not os.path.exists(self.camera_dir):
+            os.makedirs(self.camera_dir, exist_ok=True)
+        # Meta Writer Init
+        time_start = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ%f')
+        self.metadatafilewriter = MetadataFileWriter(machine=self.MachineNameTag.value, datetime=time_start)
+        self.MetaDataWriterReadyTag.setPlcValue(1)
+
+    def zaberMoveRelative(self):
+        camera = CameraDriver()
+        camera.moveRelPositioner(self.ZaberRelativePosParTag.value,self.comPortNumberTag.value)
 
-    def ZaberMoveAbsoluteReaction(self):
-        cmd = self.ZaberMoveAbsoluteTag.value
-        if cmd == True:
-            self.logger.addNewLog("Zaber move absolute command received from  PLC ")
-            camera = CameraDriver()
-            camera.moveAbsPositioner(self.ZaberAbsolutePosParTag.value,self.comPortNumberTag.value)
-            self.camera.setExposure(self.CameraExposureTag.value,self.gd) # Set Exposure with zaber move 
-        if cmd == False:
-            self.resetResponseTags()
+    def zaberMoveAbsolute(self):
+        camera = CameraDriver()
+        camera.moveAbsPositioner(self.ZaberAbsolutePosParTag.value,self.comPortNumberTag.value)
+        self.camera.setExposure(self.CameraExposureTag.value,self.gd) # Set Exposure with zaber move 
 
-    def ZaberGetHomeStatusReaction(self):
-        cmd = self.ZaberGetHomeStatusTag.value
-        if cmd == True:
-            self.logger.addNewLog("Zaber get home status command received from  PLC ")
-            camera = CameraDriver()
-            self.ZaberHomedTag.setPlcValue(camera.getPositionerRefStatus(self.comPortNumberTag.value))
-        if cmd == False:
-            self.resetResponseTags()
+    def zaberGetHomeStatus(self):
+        camera = CameraDriver()
+        self.ZaberHomedTag.setPlcValue(camera.getPositionerRefStatus(self.comPortNumberTag.value))
 
-    def ZaberGetPosFeedbackReaction(self):
-        cmd = self.ZaberGetPosFeedbackTag.value
-        if cmd == True:
-            self.logger.addNewLog("Zaber get position feedback command received from  PLC ")
-            camera = CameraDriver()
-            self.ZaberPositionTag.setPlcValue(camera.getPositionerPosition())
-        if cmd == False: 
-            self.resetResponseTags()
-
-    def OMSTestCompleteReaction(self):
-        cmd = self.OMSTestCompleteTag.value
-        if cmd == True:
-            self.metadatafilewriter.save_file(self.camera_dir, test_status='Completed')
-            self.TestCompleteProcessedTag.setPlcValue(1)
-        if cmd == False:   
-            self.resetResponseTags()
+    def zaberGetPosFeedback(self):
+        camera = CameraDriver()
+        self.ZaberPositionTag.setPlcValue(camera.getPositionerPosition())
 
-    def OMSTestAbortedReaction(self):
-        cmd = self.OMSTestAbortedTag.value
-        if cmd == True:
-            print(f'saving metadata json to {self.camera_dir}')
-            self.metadatafilewriter.save_file(self.camera_dir, test_status='Aborted')
-            print(f'saved metadata json to {self.camera_dir}')
-            self.TestAbortProcessedTag.setPlcValue(1)
+    def omsTestComplete(self):
+        self.metadatafilewriter.save_file(self.camera_dir, test_status='Completed')
+        self.TestCompleteProcessedTag.setPlcValue(1)
 
-        if cmd == False:   
-            self.resetResponseTags()
+    def omsTestAborted(self):
+        print(f'saving metadata json to {self.camera_dir}')
+        self.metadatafilewriter.save_file(self.camera_dir, test_status='Aborted')
+        print(f'saved metadata json to {self.camera_dir}')
+        self.TestAbortProcessedTag.setPlcValue(1)
 
    ############################## HELPER FUNCTION ##########################################
     def _is_image_new(self,  new_img):
@@ -1026,29 +1156,31 @@ class Model:
             self._last_captured_frame = new_img
             return True
         else:
-            if np.array_equal(self._last_captured_frame, new_img):
-                return False
-            else:
-                self._last_captured_frame = new_img
-                return True
+            # always keep the newest frame, the camera reuses the buffer of older frames
+            is_new = not np.array_equal(self._last_captured_frame, new_img)
+            self._last_captured_frame = new_img
+            return is_new
 
     def _captureFrameData(self):
         print("_captureFrameData()")
 
         camera = CameraDriver()
-        activePixel = self.activePixelTag.value
-        gantryXPosition = self.GantryXPositionStatusTag.value
-        gantryYPosition = self.GantryYPositionStatusTag.value
+        frameContext = self.plcTags.readSnapshot("frameCapture")
+        activePixel = frameContext.ActivePixel
+        gantryXPosition = frameContext.GantryXPositionStatus
+        gantryYPosition = frameContext.GantryYPositionStatus
         zaberPosition = camera.getPositionerPosition(self.comPortNumberTag.value)
-        pulseOnMsec = self.pulseOnMsecTag.value
-        CurrentPowerLevel = self.currentPowerWattsTag.value
-        machineName = self.MachineNameTag.value
+        pulseOnMsec = frameContext.pulseOnMsec
+        CurrentPowerLevel = frameContext.CurrentPowerWatts
+        machineName = frameContext.MachineName
 
         metadata, imageData = self.camera.fetchFrame(activePixel,gantryXPosition,gantryYPosition,zaberPosition,pulseOnMsec,CurrentPowerLevel,machineName,self.gd)
 
         if metadata is None or imageData is None:
             return False
         else:
+            captureTimes = self.camera.captureTimes
+            print("Frame captured in " + str(round(captureTimes['total'] * 1000, 1)) + " ms (" + str(round(captureTimes['wait'] * 1000, 1)) + " ms waiting for the frame, " + str(round(captureTimes['read'] * 1000, 1)) + " ms reading it)")
             is_image_new = self._is_image_new(imageData) #declare fault
             # Save image to camera-specific subdirectory until otherwise specified. Append to metadata (in memory)
             metadata.update({'frame_is_a_duplicate': not is_image_new})
@@ -1064,78 +1196,60 @@ class Model:
         print("_capturePowerData()")
         if self.pyrometer.isConnected:
 
-            pulses = self.pyrometer.getFullData()
-
-            print("\ndata: [ ")
-            for pulse in pulses:
-                for datum in pulse:
-                    print(str(datum) + ", ")
-                print(";")
-            print("]")
-
-            pulsePeak = self.pyrometer.getFullDataPeak(update=False)
-            print("\npulsePeak: " + str(pulsePeak[0]))
-
-            allPulsesOkay = True   # group status
-            lastError = 0
-
-            self.pyrometer.clearData()
-            
-            measuredPowerMax = 0 # reset max 
-
-            for pulse in pulses:
-
-                energy = pulse[0] * self.PyroMultiplicationFactorTag.value
-                timestamp = pulse[1]
-                status = pulse[2]
-
-                # throw out pulses with non-zero status
-                # TODO: figure out why we're getting pulses with non-zero status
-                if (status == 0):
-                    measuredPower = energy/(self.testSettings._pulseOnMsec / 1000)
-                    measuredEnergy = energy
-                    expectedPower = self.currentPowerWattsTag.value
-
-                    # append data for each pulse
-                    self.laserTestData[self.activePixelTag.value - 1].append(measuredPower)
-                    self.laserTestEnergy[self.activePixelTag.value - 1].append(measuredEnergy)
-                    self.commandedPowerData[self.activePixelTag.value - 1].append(expectedPower)
-
-                    measuredPowerMax = max([measuredPower , measuredPowerMax])
-                    measuredPowerMax = measuredPowerMax
-
-                    # evaluate the variable formerly known as testStatus
-                    # check the power of each pulse but only report 1 status per pixel
-                    # test status meaning: ["In Progress", "Passed", "High Power Failure", "Low Power Failure", "No Power Failure", "Untested", "", "", "", "", "Abort"]
-                    if measuredPower > (expectedPower * (1 + self.testSettings._tolerancePercent/100)):
-                        # high power
-                        lastError = 2
-                        allPulsesOkay = False
-                    elif measuredPower < (expectedPower * (1 - self.testSettings._tolerancePercent/100)):
-                        # low power
-                        lastError = 3
-                        allPulsesOkay = False
-                    elif measuredPower < (expectedPower * 0.05):
-                        # no power
-                        lastError = 4
-                        allPulsesOkay = False
-                        
-            self.MeasuredPowerTag.setPlcValue(measuredPowerMax) 
-            self.CommandedPowerTag.setPlcValue(self.currentPowerWattsTag.value)
-
-            if allPulsesOkay:
-                # pixel pass
-                self.laserTestStatus[self.activePixelTag.value - 1] = 1
-                self.LaserTestStatusTag.setPlcValue(1)
+            # pixel, power and factor of this capture, read once in one request instead of per pulse
+            captureContext = self.plcTags.readSnapshot("powerCapture")
+            activePixel = captureContext.ActivePixel
+            currentPowerWatts = captureContext.CurrentPowerWatts
+            if self._levelTracker is not None:
+                if self._levelTracker.decision is None:
+                    self._logLevelDecision(self._levelTracker)
+                if self._levelMultiplicationFactor != captureContext.PyroMultiplicationFactor:
+                    self.logger.addNewLog("Pyrometer multiplication factor changed from " + str(self._levelMultiplicationFactor) + " to " + str(captureContext.PyroMultiplicationFactor)
+                                          + " while pixel " + str(activePixel) + " was sampled, the level decision used the earlier factor")
+                self._levelTracker = None
+
+            if MachineSettings._pyroContinuousStream:
+                values, timestamps, statuses = self._levelSamples(activePixel, currentPowerWatts)
             else:
-                self.laserTestStatus[self.activePixelTag.value - 1] = lastError
-                self.LaserTestStatusTag.setPlcValue(lastError)
+                values, timestamps, statuses = self.pyrometer.getFullDataArrays()
+            capture = evaluatePulseCapture(values, timestamps, statuses, captureContext.PyroMultiplicationFactor, self.testSettings._pulseOnMsec,
+                                           currentPowerWatts, self.testSettings._tolerancePercent)
+            print("\npulses: " + str(len(values)) + " (" + str(capture.rejectedPulses) + " with non-zero status), max power: " + str(capture.maxPower))
+
+            if self.pyroAcquisition is not None and self.pyroAcquisition.overruns > self._reportedPyroOverruns:
+                self._reportedPyroOverruns = self.pyroAcquisition.overruns
+                self.logger.addNewLog("Pyrometer acquisition overruns: " + str(self.pyroAcquisition.overruns) + " (" + str(self.pyroAcquisition.droppedSamples) + " samples dropped)")
+
+            if not MachineSettings._pyroContinuousStream:
+                self.pyrometer.clearData()
+
+            # pulses with non-zero status are thrown out by the evaluation
+            # TODO: figure out why we're getting pulses with non-zero status
+            # test status meaning: ["In Progress", "Passed", "High Power Failure", "Low Power Failure", "No Power Failure", "Untested", "", "", "", "", "Abort"]
+            powerLevel = self._powerLevelIndex(currentPowerWatts)
+            if powerLevel is None:
+                self.logger.addNewLog("Commanded power " + str(round(currentPowerWatts, 3)) + " W is not a power level of the test, pixel " + str(activePixel) + " pulses left out of the level statistics")
+            self.sampleStore.appendChunk(activePixel - 1, powerLevel, capture.power, capture.energy, currentPowerWatts, capture.timestamps, capture.pulseStatus)
+            self.runningStatistics.addChunk(activePixel - 1, powerLevel, capture.power)
+            self.laserTestStatus[activePixel - 1] = capture.status
+
+            self.plcTags.setPlcValues({
+                "MeasuredPower": capture.maxPower,
+                "CommandedPower": currentPowerWatts,
+                "LaserTestStatus": capture.status
+                })
             return True
         
         else:
             
             return False
         
+    ## Continuous streaming: closes the window of the level being captured and returns its samples, found by device timestamp
+    def _levelSamples(self, activePixel, currentPowerWatts):
+        values, timestamps, statuses = self.pyrometer.getFullDataArrays()
+        first, last = closeLevelWindow(self.streamTimeline, timestamps, activePixel - 1, self._powerLevelIndex(currentPowerWatts))
+        return values[first:last], timestamps[first:last], statuses[first:last]
+
     def updateExposure(self, powerLevelIndex):
         
         nextPowerWatts = self.startingPowerLevelTag.value + (self.powerLevelIncrementTag.value * powerLevelIndex)
@@ -1170,6 +1284,11 @@ class Model:
             calID = self.CurrentLUTIDTag.value  
             drivePath = os.path.join(".", "tmp", "printerinfo", MachineSettings._factoryID, machineID, "Laser Data", "30_Calibrations", machineID + "_LUT_" + str(calID).zfill(5)+"_" + date)
             self.testName = machineID + "-" + date + "-" + time + "-LUT-" + str(calID).zfill(5) + " Calibration"
+        elif(self.testType == TestType.RECALIBRATION):
+            time = self.timeStamp.strftime("%H%M")
+            calID = self.testSettings._CalId
+            drivePath = os.path.join(".", "tmp", "printerinfo", MachineSettings._factoryID, machineID, "Laser Data", "30_Calibrations", machineID + "_LUT_" + str(calID).zfill(5)+"_" + date + "_RECAL")
+            self.testName = machineID + "-" + date + "-" + time + "-LUT-" + str(calID).zfill(5) + " Recalibration"
         elif(self.testType == TestType.CLEAN_POWER_VERIFICATION):
             time = self.timeStamp.strftime("%H%M")
             calID = self.CurrentLUTIDTag.value
@@ -1203,6 +1322,11 @@ class Model:
             calID = self.CurrentLUTIDTag.value   
             drivePathNetwork = os.path.join(r"\\brl-nas02\printerinfo", MachineSettings._factoryID, machineID, "Laser Data", "30_Calibrations", machineID + "_LUT_" + str(calID).zfill(5)+"_" + date)
             self.testName = machineID + "-" + date + "-" + time + "-LUT-" + str(calID).zfill(5) + " Calibration"
+        elif(self.testType == TestType.RECALIBRATION):
+            time = self.timeStamp.strftime("%H%M")
+            calID = self.testSettings._CalId
+            drivePathNetwork = os.path.join(r"\\brl-nas02\printerinfo", MachineSettings._factoryID, machineID, "Laser Data", "30_Calibrations", machineID + "_LUT_" + str(calID).zfill(5)+"_" + date + "_RECAL")
+            self.testName = machineID + "-" + date + "-" + time + "-LUT-" + str(calID).zfill(5) + " Recalibration"
         elif(self.testType == TestType.CLEAN_POWER_VERIFICATION):
             time = self.timeStamp.strftime("%H%M")
             calID = self.CurrentLUTIDTag.value
@@ -1224,6 +1348,14 @@ class Model:
         return drivePathNetwork
 
 
+    ## Commanded power (W) of each power level of the current test settings
+    def _commandedPowerLevels(self):
+        return [(self.testSettings._startingPowerLevel + self.testSettings._powerLevelIncrement * powerLevel) * 525/255 for powerLevel in range(self.testSettings._numPowerLevelSteps)]
+
+    ## Index of the test power level of a commanded power (W), None when the power is not one of the levels of the test settings
+    def _powerLevelIndex(self, commandedPower):
+        return powerLevelIndex(commandedPower, self._commandedPowerLevels())
+
     @staticmethod
     def percentDiff(numA, numB):
         if numA == numB:
@@ -1,15 +1,103 @@
 # Use of Ophir COM object. 
 # Works with python 3.5.1, 2.7.11, & 3.10.6
 # Uses pywin32
-import win32com.client
+try:
+    import win32com.client
+except ImportError: # pywin32 only exists on Windows; pass a fake COM object (Model.DeviceSimulators) to run without the device
+    win32com = None
 import time
 import traceback
+import numpy as np
+from Model.StreamSegmenter import StreamClock
+
+## Array backed buffer for the streamed Juno data
+## Values, timestamps and statuses are kept in numpy columns that double in size when full, so appending a GetData chunk
+## never copies the whole history. The peak is tracked incrementally and readers can fetch only the samples after a cursor
+class PyroStreamBuffer:
+
+    def __init__(self, initialCapacity=1024) -> None:
+        self._initialCapacity = max(int(initialCapacity), 1)
+        self._firstIndex = 0 # absolute index of the first buffered sample, cursors stay valid across clear()
+        self.clear()
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        self._firstIndex += getattr(self, "_size", 0)
+        self._size = 0
+        self._values = np.zeros(self._initialCapacity, dtype=np.float64)
+        self._timestamps = np.zeros(self._initialCapacity, dtype=np.float64)
+        self._statuses = np.zeros(self._initialCapacity, dtype=np.int32)
+        self._peakIndex = -1
+        self.lastChunkPeak = (None, None, None)
+
+    ## Absolute position after the newest sample; pass it to since() to read only what arrives afterwards
+    @property
+    def cursor(self):
+        return self._firstIndex + self._size
+
+    def append(self, values, timestamps, statuses):
+        values = np.asarray(values, dtype=np.float64)
+        numSamples = len(values)
+        if numSamples == 0:
+            return 0 # keep the previous chunk peak when nothing new arrived
+        start = self._size
+        stop = start + numSamples
+        if stop > len(self._values):
+            newCapacity = max(stop, 2 * len(self._values))
+            self._values = self._grow(self._values, newCapacity)
+            self._timestamps = self._grow(self._timestamps, newCapacity)
+            self._statuses = self._grow(self._statuses, newCapacity)
+        self._values[start:stop] = values
+        self._timestamps[start:stop] = timestamps
+        self._statuses[start:stop] = statuses
+        self._size = stop
+        chunkPeakIndex = start + int(np.argmax(values))
+        self.lastChunkPeak = self._dataPoint(chunkPeakIndex)
+        if self._peakIndex < 0 or self._values[chunkPeakIndex] > self._values[self._peakIndex]:
+            self._peakIndex = chunkPeakIndex
+        return numSamples
+
+    def _grow(self, column, capacity):
+        grown = np.zeros(capacity, dtype=column.dtype)
+        grown[:self._size] = column[:self._size]
+        return grown
+
+    def _dataPoint(self, index):
+        return (self._values[index].item(), self._timestamps[index].item(), self._statuses[index].item())
+
+    ## (values, timestamps, statuses) views of every buffered sample, valid until the next append or clear
+    def arrays(self):
+        return self._values[:self._size], self._timestamps[:self._size], self._statuses[:self._size]
+
+    ## (values, timestamps, statuses) views of the samples after cursor and the cursor to use for the next read
+    def since(self, cursor):
+        start = min(max(cursor - self._firstIndex, 0), self._size)
+        return (self._values[start:self._size], self._timestamps[start:self._size], self._statuses[start:self._size]), self.cursor
+
+    def lastDataPoint(self):
+        if self._size == 0:
+            raise IndexError("no pyrometer data buffered")
+        return self._dataPoint(self._size - 1)
+
+    def peak(self):
+        if self._peakIndex < 0:
+            return (None, None, None)
+        return self._dataPoint(self._peakIndex)
+
+    ## Buffered data as a tuple of (value, timestamp, status) triples
+    def asTuples(self):
+        values, timestamps, statuses = self.arrays()
+        return tuple(zip(values.tolist(), timestamps.tolist(), statuses.tolist()))
 
 class OphirJunoCOM:
     
-    def __init__(self) -> None:
+    def __init__(self, ophirCOM=None) -> None:
         try:
-            self.OphirCOM = win32com.client.Dispatch("OphirLMMeasurement.CoLMMeasurement")
+            if ophirCOM is None:
+                ophirCOM = win32com.client.Dispatch("OphirLMMeasurement.CoLMMeasurement")
+            self.OphirCOM = ophirCOM
             self.OphirCOM.StopAllStreams()
             self.OphirCOM.CloseAll()
         except OSError as err:
@@ -20,10 +108,22 @@ class OphirJunoCOM:
             #traceback.print_exc()
 
         self.isConnected = False
-        #TODO: implement isStreaming flag
-        #self.isStreaming = False
-        self.data = tuple()
-        self.newestDataPeak = (None, None, None)
+        self.isStreaming = False
+        self.buffer = PyroStreamBuffer()
+        self.acquisitionWorker = None ## optional PyroAcquisitionWorker polling GetData in the background
+        self.lastStartError = None ## last error of startDataCollectionWhenReady
+        self.streamClock = StreamClock() ## host time to device timestamp of the current stream
+        self.streamStarts = 0 ## StartStream calls accepted since the connection
+    
+    ## Data as a sequence of (value, timestamp, status) triples for ease of use
+    @property
+    def data(self):
+        return self.buffer.asTuples()
+
+    ## Peak of the most recent GetData chunk
+    @property
+    def newestDataPeak(self):
+        return self.buffer.lastChunkPeak
     
     def connectToJuno(self):
         if self.isConnected: # disconnect before re-connecting
@@ -73,32 +173,110 @@ class OphirJunoCOM:
             return "" 
     
     def disconnectJuno(self):
+        self.isStreaming = False
         self.OphirCOM.StopAllStreams()
         self.OphirCOM.CloseAll()
         self.isConnected = False
     
     def startDataCollection(self):
         try:
+            if self.acquisitionWorker is not None:
+                self.acquisitionWorker.discard() # chunks polled before the restart belong to the previous stream
             self.OphirCOM.StartStream(self.DeviceHandle, 0)
+            self._streamStarted()
         except Exception as e:
             print(e)
+
+    ## Starts the stream and waits until the Juno confirms it is armed: StartStream is accepted and a GetData call made after it returns samples
+    ## (through the acquisition worker when it runs, samples read here are buffered). A Juno that isn't armed yet answers GetData with empty data,
+    ## so an answer alone doesn't count. Both calls are retried every pollIntervalSec for up to timeoutSec.
+    ## Returns True when the stream is armed, otherwise the stream is stopped and lastStartError holds the last error (a TimeoutError if there was none).
+    ## A stream that is still running is stopped first so the new one (and its timestamps) starts over
+    def startDataCollectionWhenReady(self, timeoutSec=1.0, pollIntervalSec=0.02):
+        deadline = time.perf_counter() + timeoutSec
+        self.lastStartError = None
+        if self.isStreaming:
+            try:
+                self.endDataCollection()
+            except Exception as e:
+                print(e)
+            self.isStreaming = False
+        if self.acquisitionWorker is not None:
+            self.acquisitionWorker.discard() # chunks polled before the restart belong to the previous stream
+        while True:
+            try:
+                if not self.isStreaming:
+                    self.OphirCOM.StartStream(self.DeviceHandle, 0)
+                    startTime = self._streamStarted()
+                if self.acquisitionWorker is not None and self.acquisitionWorker.isRunning:
+                    sampleTime = self.acquisitionWorker.lastSampleTime
+                    if sampleTime is not None and sampleTime > startTime:
+                        return True
+                else:
+                    newValues, newTimestamps, newStatuses = self.OphirCOM.GetData(self.DeviceHandle, 0)
+                    if len(newValues) > 0:
+                        self._appendChunk(newValues, newTimestamps, newStatuses)
+                        return True
+            except Exception as e:
+                self.lastStartError = e
+            if time.perf_counter() >= deadline:
+                break
+            time.sleep(pollIntervalSec)
+        if self.lastStartError is None:
+            self.lastStartError = TimeoutError("no pulse data from the stream within " + str(timeoutSec) + " s")
+        if self.isStreaming:
+            try:
+                self.endDataCollection()
+            except Exception as e:
+                print(e)
+            self.isStreaming = False
+        return False
+
+    def _streamStarted(self):
+        startTime = time.perf_counter()
+        self.isStreaming = True
+        self.streamStarts += 1
+        self.streamClock.reset(startTime)
+        return startTime
+
+    ## Buffers a GetData chunk read now and times it for the stream clock
+    def _appendChunk(self, newValues, newTimestamps, newStatuses):
+        if len(newTimestamps) > 0:
+            self.streamClock.observe(time.perf_counter(), newTimestamps[-1])
+        self.buffer.append(newValues, newTimestamps, newStatuses)
+
+    ## Hands the GetData polling over to a background worker; updateData then only drains decoded chunks
+    def attachAcquisitionWorker(self, worker):
+        self.acquisitionWorker = worker
     
     def updateData(self):
-        # Data should be a sequence of triples for ease of use
-        newValues, newTimestamps, newStatuses = self.OphirCOM.GetData(self.DeviceHandle, 0)
-        newData = tuple(zip(newValues, newTimestamps, newStatuses))#remove strict as it wasn't introduced yet in 3.7.9#, strict=True)) # set strict mostly as an assertion that all 3 data tuples are the same length
-        self.newestDataPeak = max(newData, default=self.newestDataPeak, key=lambda tup:tup[0]) # if new data is empty, keep old peak
-        self.data += newData
+        if self.acquisitionWorker is not None and self.acquisitionWorker.isRunning:
+            for newValues, newTimestamps, newStatuses in self.acquisitionWorker.drain():
+                self.buffer.append(newValues, newTimestamps, newStatuses)
+            return
+        self._appendChunk(*self.OphirCOM.GetData(self.DeviceHandle, 0))
     
     def getFullData(self, update=True):
         if update:
             self.updateData()
         return self.data
+
+    ## Full data as (values, timestamps, statuses) numpy arrays
+    def getFullDataArrays(self, update=True):
+        if update:
+            self.updateData()
+        return self.buffer.arrays()
+
+    ## Data after a cursor as (values, timestamps, statuses) numpy arrays plus the cursor for the next call
+    def getDataSince(self, cursor, update=True):
+        if update:
+            self.updateData()
+        return self.buffer.since(cursor)
     
     def getLastDataPoint(self, update=True):
         if update:
             self.updateData()
-        return self.data[-1]
+        return self.buffer.lastDataPoint()
     
     def getLastDataPeak(self, update=True):
         if update:
@@ -108,9 +286,10 @@ class OphirJunoCOM:
     def getFullDataPeak(self, update=True):
         if update:
             self.updateData()
-        return max(self.data, default=(None, None, None), key=lambda tup:tup[0])
+        return self.buffer.peak()
     
     def endDataCollection(self):
+        self.isStreaming = False
         self.OphirCOM.StopStream(self.DeviceHandle, 0)
     
     def quickStart(self):
@@ -128,6 +307,5 @@ class OphirJunoCOM:
         return self.disconnectJuno()
     
     def clearData(self):
-        self.data = tuple()
-        self.newestDataPeak = (None, None, None)
+        self.buffer.clear()
 
@@ -0,0 +1,262 @@
+import threading
+import time
+import numpy as np
+from opcua import Server, ua
+
+## Local stand-in for the B&R PLC
+## Serves the gOpcData_ToGen3CalibApp / gOpcData_FromGen3CalibApp tags with the same ns=6;s=::AsGlobalPV: node ids the Model uses,
+## drives the heartbeat and scripts the command/response handshakes of a calibration while timing every one of them.
+## Start it on 127.0.0.1 with MachineSettings._simulation set so the Model connects to it instead of the controller
+class PlcSimulator:
+
+    namespaceIndex = 6
+    tagPrefix = "::AsGlobalPV:"
+    toApp = "gOpcData_ToGen3CalibApp."
+    fromApp = "gOpcData_FromGen3CalibApp."
+
+    ## plcTags key -> (node path, variant type, initial value)
+    tagTypes = {
+        "AppMajorVersion": (fromApp + "AppMajorVersion", ua.VariantType.UInt16, 0),
+        "AppMinorVersion": (fromApp + "AppMinorVersion", ua.VariantType.UInt16, 0),
+        "AppPatchVersion": (fromApp + "AppPatchVersion", ua.VariantType.UInt16, 0),
+        "MachineName": (toApp + "MachineName", ua.VariantType.String, "SIM"),
+        "FactoryName": (toApp + "FactoryName", ua.VariantType.String, "SIM"),
+        "HeartbeatOut": (toApp + "HeartbeatOut", ua.VariantType.UInt32, 0),
+        "HeartbeatIn": (fromApp + "HeartbeatIn", ua.VariantType.UInt32, 0),
+        "ExampleCommand": (toApp + "ExampleCommand", ua.VariantType.Boolean, False),
+        "ExampleResult": (fromApp + "ExampleResult", ua.VariantType.Boolean, False),
+        "InitializeCalibration": (toApp + "InitializeCalibration", ua.VariantType.Boolean, False),
+        "CalibrationInitialized": (fromApp + "CalibrationInitialized", ua.VariantType.Boolean, False),
+        "InitializePixel": (toApp + "InitializePixel", ua.VariantType.Boolean, False),
+        "PixelInitialized": (fromApp + "PixelInitialized", ua.VariantType.Boolean, False),
+        "CapturePixel": (toApp + "CapturePixel", ua.VariantType.Boolean, False),
+        "CaptureFrame": (toApp + "CaptureFrame", ua.VariantType.Boolean, False),
+        "CaptureFrameInstance": (toApp + "CaptureFrameInstance", ua.VariantType.UInt16, 0),
+        "FrameCaptureInstanceResponse": (fromApp + "FrameCaptureInstanceResponse", ua.VariantType.UInt16, 0),
+        "LevelSampleComplete": (fromApp + "LevelSampleComplete", ua.VariantType.Boolean, False),
+        "PixelCaptured": (fromApp + "PixelCaptured", ua.VariantType.Boolean, False),
+        "pulseOnMsec": (toApp + "LaserParameters.pulseOnTime_ms", ua.VariantType.Float, 5.0),
+        "numPulsesPerLevel": (toApp + "LaserParameters.numPulsesPerLevel", ua.VariantType.UInt16, 10),
+        "startingPowerLevel": (toApp + "LaserParameters.startingPowerLevel", ua.VariantType.UInt16, 24),
+        "numPowerLevelSteps": (toApp + "LaserParameters.numPowerLevels", ua.VariantType.UInt16, 5),
+        "powerLevelIncrement": (toApp + "LaserParameters.powerIncrementPerStep", ua.VariantType.UInt16, 20),
+        "CurrentPowerWatts": (toApp + "CurrentPowerWatts", ua.VariantType.Float, 0.0),
+        "ProcessPixel": (toApp + "ProcessPixel", ua.VariantType.Boolean, False),
+        "PixelProcessed": (fromApp + "PixelProcessed", ua.VariantType.Boolean, False),
+        "PixelResult": (fromApp + "PixelResult", ua.VariantType.UInt16, 0),
+        "ProcessCalibration": (toApp + "ProcessCalibration", ua.VariantType.Boolean, False),
+        "CalibrationProcessed": (fromApp + "CalibrationProcessed", ua.VariantType.Boolean, False),
+        "PostProcessingProgress": (fromApp + "PostProcessingProgress", ua.VariantType.UInt16, 0),
+        "ActivePixel": (toApp + "ActivePixel", ua.VariantType.UInt16, 0),
+        "VFPMap": (toApp + "VFPMap", ua.VariantType.UInt16, None), # [[Pixel, Enable, Rack, Laser], ...] built from the pixel count
+        "TestType": (toApp + "TestType", ua.VariantType.UInt16, 0),
+        "UploadLinearLUTs": (toApp + "UploadLinearLUTs", ua.VariantType.Boolean, False),
+        "UploadCalibratedLUTs": (toApp + "UploadCalibratedLUTs", ua.VariantType.Boolean, False),
+        "LUTsUploaded": (fromApp + "LUTsUploaded", ua.VariantType.Boolean, False),
+        "CurrentLUTID": (toApp + "CurrentLUTID", ua.VariantType.UInt32, 99999),
+        "GeneratedLUTID": (fromApp + "GeneratedLUTID", ua.VariantType.UInt32, 0),
+        "RetestPixelMask": (fromApp + "RetestPixelMask", ua.VariantType.UInt16, None), # 1 per pixel to recalibrate, one spare element like the PLC arrays
+        "UploadTestData": (toApp + "UploadTestData", ua.VariantType.Boolean, False),
+        "TestDataUploaded": (fromApp + "TestDataUploaded", ua.VariantType.Boolean, False),
+        "DownloadTestResults": (toApp + "DownloadTestResults", ua.VariantType.Boolean, False),
+        "TestResultsDownloaded": (fromApp + "TestResultsDownloaded", ua.VariantType.Boolean, False),
+        "ParseTestResults": (toApp + "ParseTestResults", ua.VariantType.Boolean, False),
+        "TestResultsParsed": (fromApp + "TestResultsParsed", ua.VariantType.Boolean, False),
+        "ErrorBucketNotExist": (fromApp + "ErrorBucketNotExist", ua.VariantType.Boolean, False),
+        "ErrorS3Connection": (fromApp + "ErrorS3Connection", ua.VariantType.Boolean, False),
+        "ErrorCaptureFailed": (fromApp + "ErrorCaptureFailed", ua.VariantType.Boolean, False),
+        "ErrorFrameCaptureFailed": (fromApp + "ErrorFrameCaptureFailed", ua.VariantType.Boolean, False),
+        "MeasuredPower": (fromApp + "MeasuredPower", ua.VariantType.Float, 0.0),
+        "CommandedPower": (fromApp + "CommandedPower", ua.VariantType.Float, 0.0),
+        "LaserTestStatus": (fromApp + "LaserTestStatus", ua.VariantType.UInt16, 0),
+        "ZaberPosition": (fromApp + "ZaberPosition", ua.VariantType.Float, 0.0),
+        "ZaberHomed": (fromApp + "ZaberHomed", ua.VariantType.Boolean, False),
+        "ZaberRelativePosPar": (toApp + "ZaberRelativePos_mm", ua.VariantType.Float, 0.0),
+        "ZaberAbsolutePosPar": (toApp + "ZaberAbsolutePos_mm", ua.VariantType.Float, 0.0),
+        "ZaberHome": (toApp + "ZaberHome", ua.VariantType.Boolean, False),
+        "ZaberMoveRelative": (toApp + "ZaberMoveRelative", ua.VariantType.Boolean, False),
+        "ZaberMoveAbsolute": (toApp + "ZaberMoveAbsolute", ua.VariantType.Boolean, False),
+        "ZaberGetHomeStatus": (toApp + "ZaberGetHomeStatus", ua.VariantType.Boolean, False),
+        "ZaberGetPosFeedback": (toApp + "ZaberGetPosFeedback", ua.VariantType.Boolean, False),
+        "GantryXPositionStatus": (toApp + "GantryXPositionStatus", ua.VariantType.Float, 0.0),
+        "GantryYPositionStatus": (toApp + "GantryYPositionStatus", ua.VariantType.Float, 0.0),
+        "StartOMSTest": (toApp + "StartOMSTest", ua.VariantType.Boolean, False),
+        "MetaDataWriterReady": (fromApp + "MetaDataWriterReady", ua.VariantType.Boolean, False),
+        "TestCompleteProcessed": (fromApp + "TestCompleteProcessed", ua.VariantType.Boolean, False),
+        "TestAbortProcessed": (fromApp + "TestAbortProcessed", ua.VariantType.Boolean, False),
+        "OMSTestComplete": (toApp + "OMSTestComplete", ua.VariantType.Boolean, False),
+        "OMSTestAborted": (toApp + "OMSTestAborted", ua.VariantType.Boolean, False),
+        "CameraExposure": (toApp + "CameraExposure", ua.VariantType.Float, 1.0),
+        "PyroMultiplicationFactor": (toApp + "PyroMultiplicationFactor", ua.VariantType.Float, 1.0),
+        "ComPortNumber": (toApp + "ComPortNumber", ua.VariantType.UInt16, 1)
+        }
+
+    def __init__(self, endpoint="opc.tcp://127.0.0.1:4850", numberOfPixels=4, heartbeatPeriodSec=0.2, pollIntervalSec=0.001) -> None:
+        self.endpoint = endpoint
+        self.numberOfPixels = numberOfPixels
+        self.heartbeatPeriodSec = heartbeatPeriodSec
+        self.pollIntervalSec = pollIntervalSec  ## how often the response tags are checked while waiting on the app
+        self.onPowerLevel = None                ## called with the commanded watts before every capture, e.g. to drive a FakeOphirCOM
+        self.latencies = {}                     ## command -> [seconds from command set to response set, ...]
+        self.resetLatencies = {}                ## command -> [seconds from command cleared to response cleared, ...]
+        self.failures = {}                      ## command -> number of commands without a response before the timeout
+        self.pixelCycleTimes = []               ## seconds from InitializePixel to PixelProcessed per pixel
+        self.levelFiringTimes = []              ## seconds the laser fired per power level before the capture
+        self.nodes = {}
+        self._heartbeatStop = threading.Event()
+        self._heartbeatThread = None
+        self.heartbeatLatencies = []            ## seconds from HeartbeatOut to the matching HeartbeatIn
+
+        self.server = Server()
+        self.server.set_endpoint(endpoint)
+        self.server.set_server_name("Gen3 Calibration PLC Simulator")
+        # the app addresses everything in namespace 6, register fillers so the real namespace lands on that index
+        idx = self.server.register_namespace("urn:plcsim")
+        while idx < self.namespaceIndex:
+            idx = self.server.register_namespace("urn:plcsim:" + str(idx + 1))
+        folder = self.server.get_objects_node().add_object(ua.NodeId("PlcSimulator", idx), "PlcSimulator")
+        for name, (path, variantType, value) in self.tagTypes.items():
+            if name == "VFPMap":
+                variant = ua.Variant(self.vfpMap(), variantType)
+            elif name == "RetestPixelMask":
+                variant = ua.Variant([0] * (self.numberOfPixels + 1), variantType)
+            else:
+                variant = ua.Variant(value, variantType)
+            node = folder.add_variable(ua.NodeId(self.tagPrefix + path, idx), path, variant)
+            if name == "RetestPixelMask":
+                # declared length so the app writes it as an array
+                node.set_attribute(ua.AttributeIds.ValueRank, ua.DataValue(ua.Variant(ua.ValueRank.OneDimension, ua.VariantType.Int32)))
+                node.set_attribute(ua.AttributeIds.ArrayDimensions, ua.DataValue(ua.Variant([self.numberOfPixels + 1], ua.VariantType.UInt32)))
+            node.set_writable()
+            self.nodes[name] = node
+
+    @staticmethod
+    def nodeId(name):
+        return "ns=" + str(PlcSimulator.namespaceIndex) + ";s=" + PlcSimulator.tagPrefix + PlcSimulator.tagTypes[name][0]
+
+    ## [[Pixel, Enable, Rack, Laser], ...] with 21 lasers per rack
+    def vfpMap(self):
+        return [[pixel + 1, 1, pixel // 21 + 1, pixel % 21 + 1] for pixel in range(self.numberOfPixels)]
+
+    def start(self):
+        self.server.start()
+        self._heartbeatStop.clear()
+        self._heartbeatThread = threading.Thread(target=self._heartbeat, name="PlcSimHeartbeat", daemon=True)
+        self._heartbeatThread.start()
+
+    def stop(self):
+        self._heartbeatStop.set()
+        if self._heartbeatThread is not None:
+            self._heartbeatThread.join(2)
+        self.server.stop()
+
+    def setValue(self, name, value):
+        self.nodes[name].set_value(ua.Variant(value, self.tagTypes[name][1]))
+
+    def getValue(self, name):
+        return self.nodes[name].get_value()
+
+    ## Waits until any (or all) of the tags satisfy check, returns the elapsed seconds or None on timeout
+    def waitFor(self, names, check, timeoutSec, requireAll=False):
+        start = time.perf_counter()
+        combine = all if requireAll else any
+        while True:
+            if combine(check(self.getValue(name)) for name in names):
+                return time.perf_counter() - start
+            if time.perf_counter() - start > timeoutSec:
+                return None
+            time.sleep(self.pollIntervalSec)
+
+    ## Sets a command, waits for one of its responses, then clears the command and waits for the response reset like the PLC does
+    ## Returns the command to response latency in seconds, None if the app did not respond in time
+    def sendCommand(self, command, responses, timeoutSec=30.0):
+        self.setValue(command, True)
+        latency = self.waitFor(responses, bool, timeoutSec)
+        self.setValue(command, False)
+        if latency is None:
+            self.failures[command] = self.failures.get(command, 0) + 1
+            print("PLC simulator: no response to " + command + " within " + str(timeoutSec) + " s")
+        else:
+            self.latencies.setdefault(command, []).append(latency)
+        resetLatency = self.waitFor(responses, lambda value: not value, timeoutSec, requireAll=True)
+        if resetLatency is not None:
+            self.resetLatencies.setdefault(command, []).append(resetLatency)
+        return latency
+
+    ## Scripts a calibration: initialize, for every pixel initialize/capture each power level/process, process the calibration and upload the LUTs
+    ## A recalibration (testType 5) only goes through the pixels of the RetestPixelMask the app wrote when initializing
+    def runCalibration(self, testType=0, pulseOnMsec=5.0, numPulsesPerLevel=10, startingPowerLevel=24, numPowerLevelSteps=5, powerLevelIncrement=20,
+                       captureDelaySec=0.0, uploadLuts=True, timeoutSec=30.0, adaptive=False):
+        self.setValue("TestType", testType)
+        self.setValue("pulseOnMsec", pulseOnMsec)
+        self.setValue("numPulsesPerLevel", numPulsesPerLevel)
+        self.setValue("startingPowerLevel", startingPowerLevel)
+        self.setValue("numPowerLevelSteps", numPowerLevelSteps)
+        self.setValue("powerLevelIncrement", powerLevelIncrement)
+        self.setValue("VFPMap", self.vfpMap())
+        start = time.perf_counter()
+        self.sendCommand("InitializeCalibration", ["CalibrationInitialized"], timeoutSec)
+        pixels = range(1, self.numberOfPixels + 1)
+        if testType == 5:
+            retestMask = self.getValue("RetestPixelMask")
+            pixels = [pixel for pixel in pixels if retestMask[pixel - 1]]
+        for pixel in pixels:
+            pixelStart = time.perf_counter()
+            self.setValue("ActivePixel", pixel)
+            self.sendCommand("InitializePixel", ["PixelInitialized"], timeoutSec)
+            for powerLevel in range(numPowerLevelSteps):
+                watts = (startingPowerLevel + powerLevelIncrement * powerLevel) * 525/255
+                self.setValue("CurrentPowerWatts", watts)
+                if self.onPowerLevel is not None:
+                    self.onPowerLevel(watts)
+                # laser firing the pulses of the level, with adaptive sampling until the app reports the level complete
+                levelStart = time.perf_counter()
+                if adaptive:
+                    self.waitFor(["LevelSampleComplete"], bool, captureDelaySec)
+                else:
+                    time.sleep(captureDelaySec)
+                self.levelFiringTimes.append(time.perf_counter() - levelStart)
+                self.sendCommand("CapturePixel", ["PixelCaptured", "ErrorCaptureFailed"], timeoutSec)
+            self.sendCommand("ProcessPixel", ["PixelProcessed"], timeoutSec)
+            self.pixelCycleTimes.append(time.perf_counter() - pixelStart)
+        self.sendCommand("ProcessCalibration", ["CalibrationProcessed"], timeoutSec)
+        if uploadLuts:
+            if testType == 5: # the app uploads the LUTs of CurrentLUTID, the PLC switches to the ID the recalibration generated
+                self.setValue("CurrentLUTID", self.getValue("GeneratedLUTID"))
+            self.sendCommand("UploadCalibratedLUTs", ["LUTsUploaded"], timeoutSec)
+        return time.perf_counter() - start
+
+    ## Latency distribution in ms per command: count, min, median, p95, max and the number of timeouts
+    def latencyReport(self):
+        report = {}
+        commands = list(self.latencies) + [command for command in self.failures if command not in self.latencies]
+        if self.heartbeatLatencies:
+            commands.append("Heartbeat")
+        for command in commands:
+            latencies = np.array(self.heartbeatLatencies if command == "Heartbeat" else self.latencies.get(command, [])) * 1000
+            stats = {"count": len(latencies), "timeouts": self.failures.get(command, 0)}
+            for key, percentile in (("min", 0), ("median", 50), ("p95", 95), ("max", 100)):
+                stats[key] = np.percentile(latencies, percentile) if len(latencies) else np.nan
+            report[command] = stats
+        return report
+
+    def printLatencyReport(self):
+        print("command".ljust(24) + "count".rjust(7) + "min ms".rjust(10) + "median ms".rjust(11) + "p95 ms".rjust(10) + "max ms".rjust(10) + "timeouts".rjust(10))
+        for command, stats in self.latencyReport().items():
+            print(command.ljust(24) + str(stats["count"]).rjust(7) + "".join(("%.1f" % stats[key]).rjust(width) for key, width in (("min", 10), ("median", 11), ("p95", 10), ("max", 10))) + str(stats["timeouts"]).rjust(10))
+        if self.levelFiringTimes:
+            print("level firing s: mean " + str(round(float(np.mean(self.levelFiringTimes)), 3)) + ", total " + str(round(float(np.sum(self.levelFiringTimes)), 3)))
+        if self.pixelCycleTimes:
+            print("pixel cycle s: mean " + str(round(float(np.mean(self.pixelCycleTimes)), 3)) + ", max " + str(round(float(np.max(self.pixelCycleTimes)), 3)))
+
+    def _heartbeat(self):
+        count = 0
+        while not self._heartbeatStop.is_set():
+            start = time.perf_counter()
+            count += 1
+            self.setValue("HeartbeatOut", count)
+            # only the echo of this beat counts, a late echo of an earlier one does not
+            latency = self.waitFor(["HeartbeatIn"], lambda value: value == count + 1, self.heartbeatPeriodSec)
+            if latency is not None:
+                self.heartbeatLatencies.append(latency)
+            self._heartbeatStop.wait(max(self.heartbeatPeriodSec - (time.perf_counter() - start), 0))
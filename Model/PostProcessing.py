@@ -0,0 +1,276 @@
+import csv
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+import numpy as np
+import pandas as pd
+from ConfigFiles.MachineSettings import MachineSettings
+from Model.LUTDataGeneration import LUTDataManager
+
+## End of test post processing: raw data export, processed results dataframe and LUT generation
+## Runs either inline or in a PostProcessingWorker process. Only plain data goes in and out (PostProcessingJob / PostProcessingResult)
+## and this module doesn't import Model.Model, so the worker process never loads the OPC-UA client, camera or pyrometer drivers
+
+## LUTDataManager attributes produced by the LUT generation, copied back to the model's LUTDataManager
+lutResultAttributes = ["powerLuts", "binaries", "lutStatus", "results_coeff", "results_lut", "fitResiduals", "fitConditionNumbers", "lutBank"]
+
+## Everything the post processing needs from the model at the end of a test
+class PostProcessingJob:
+
+    def __init__(self, measuredPower, laserTestStatus, pulseStatistics, commandedPowerLevels, testSettings, laserSettings, testType, timeStamp,
+                 saveLocation, saveLocationNetwork, testStatusTable, generateLuts, pixelFits=None, baseLutBank=None, retestPixels=None) -> None:
+        self.jobId = 0                                  ## assigned by PostProcessingWorker.submit
+        self.measuredPower = measuredPower              ## per pixel arrays of measured pulse power (W)
+        self.laserTestStatus = list(laserTestStatus)
+        self.pulseStatistics = pulseStatistics          ## PulseLevelStatistics of the test
+        self.commandedPowerLevels = list(commandedPowerLevels)
+        self.testSettings = testSettings
+        self.laserSettings = laserSettings
+        self.testType = str(testType)                   ## as written to the results, the enum lives in Model.Model
+        self.timeStamp = timeStamp
+        self.saveLocation = saveLocation
+        self.saveLocationNetwork = saveLocationNetwork
+        self.testStatusTable = list(testStatusTable)
+        self.generateLuts = generateLuts                ## calibrations also generate the LUTs and their binaries
+        self.pixelFits = pixelFits                      ## LUTDataManager.pixelFits made during the test
+        self.baseLutBank = baseLutBank                  ## recalibration: LUT bank the retested pixels are merged into
+        self.retestPixels = retestPixels                ## recalibration: 0-indexed pixels measured by the test
+        # machine settings changed at runtime (machine and factory IDs, simulation) have to be carried over to the worker process
+        self.machineSettings = {name: value for name, value in vars(MachineSettings).items() if name.startswith("_") and not name.startswith("__") and not callable(value)}
+
+
+class PostProcessingResult:
+
+    def __init__(self, jobId, results, lutResults, durationSec) -> None:
+        self.jobId = jobId
+        self.results = results          ## processed results dataframe
+        self.lutResults = lutResults    ## lutResultAttributes -> value, empty when no LUTs were generated
+        self.durationSec = durationSec
+
+
+## Runs the whole post processing of a job, progress(percent, message) is called between the steps
+def runPostProcessing(job, progress=None):
+    start = time.perf_counter()
+    if progress is None:
+        progress = lambda percent, message: None
+    for name, value in job.machineSettings.items():
+        setattr(MachineSettings, name, value)
+    progress(0, "Exporting data")
+    exportRawData(job)
+    progress(30, "Generating test results")
+    results = generateTestResultDataFrame(job)
+    lutResults = {}
+    if job.generateLuts:
+        progress(60, "Generating LUTs")
+        lutDataManager = LUTDataManager(job.testSettings)
+        lutDataManager.pixelFits = job.pixelFits
+        luts = lutDataManager.convertLaserDataToLUTData(job.measuredPower, None, job.laserTestStatus, job.testSettings._CalId, job.laserSettings,
+                                                        saveLocation=job.saveLocation, saveLocationNetwork=job.saveLocationNetwork, pulseStatistics=job.pulseStatistics,
+                                                        baseLutBank=job.baseLutBank, retestPixels=job.retestPixels)
+        progress(90, "Generating LUT binaries")
+        lutDataManager.convertLUTDataToBinaries(luts)
+        lutResults = {name: getattr(lutDataManager, name) for name in lutResultAttributes}
+    progress(100, "Post processing done")
+    return PostProcessingResult(job.jobId, results, lutResults, time.perf_counter() - start)
+
+
+## Saves the raw data into a project temporary folder and the save locations
+def exportRawData(job):
+    fullRankVal = max([len(pixelData) for pixelData in job.measuredPower])
+    # rows are zero filled to the longest pixel so the csv stays rectangular
+    rawRows = [[pixelIdx + 1] + [job.laserTestStatus[pixelIdx]] + list(pixelTested) + [0.0] * (fullRankVal - len(pixelTested)) for pixelIdx, pixelTested in enumerate(job.measuredPower)]
+    for rawPath in ['tmp\LPM_raw.csv', os.path.join(job.saveLocation, 'LPM_Raw.csv'), os.path.join(job.saveLocationNetwork, 'LPM_Raw.csv')]:
+        with open(rawPath, 'w', newline='') as csvfile:
+            rawOutputWriter = csv.writer(csvfile, delimiter=',')
+            rawOutputWriter.writerows(rawRows)
+
+
+## Creating the dataframe for the process team and the database team
+## Dataframe headers are ["DateTime", "Factory", "Machine", "TestType", "Pixel", "Rack", "Laser", "Status", "Commanded Power", "Pulse Power Average", "Pulse Power Stdv", "Pulse Power Deviation"]
+## saves to local temporary folder which is rewritten every test and the printerinfo drive
+def generateTestResultDataFrame(job):
+    pulseStats = job.pulseStatistics.rounded(decimals=3)
+    numPixels, numLevels = pulseStats.numberOfPixels, pulseStats.numberOfLevels
+    numRows = numPixels * numLevels
+    vfpMap = job.laserSettings.vfpMap
+    testedPixels = np.array(job.laserTestStatus[:numPixels]) != 5
+    outputData = {
+        "Date": [job.timeStamp.strftime("%Y-%m-%d, %H:%M:%S")] * numRows,
+        "Machine ID": [MachineSettings._machineID] * numRows,
+        "Factory ID": [MachineSettings._factoryID] * numRows,
+        "Test Type": [job.testType] * numRows,
+        "Pixel": np.repeat(np.arange(1, numPixels + 1), numLevels),
+        "Rack": np.repeat([vfpMap[pixelIdx][2] for pixelIdx in range(numPixels)], numLevels),
+        "Laser": np.repeat([vfpMap[pixelIdx][3] for pixelIdx in range(numPixels)], numLevels),
+        "Process Acceptance": (pulseStats.deviation < 5).ravel(),
+        "Status": np.repeat([job.testStatusTable[job.laserTestStatus[pixelIdx]] for pixelIdx in range(numPixels)], numLevels),
+        "Commanded Power": np.where(testedPixels[:, None], [round(level, 2) for level in job.commandedPowerLevels], np.nan).ravel(),
+        "Pulse Power Average": pulseStats.mean.ravel(),
+        "Pulse Power Stdv": pulseStats.stdev.ravel(),
+        "Pulse Power Deviation": pulseStats.deviation.ravel(),
+        "Data Points": pulseStats.count.ravel()
+        }
+    cols =["Date", "Machine ID", "Factory ID", "Test Type", "Pixel", "Rack", "Laser", "Process Acceptance", "Status", "Commanded Power", "Pulse Power Average", "Pulse Power Stdv", "Pulse Power Deviation", "Data Points"] # add rack and laser printer name, name of test(CVER, DVER....), timestamp
+    results = pd.DataFrame(outputData, columns=cols)
+    results.to_csv(os.path.join("tmp", "LPM_processed.csv"), index=False)
+    results.to_csv(os.path.join(job.saveLocation, "LPM_processed.csv"), index=False)
+    results.to_csv(os.path.join(job.saveLocationNetwork, "LPM_processed.csv"), index=False)
+    validRanges = ["ValidRanges"]
+    validRanges.append(validPixelRanges(results, job.laserSettings.numberOfPixels))
+    with open(os.path.join(job.saveLocation, 'summary.csv'), 'w', newline='') as summaryFile:
+        writer = csv.writer(summaryFile)
+        writer.writerows(testSummary(results))
+        writer.writerow(validRanges)
+    return results
+
+
+def testSummary(results):
+    summary = results.groupby("Commanded Power", as_index=False)[['Pulse Power Average', "Pulse Power Stdv", "Pulse Power Deviation"]].mean()
+    summary = np.round(summary.to_numpy(), decimals=3).astype('str')
+    summary = np.insert(summary, 0, ['Commanded Power', 'Total Power Average', 'Total Average Power Stdv', 'Total Average Power Deviation'], axis=0).tolist()
+    return summary
+
+
+def validPixelRanges(results, numberOfPixels):
+    passedPixels = results.loc[results["Status"] == "Passed"]["Pixel"].to_numpy()
+    validRanges = []
+    startRange = 1
+    for pixel in range(1, numberOfPixels+1):
+        if pixel not in passedPixels and startRange is not None:
+            validRanges.append([startRange, pixel-1])
+            startRange = None
+        elif startRange is None and pixel in passedPixels:
+            startRange = pixel
+    return validRanges
+
+
+## Loop of the worker process: runs jobs until it gets None, reports ("progress", jobId, percent, message), ("result", jobId, result)
+## or ("error", jobId, traceback) messages
+def _workerMain(jobQueue, messageQueue):
+    while True:
+        job = jobQueue.get()
+        if job is None:
+            return
+        try:
+            result = runPostProcessing(job, lambda percent, message: messageQueue.put(("progress", job.jobId, percent, message)))
+            messageQueue.put(("result", job.jobId, result))
+        except Exception:
+            messageQueue.put(("error", job.jobId, traceback.format_exc()))
+
+
+## Runs post processing jobs in a separate process so the pandas, CSV and LUT work doesn't hold the GIL of the process answering the PLC
+## Jobs run one at a time in submission order. A listener thread turns the worker's messages into the onProgress(jobId, percent, message),
+## onResult(result) and onError(jobId, message) callbacks; they run on the listener thread and should hand longer work off.
+## A worker process that dies fails its pending jobs and is restarted on the next submit
+class PostProcessingWorker:
+
+    def __init__(self, onProgress=None, onResult=None, onError=None) -> None:
+        self.onProgress = onProgress
+        self.onResult = onResult
+        self.onError = onError
+        self._context = multiprocessing.get_context("spawn") # same start method on Windows and Linux, the worker starts from a clean interpreter
+        self._jobQueue = None
+        self._messageQueue = None
+        self._process = None
+        self._listener = None
+        self._stopEvent = threading.Event()
+        self._lock = threading.Lock()
+        self._nextJobId = 1
+        self._pending = {}          ## jobId -> submit time
+        # metrics
+        self.completed = 0
+        self.failed = 0
+        self.maxDurationSec = 0.0   ## longest submit to result time
+
+    @property
+    def isRunning(self):
+        return self._process is not None and self._process.is_alive()
+
+    @property
+    def pending(self):
+        with self._lock:
+            return len(self._pending)
+
+    ## Starts the worker process; it takes a moment to import pandas, so start it well before the first job
+    def start(self):
+        if self.isRunning:
+            return
+        self._jobQueue = self._context.Queue()
+        self._messageQueue = self._context.Queue()
+        self._process = self._context.Process(target=_workerMain, args=(self._jobQueue, self._messageQueue), name="PostProcessing", daemon=True)
+        self._process.start()
+        self._stopEvent.clear()
+        self._listener = threading.Thread(target=self._listen, args=(self._process, self._messageQueue), name="PostProcessingListener", daemon=True)
+        self._listener.start()
+
+    def stop(self, timeout=5.0):
+        self._stopEvent.set()
+        if self._process is not None:
+            self._jobQueue.put(None)
+            self._process.join(timeout)
+            if self._process.is_alive():
+                self._process.terminate()
+        if self._listener is not None:
+            self._listener.join(timeout)
+        self._process = None
+        self._listener = None
+
+    ## Queues a job, returns its job ID
+    def submit(self, job):
+        self.start()
+        with self._lock:
+            job.jobId = self._nextJobId
+            self._nextJobId += 1
+            self._pending[job.jobId] = time.perf_counter()
+        self._jobQueue.put(job)
+        return job.jobId
+
+    def stats(self):
+        return {"completed": self.completed, "failed": self.failed, "pending": self.pending, "maxDurationSec": self.maxDurationSec}
+
+    def _listen(self, process, messageQueue):
+        while True:
+            try:
+                message = messageQueue.get(timeout=0.2)
+            except queue.Empty:
+                if not process.is_alive():
+                    self._failPending("post processing worker exited with code " + str(process.exitcode))
+                    return
+                if self._stopEvent.is_set():
+                    return
+                continue
+            kind, jobId = message[0], message[1]
+            if kind == "progress":
+                self._callback(self.onProgress, jobId, message[2], message[3])
+                continue
+            with self._lock:
+                submitTime = self._pending.pop(jobId, None)
+                if submitTime is not None:
+                    self.maxDurationSec = max(self.maxDurationSec, time.perf_counter() - submitTime)
+                if kind == "result":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+            if kind == "result":
+                self._callback(self.onResult, message[2])
+            else:
+                self._callback(self.onError, jobId, message[2])
+
+    def _failPending(self, errorMessage):
+        with self._lock:
+            jobIds = list(self._pending)
+            self._pending.clear()
+            self.failed += len(jobIds)
+        for jobId in jobIds:
+            self._callback(self.onError, jobId, errorMessage)
+
+    def _callback(self, callback, *args):
+        if callback is None:
+            return
+        try:
+            callback(*args)
+        except Exception as e:
+            print("post processing callback " + str(getattr(callback, "__name__", callback)) + " failed: " + str(e))
@@ -0,0 +1,287 @@
+import functools
+import math
+import numpy as np
+
+## Per (pixel, power level) statistics of the pulse data captured during a test
+## Every array is shaped (pixels, levels). Levels without data have a count of 0 and NaN statistics
+class PulseLevelStatistics:
+
+    def __init__(self, mean, stdev, count, commandedPowerLevels) -> None:
+        self.commandedPowerLevels = np.asarray(commandedPowerLevels, dtype=float)
+        self.mean = mean    ## average pulse power per level (W)
+        self.stdev = stdev  ## sample standard deviation of the pulse power per level (W), NaN with less than 2 pulses
+        self.count = count  ## number of pulses captured per level
+        self.deviation = percentDiff(self.mean, self.commandedPowerLevels)  ## percent deviation of the average from the commanded power
+
+    @property
+    def numberOfPixels(self):
+        return self.mean.shape[0]
+
+    @property
+    def numberOfLevels(self):
+        return self.mean.shape[1]
+
+    ## Copy of the statistics rounded for reporting. The deviation is derived from the rounded average
+    ## so the reported columns stay consistent with each other
+    def rounded(self, decimals=3):
+        roundedStats = PulseLevelStatistics(np.round(self.mean, decimals), np.round(self.stdev, decimals), self.count, self.commandedPowerLevels)
+        roundedStats.deviation = np.round(roundedStats.deviation, decimals)
+        return roundedStats
+
+    ## True for the pixels that have data at every power level
+    def completePixels(self):
+        return np.all(self.count > 0, axis=1)
+
+
+## Per (pixel, power level) pulse power statistics updated chunk by chunk while the test runs
+## Each chunk is merged into the running count, mean and sum of squared deviations with the pairwise update of Chan et al.,
+## so the statistics of a pixel are final as soon as its last capture is in and the end of test only has to read them out.
+## Values are taken at the float32 precision of PyrometerSampleStore so the results match the stored raw data
+class RunningPulseStatistics:
+
+    def __init__(self, numberOfPixels, commandedPowerLevels) -> None:
+        self.commandedPowerLevels = np.asarray(commandedPowerLevels, dtype=float)
+        shape = (numberOfPixels, len(self.commandedPowerLevels))
+        self.count = np.zeros(shape, dtype=int)
+        self.mean = np.full(shape, np.nan)
+        self.sumOfSquares = np.zeros(shape)  ## sum of squared deviations from the mean
+
+    ## Merges the measured power of one capture into the statistics of its pixel (0-indexed) and power level
+    ## A capture without a power level (None, commanded power off the test levels) is left out
+    def addChunk(self, pixel, powerLevel, measuredPower):
+        measuredPower = np.asarray(measuredPower, dtype=np.float32).astype(float).ravel()
+        if len(measuredPower) == 0 or powerLevel is None or not 0 <= powerLevel < self.count.shape[1]:
+            return
+        self.count[pixel, powerLevel], self.mean[pixel, powerLevel], self.sumOfSquares[pixel, powerLevel] = mergeMoments(
+            self.count[pixel, powerLevel], self.mean[pixel, powerLevel], self.sumOfSquares[pixel, powerLevel], measuredPower)
+
+    ## Snapshot of the current statistics of every pixel
+    def statistics(self):
+        stdev = np.full(self.mean.shape, np.nan)
+        multiple = self.count > 1
+        stdev[multiple] = np.sqrt(self.sumOfSquares[multiple] / (self.count[multiple] - 1))
+        return PulseLevelStatistics(self.mean.copy(), stdev, self.count.copy(), self.commandedPowerLevels)
+
+
+## Index of the power level a commanded power (W) is, None when it is not within toleranceWatts of one of the commanded power levels
+## (between two steps, outside the steps of the test). The PLC sends the power as a float so exact equality can't be used
+def powerLevelIndex(commandedPower, commandedPowerLevels, toleranceWatts=0.01):
+    commandedPowerLevels = np.asarray(commandedPowerLevels, dtype=float)
+    if len(commandedPowerLevels) == 0:
+        return None
+    powerLevel = int(np.argmin(np.abs(commandedPowerLevels - commandedPower)))
+    if not abs(commandedPowerLevels[powerLevel] - commandedPower) <= toleranceWatts:
+        return None
+    return powerLevel
+
+
+## Running confidence interval of the mean pulse power of the level being fired, decides when enough pulses were collected
+## The level is done ("pass") once at least minPulses pulses are in, the confidence interval of the mean lies inside the tolerance band
+## and its half width is at most precisionPercent of the mean; or ("fail") once the whole interval lies outside the band
+class LevelConfidenceTracker:
+
+    def __init__(self, expectedPower, tolerancePercent, confidence=0.95, minPulses=5, precisionPercent=1.0) -> None:
+        self.expectedPower = expectedPower
+        self.tolerancePercent = tolerancePercent
+        self.confidence = confidence
+        self.minPulses = max(minPulses, 2)
+        self.precisionPercent = precisionPercent
+        self.count = 0
+        self.mean = np.nan
+        self.sumOfSquares = 0.0
+        self.decision = None    ## None while more pulses are needed, then "pass" or "fail"
+
+    def addPulses(self, power):
+        power = np.asarray(power, dtype=float).ravel()
+        if len(power) > 0:
+            self.count, self.mean, self.sumOfSquares = mergeMoments(self.count, self.mean, self.sumOfSquares, power)
+
+    ## Half width of the confidence interval of the mean (W), infinite with less than 2 pulses
+    def halfWidth(self):
+        if self.count < 2:
+            return np.inf
+        stdev = np.sqrt(self.sumOfSquares / (self.count - 1))
+        return studentQuantile(self.confidence, self.count - 1) * stdev / np.sqrt(self.count)
+
+    ## Updates and returns the decision
+    def evaluate(self):
+        if self.decision is not None or self.count < self.minPulses:
+            return self.decision
+        halfWidth = self.halfWidth()
+        upper = self.expectedPower * (1 + self.tolerancePercent/100)
+        lower = self.expectedPower * (1 - self.tolerancePercent/100)
+        if self.mean + halfWidth < lower or self.mean - halfWidth > upper:
+            self.decision = "fail"
+        elif lower <= self.mean - halfWidth and self.mean + halfWidth <= upper and halfWidth <= abs(self.mean) * self.precisionPercent/100:
+            self.decision = "pass"
+        return self.decision
+
+
+## Merges the values of a chunk into a running count, mean and sum of squared deviations (Chan et al. pairwise update)
+def mergeMoments(count, mean, sumOfSquares, values):
+    chunkCount = len(values)
+    chunkMean = values.mean()
+    chunkSumOfSquares = ((values - chunkMean) ** 2).sum()
+    if count == 0:
+        return chunkCount, chunkMean, chunkSumOfSquares
+    total = count + chunkCount
+    delta = chunkMean - mean
+    return total, mean + delta * chunkCount / total, sumOfSquares + chunkSumOfSquares + delta * delta * count * chunkCount / total
+
+
+## z with P(-z < Z < z) = confidence for a standard normal Z, erf inverted by bisection
+def normalQuantile(confidence):
+    lower, upper = 0.0, 40.0
+    for iteration in range(100):
+        middle = (lower + upper) / 2
+        if math.erf(middle / math.sqrt(2)) < confidence:
+            lower = middle
+        else:
+            upper = middle
+    return (lower + upper) / 2
+
+
+## P(-t < T < t) for a Student t with an integer number of degrees of freedom, closed form of Abramowitz & Stegun 26.7.3 and 26.7.4
+def studentProbability(t, degreesOfFreedom):
+    theta = math.atan(t / math.sqrt(degreesOfFreedom))
+    cos2 = math.cos(theta) ** 2
+    if degreesOfFreedom % 2 == 1:
+        term, series = math.cos(theta), 0.0
+        for k in range(1, (degreesOfFreedom - 1) // 2 + 1): # cos(theta) + 2/3 cos^3(theta) + ... up to cos^(v-2)
+            series += term
+            term *= cos2 * (2*k) / (2*k + 1)
+        return 2 / math.pi * (theta + math.sin(theta) * series)
+    term, series = 1.0, 0.0
+    for k in range(degreesOfFreedom // 2): # 1 + 1/2 cos^2(theta) + 1*3/(2*4) cos^4(theta) + ... up to cos^(v-2)
+        series += term
+        term *= cos2 * (2*k + 1) / (2*k + 2)
+    return math.sin(theta) * series
+
+
+## t with P(-t < T < t) = confidence for a Student T. Exact up to 30 degrees of freedom (the closed form inverted by bisection),
+## above that from the normal quantile (Cornish-Fisher expansion), which is within 0.01% there. Cached, the tracker asks for it on every poll
+@functools.lru_cache(maxsize=256)
+def studentQuantile(confidence, degreesOfFreedom):
+    v = int(degreesOfFreedom)
+    if v <= 30:
+        lower, upper = 0.0, 1e7
+        for iteration in range(200):
+            middle = (lower + upper) / 2
+            if studentProbability(middle, v) < confidence:
+                lower = middle
+            else:
+                upper = middle
+        return (lower + upper) / 2
+    z = normalQuantile(confidence)
+    return z + (z**3 + z) / (4*v) + (5*z**5 + 16*z**3 + 3*z) / (96*v**2) + (3*z**7 + 19*z**5 + 17*z**3 - 15*z) / (384*v**3)
+
+
+## Evaluation of the pulses captured for one pixel at one power level
+## Only pulses with a zero device status are kept; pulseStatus holds the test status code of every kept pulse
+## (1 pass, 2 high power, 3 low power, 4 no power) and status the one reported for the capture: pass, or the code of the last failing pulse
+class PulseCaptureEvaluation:
+
+    def __init__(self, power, energy, timestamps, pulseStatus, rejectedPulses) -> None:
+        self.power = power                      ## measured power of the kept pulses (W)
+        self.energy = energy                    ## measured energy of the kept pulses (J)
+        self.timestamps = timestamps            ## device timestamps of the kept pulses (ms)
+        self.pulseStatus = pulseStatus          ## per pulse test status code
+        self.rejectedPulses = rejectedPulses    ## pulses dropped for a non-zero device status
+        failures = np.flatnonzero(pulseStatus != 1)
+        self.status = int(pulseStatus[failures[-1]]) if len(failures) > 0 else 1
+        self.maxPower = float(max(power.max(), 0)) if len(power) > 0 else 0.0
+
+    def __len__(self):
+        return len(self.power)
+
+
+## Evaluates a capture from the pyrometer arrays in one pass, same rules as the per pulse checks it replaces:
+## above the tolerance band is high power, below it low power, and below 5% of the expected power no power
+def evaluatePulseCapture(values, timestamps, statuses, multiplicationFactor, pulseOnMsec, expectedPower, tolerancePercent):
+    kept = np.asarray(statuses) == 0
+    energy = np.asarray(values, dtype=float)[kept] * multiplicationFactor
+    power = energy / (pulseOnMsec / 1000)
+    pulseStatus = np.select([power > expectedPower * (1 + tolerancePercent/100),
+                             power < expectedPower * (1 - tolerancePercent/100),
+                             power < expectedPower * 0.05],
+                            [2, 3, 4], default=1).astype(np.uint8)
+    return PulseCaptureEvaluation(power, energy, np.asarray(timestamps, dtype=float)[kept], pulseStatus, int(len(kept) - kept.sum()))
+
+
+## Vectorized equivalent of Model.percentDiff for arrays; NaN inputs stay NaN
+def percentDiff(numA, numB):
+    numA, numB = np.broadcast_arrays(np.asarray(numA, dtype=float), np.asarray(numB, dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        diff = (np.abs(numA - numB) / numB) * 100.0
+    diff[numA == numB] = 0
+    diff[(numB == 0) & (numA != numB) & ~np.isnan(numA)] = np.inf
+    return diff
+
+
+## Splits the pulse data of every pixel into power levels and computes the per level statistics in one pass
+## A new level starts wherever the commanded power of a pixel increases, the n-th segment of a pixel is its n-th power level
+## laserTestData and commandedPowerData are sequences (one entry per pixel) of per pulse measured and commanded power
+def computePulseLevelStatistics(laserTestData, commandedPowerData, commandedPowerLevels):
+    numPixels = len(laserTestData)
+    numLevels = len(commandedPowerLevels)
+    mean = np.full((numPixels, numLevels), np.nan)
+    stdev = np.full((numPixels, numLevels), np.nan)
+    count = np.zeros((numPixels, numLevels), dtype=int)
+    if numPixels == 0 or numLevels == 0:
+        return PulseLevelStatistics(mean, stdev, count, commandedPowerLevels)
+
+    measured = [np.asarray(pixelData, dtype=float).ravel() for pixelData in laserTestData]
+    commanded = [np.asarray(pixelData, dtype=float).ravel() for pixelData in commandedPowerData]
+    measuredLengths = np.array([len(pixelData) for pixelData in measured], dtype=np.intp)
+    commandedLengths = np.array([len(pixelData) for pixelData in commanded], dtype=np.intp)
+    measuredOffsets = np.concatenate(([0], np.cumsum(measuredLengths)[:-1]))
+    commandedOffsets = np.concatenate(([0], np.cumsum(commandedLengths)[:-1]))
+    measured = np.concatenate(measured)
+    commanded = np.concatenate(commanded)
+
+    # change points: first sample after a commanded power increase, ignoring steps across pixel boundaries
+    commandedPixel = np.repeat(np.arange(numPixels), commandedLengths)
+    changeIdx = np.flatnonzero((np.diff(commanded) > 0) & (commandedPixel[1:] == commandedPixel[:-1])) + 1
+    changePixel = commandedPixel[changeIdx]
+    changeLocal = np.minimum(changeIdx - commandedOffsets[changePixel], measuredLengths[changePixel])
+
+    # segment starts per pixel: sample 0 of every pixel with data followed by its change points
+    pixelsWithData = np.flatnonzero(measuredLengths > 0)
+    keep = measuredLengths[changePixel] > 0
+    segmentPixel = np.concatenate((pixelsWithData, changePixel[keep]))
+    segmentLocal = np.concatenate((np.zeros(len(pixelsWithData), dtype=np.intp), changeLocal[keep]))
+    order = np.lexsort((segmentLocal, segmentPixel))
+    segmentPixel = segmentPixel[order]
+    segmentLocal = segmentLocal[order]
+    if len(segmentPixel) == 0:
+        return PulseLevelStatistics(mean, stdev, count, commandedPowerLevels)
+    segmentStart = measuredOffsets[segmentPixel] + segmentLocal
+    segmentStop = np.append(segmentStart[1:], len(measured))
+    lastOfPixel = np.append(segmentPixel[1:] != segmentPixel[:-1], True)
+    segmentStop[lastOfPixel] = measuredOffsets[segmentPixel[lastOfPixel]] + measuredLengths[segmentPixel[lastOfPixel]]
+    segmentCount = segmentStop - segmentStart
+    firstOfPixel = np.concatenate(([True], segmentPixel[1:] != segmentPixel[:-1]))
+    segmentLevel = np.arange(len(segmentPixel)) - np.maximum.accumulate(np.where(firstOfPixel, np.arange(len(segmentPixel)), 0))
+
+    # the non-empty segments partition the samples, so reduceat gives exact per segment sums
+    # values are shifted by the first sample of their segment to keep the sum of squares well conditioned
+    nonEmpty = segmentCount > 0
+    starts = segmentStart[nonEmpty]
+    counts = segmentCount[nonEmpty]
+    shift = measured[starts]
+    shifted = measured - np.repeat(shift, counts)
+    sums = np.add.reduceat(shifted, starts)
+    sumsOfSquares = np.add.reduceat(shifted * shifted, starts)
+
+    inRange = segmentLevel[nonEmpty] < numLevels
+    pixelIdx = segmentPixel[nonEmpty][inRange]
+    levelIdx = segmentLevel[nonEmpty][inRange]
+    counts = counts[inRange]
+    sums = sums[inRange]
+    sumsOfSquares = sumsOfSquares[inRange]
+    count[pixelIdx, levelIdx] = counts
+    mean[pixelIdx, levelIdx] = shift[inRange] + sums / counts
+    multiple = counts > 1
+    variance = (sumsOfSquares[multiple] - sums[multiple] * sums[multiple] / counts[multiple]) / (counts[multiple] - 1)
+    stdev[pixelIdx[multiple], levelIdx[multiple]] = np.sqrt(np.maximum(variance, 0))
+    return PulseLevelStatistics(mean, stdev, count, commandedPowerLevels)
@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+import numpy as np
+
+try:
+    import pythoncom # COM has to be initialized on every thread that talks to the Juno
+except ImportError:
+    pythoncom = None
+
+## Background acquisition for the Juno pyrometer
+## Polls GetData at a fixed rate while the pyrometer is streaming so the COM driver buffer never fills up between PLC commands,
+## and decodes every chunk into numpy arrays off the command path. Chunks wait in a bounded queue until OphirJunoCOM.updateData drains them.
+## When the queue is full the oldest chunk is dropped and counted as an overrun
+class PyroAcquisitionWorker:
+
+    def __init__(self, pyrometer, pollIntervalSec=0.05, maxQueuedChunks=256) -> None:
+        self.pyrometer = pyrometer
+        self.pollIntervalSec = pollIntervalSec
+        self._queue = queue.Queue(maxsize=maxQueuedChunks)
+        self._stopEvent = threading.Event()
+        self._thread = None
+        self.polls = 0              ## GetData calls made
+        self.chunks = 0             ## non-empty chunks queued
+        self.samples = 0            ## samples queued
+        self.overruns = 0           ## chunks dropped because the queue was full
+        self.droppedSamples = 0     ## samples in the dropped chunks
+        self.errors = 0             ## GetData calls that raised
+        self.lastError = None
+        self.maxPollSec = 0.0       ## longest GetData call and decode
+        self.lastAnswerTime = None  ## perf_counter time of the last GetData call that returned without an error
+        self.lastSampleTime = None  ## perf_counter time the last GetData call that returned samples was made
+
+    @property
+    def isRunning(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def queueDepth(self):
+        return self._queue.qsize()
+
+    def start(self):
+        if self.isRunning:
+            return
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, name="PyroAcquisition", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stopEvent.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    ## Removes and returns every queued chunk as a list of (values, timestamps, statuses) arrays
+    def drain(self):
+        chunks = []
+        while True:
+            try:
+                chunks.append(self._queue.get_nowait())
+            except queue.Empty:
+                return chunks
+
+    ## Drops every queued chunk, returns the number of samples discarded
+    def discard(self):
+        return sum(len(chunk[0]) for chunk in self.drain())
+
+    def stats(self):
+        return {"polls": self.polls, "chunks": self.chunks, "samples": self.samples, "overruns": self.overruns,
+                "droppedSamples": self.droppedSamples, "errors": self.errors, "queueDepth": self.queueDepth, "maxPollSec": self.maxPollSec}
+
+    def _run(self):
+        if pythoncom is not None:
+            pythoncom.CoInitialize()
+        try:
+            while not self._stopEvent.is_set():
+                start = time.perf_counter()
+                if self.pyrometer.isStreaming:
+                    self.poll()
+                self._stopEvent.wait(max(self.pollIntervalSec - (time.perf_counter() - start), 0))
+        finally:
+            if pythoncom is not None:
+                pythoncom.CoUninitialize()
+
+    ## One GetData call, also usable without the thread
+    def poll(self):
+        start = time.perf_counter()
+        self.polls += 1
+        try:
+            values, timestamps, statuses = self.pyrometer.OphirCOM.GetData(self.pyrometer.DeviceHandle, 0)
+        except Exception as e:
+            self.errors += 1
+            self.lastError = e
+            return 0
+        self.lastAnswerTime = time.perf_counter()
+        if len(values) == 0:
+            return 0
+        self.lastSampleTime = start
+        streamClock = self.pyrometer.streamClock
+        if streamClock.startTime is None or start > streamClock.startTime: # a call made before a restart returns the previous stream
+            streamClock.observe(self.lastAnswerTime, timestamps[-1])
+        chunk = (np.asarray(values, dtype=np.float64), np.asarray(timestamps, dtype=np.float64), np.asarray(statuses, dtype=np.int32))
+        self._put(chunk)
+        self.chunks += 1
+        self.samples += len(chunk[0])
+        self.maxPollSec = max(self.maxPollSec, time.perf_counter() - start)
+        return len(chunk[0])
+
+    def _put(self, chunk):
+        while True:
+            try:
+                self._queue.put_nowait(chunk)
+                return
+            except queue.Full:
+                try:
+                    dropped = self._queue.get_nowait()
+                except queue.Empty:
+                    continue
+                self.overruns += 1
+                self.droppedSamples += len(dropped[0])
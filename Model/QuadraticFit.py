@@ -0,0 +1,51 @@
+import numpy as np
+
+## Result of a batched quadratic least squares fit, one row per fitted data set (pixel)
+class QuadraticFitResult:
+
+    def __init__(self, coefficients, residuals, conditionNumbers, rank) -> None:
+        self.coefficients = coefficients            ## (N, 3) coefficients, highest power first like np.polyfit
+        self.residuals = residuals                  ## (N,) sum of squared residuals of the fit
+        self.conditionNumbers = conditionNumbers    ## (N,) condition number of the column scaled Vandermonde matrix
+        self.rank = rank                            ## (N,) effective rank of the Vandermonde matrix
+
+    def __len__(self):
+        return len(self.coefficients)
+
+
+## Fits y = a*x^2 + b*x + c to every row of x at once
+## x is shaped (N, points), y is either shared (points,) or per row (N, points)
+## Solves the same column scaled least squares problem as np.polyfit(x[n], y[n], 2) for all rows with one stacked SVD
+## Rows with a NaN or infinite value are not fitted: NaN coefficients and residuals, infinite condition number and rank 0
+def fitQuadratics(x, y, rcond=None):
+    x = np.asarray(x, dtype=float)
+    y = np.broadcast_to(np.asarray(y, dtype=float), x.shape)
+    finite = np.isfinite(x).all(axis=1) & np.isfinite(y).all(axis=1)
+    if not finite.all():
+        fit = fitQuadratics(x[finite], y[finite], rcond)
+        result = QuadraticFitResult(np.full((len(x), 3), np.nan), np.full(len(x), np.nan), np.full(len(x), np.inf), np.zeros(len(x), dtype=int))
+        result.coefficients[finite], result.residuals[finite], result.conditionNumbers[finite], result.rank[finite] = fit.coefficients, fit.residuals, fit.conditionNumbers, fit.rank
+        return result
+    numSets, numPoints = x.shape
+    if numSets == 0:
+        return QuadraticFitResult(np.empty((0, 3)), np.empty(0), np.empty(0), np.empty(0, dtype=int))
+    if rcond is None:
+        rcond = numPoints * np.finfo(float).eps
+
+    # Vandermonde systems for every row: (N, points, 3), columns scaled to unit norm to improve the conditioning
+    vandermonde = np.stack((x * x, x, np.ones_like(x)), axis=2)
+    scale = np.sqrt((vandermonde * vandermonde).sum(axis=1))
+    scale[scale == 0] = 1
+    u, s, vt = np.linalg.svd(vandermonde / scale[:, np.newaxis, :], full_matrices=False)
+
+    # pseudo inverse solve, dropping singular values below rcond like np.linalg.lstsq
+    significant = s > rcond * s[:, :1]
+    sInverse = np.divide(1, s, out=np.zeros_like(s), where=significant)
+    projected = np.einsum('npk,np->nk', u, y) * sInverse
+    coefficients = np.einsum('nkj,nk->nj', vt, projected) / scale
+
+    fitted = np.einsum('npj,nj->np', vandermonde, coefficients)
+    residuals = ((y - fitted) ** 2).sum(axis=1)
+    with np.errstate(divide='ignore'):
+        conditionNumbers = s[:, 0] / s[:, -1] if s.shape[1] == 3 else np.full(numSets, np.inf)
+    return QuadraticFitResult(coefficients, residuals, conditionNumbers, significant.sum(axis=1))
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import deque
+
+## Runs tag reactions on a fixed pool of worker threads instead of a new thread per event
+## Work is queued per key: tasks with the same key run one at a time in submission order, different keys run in parallel.
+## The number of queued tasks is bounded, submit blocks (backpressure on the OPC-UA receive thread) once the limit is reached
+class ReactionDispatcher:
+
+    def __init__(self, numWorkers=4, maxPending=256, name="Reaction") -> None:
+        self.numWorkers = numWorkers
+        self.maxPending = maxPending
+        self._slots = threading.BoundedSemaphore(maxPending)
+        self._lock = threading.Lock()
+        self._ready = deque()                   ## keys with queued work that no worker is running
+        self._readyCondition = threading.Condition(self._lock)
+        self._queues = {}                       ## key -> deque of (submitTime, func, args)
+        self._scheduled = set()                 ## keys that are ready or running
+        self._stopping = False
+        # metrics
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0           ## tasks not queued because submit timed out waiting for a slot
+        self.errors = 0
+        self.maxDepth = 0           ## most tasks queued or running at once
+        self.latencyTotalSec = 0.0  ## sum of submit to start times
+        self.maxLatencySec = 0.0
+        self.maxRunSec = 0.0
+        self._workers = [threading.Thread(target=self._run, name=name + str(i), daemon=True) for i in range(numWorkers)]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def depth(self):
+        with self._lock:
+            return sum(len(tasks) for tasks in self._queues.values())
+
+    ## Queues func(*args) behind the earlier work of the same key
+    ## Waits up to timeout seconds for a free slot when maxPending tasks are queued (forever with None), returns False if it gave up
+    def submit(self, key, func, *args, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            with self._lock:
+                self.rejected += 1
+            print("reaction queue full, dropped " + str(getattr(func, "__name__", func)) + " for " + str(key))
+            return False
+        with self._lock:
+            if self._stopping:
+                self._slots.release()
+                return False
+            tasks = self._queues.setdefault(key, deque())
+            tasks.append((time.perf_counter(), func, args))
+            self.submitted += 1
+            self.maxDepth = max(self.maxDepth, self.submitted - self.completed - self.errors)
+            if key not in self._scheduled:
+                self._scheduled.add(key)
+                self._ready.append(key)
+                self._readyCondition.notify()
+        return True
+
+    def stats(self):
+        finished = self.completed + self.errors
+        return {"submitted": self.submitted, "completed": self.completed, "errors": self.errors, "rejected": self.rejected,
+                "depth": self.depth, "maxDepth": self.maxDepth,
+                "meanLatencySec": self.latencyTotalSec / finished if finished else 0.0,
+                "maxLatencySec": self.maxLatencySec, "maxRunSec": self.maxRunSec}
+
+    ## Stops the workers after the queued work is done (or right away if wait is False)
+    def shutdown(self, wait=True, timeout=5.0):
+        with self._lock:
+            self._stopping = True
+            if not wait:
+                for tasks in self._queues.values():
+                    tasks.clear()
+            self._readyCondition.notify_all()
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._ready and not self._stopping:
+                    self._readyCondition.wait()
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                if not self._queues[key]:
+                    self._scheduled.discard(key)
+                    continue
+                submitTime, func, args = self._queues[key].popleft()
+            start = time.perf_counter()
+            try:
+                func(*args)
+                failed = False
+            except Exception as e:
+                failed = True
+                print("reaction " + str(getattr(func, "__name__", func)) + " for " + str(key) + " failed: " + str(e))
+            runSec = time.perf_counter() - start
+            self._slots.release()
+            with self._lock:
+                if failed:
+                    self.errors += 1
+                else:
+                    self.completed += 1
+                self.latencyTotalSec += start - submitTime
+                self.maxLatencySec = max(self.maxLatencySec, start - submitTime)
+                self.maxRunSec = max(self.maxRunSec, runSec)
+                # the key is handed back only after its task finished so the next one can't overtake it
+                if self._queues[key]:
+                    self._ready.append(key)
+                    self._readyCondition.notify()
+                else:
+                    self._scheduled.discard(key)
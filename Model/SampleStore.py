@@ -0,0 +1,97 @@
+import numpy as np
+
+## Preallocated, growable columnar store for the pyrometer pulses captured during a test
+## One row per pulse; columns are compact numpy arrays that double in size when full so appends stay amortized O(1)
+## Pixels are 0-indexed. Per pixel reads are zero-copy views as long as the pixel's pulses were appended contiguously
+## (the normal case, pixels are tested one after the other); views are only valid until the next append or clear
+class PyrometerSampleStore:
+
+    columnTypes = {
+        "pixel": np.uint16,             ## 0-indexed pixel the pulse belongs to
+        "powerLevel": np.uint16,        ## index of the commanded power level of the pulse, noPowerLevel when it isn't one of the test levels
+        "measuredPower": np.float32,    ## measured pulse power (W)
+        "energy": np.float32,           ## measured pulse energy (J)
+        "commandedPower": np.float32,   ## commanded pulse power (W)
+        "timestamp": np.float64,        ## device timestamp of the pulse (ms), kept in double precision so long runs stay resolvable
+        "pulseStatus": np.uint8         ## test status code of the pulse, 1 pass, 2 high, 3 low, 4 no power
+        }
+    noPowerLevel = np.iinfo(np.uint16).max
+
+    def __init__(self, numberOfPixels, initialCapacity=4096) -> None:
+        self._initialCapacity = max(int(initialCapacity), 1)
+        self.clear(numberOfPixels)
+
+    def __len__(self):
+        return self._size
+
+    ## Drops all samples; optionally resizes the store for a new pixel count
+    def clear(self, numberOfPixels=None):
+        if numberOfPixels is not None:
+            self.numberOfPixels = numberOfPixels
+        self._size = 0
+        self._columns = {name: np.zeros(self._initialCapacity, dtype=dtype) for name, dtype in self.columnTypes.items()}
+        self._pixelRuns = [[] for pixel in range(self.numberOfPixels)] ## [[start, stop], ...] row ranges of each pixel
+
+    def _reserve(self, capacity):
+        currentCapacity = len(self._columns["pixel"])
+        if capacity <= currentCapacity:
+            return
+        newCapacity = max(capacity, 2 * currentCapacity)
+        for name, column in self._columns.items():
+            grown = np.zeros(newCapacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._columns[name] = grown
+
+    def _pixelIndex(self, pixel):
+        pixel = int(pixel)
+        if pixel < 0: # same wrap around as list indexing, an active pixel of 0 ends up as the last pixel
+            pixel += self.numberOfPixels
+        if not 0 <= pixel < self.numberOfPixels:
+            raise IndexError("pixel " + str(pixel) + " out of range for " + str(self.numberOfPixels) + " pixels")
+        return pixel
+
+    ## Appends a chunk of pulses of one pixel. Scalars are broadcast to the length of measuredPower, a powerLevel of None is stored as noPowerLevel
+    def appendChunk(self, pixel, powerLevel, measuredPower, energy, commandedPower, timestamp=0, pulseStatus=1):
+        pixel = self._pixelIndex(pixel)
+        measuredPower = np.atleast_1d(np.asarray(measuredPower, dtype=np.float32))
+        numSamples = len(measuredPower)
+        if numSamples == 0:
+            return 0
+        start = self._size
+        stop = start + numSamples
+        self._reserve(stop)
+        self._columns["pixel"][start:stop] = pixel
+        self._columns["powerLevel"][start:stop] = self.noPowerLevel if powerLevel is None else powerLevel
+        self._columns["measuredPower"][start:stop] = measuredPower
+        self._columns["energy"][start:stop] = energy
+        self._columns["commandedPower"][start:stop] = commandedPower
+        self._columns["timestamp"][start:stop] = timestamp
+        self._columns["pulseStatus"][start:stop] = pulseStatus
+        self._size = stop
+        runs = self._pixelRuns[pixel]
+        if runs and runs[-1][1] == start:
+            runs[-1][1] = stop
+        else:
+            runs.append([start, stop])
+        return numSamples
+
+    ## View of a full column for all rows captured so far
+    def column(self, name):
+        return self._columns[name][:self._size]
+
+    def pixelCount(self, pixel):
+        return sum(stop - start for start, stop in self._pixelRuns[self._pixelIndex(pixel)])
+
+    ## Samples of one pixel for a column, a view when the pixel was captured in one contiguous run
+    def pixelColumn(self, pixel, name):
+        runs = self._pixelRuns[self._pixelIndex(pixel)]
+        column = self._columns[name]
+        if len(runs) == 0:
+            return column[:0]
+        if len(runs) == 1:
+            return column[runs[0][0]:runs[0][1]]
+        return np.concatenate([column[start:stop] for start, stop in runs])
+
+    ## Per pixel samples of a column as a list with one array per pixel
+    def pixelColumns(self, name):
+        return [self.pixelColumn(pixel, name) for pixel in range(self.numberOfPixels)]
@@ -0,0 +1,148 @@
+import time
+import numpy as np
+from Model.PulseStatistics import PulseLevelStatistics
+
+## Segmentation of a pyrometer stream that runs for a whole calibration
+## The app records the PLC transitions that start a level (pixel initialized, power level changed) as host times and StreamClock maps them onto
+## the device timestamps of the Juno. A capture closes the window of its level just after the newest sample received, the laser has stopped
+## firing the level by then. StreamTimeline keeps one window per captured level and the samples of a window are found by timestamp with
+## searchsorted, so the split doesn't depend on when the buffer was read or cleared, nor on the commanded power steps
+
+## Maps host times (time.perf_counter seconds) onto the device timestamps (ms) of the current stream
+## The offset is the smallest (arrival time - newest timestamp) over the GetData chunks, the chunk that came through with the least delay.
+## Until the first chunk the device clock is taken to start when StartStream was called
+class StreamClock:
+
+    def __init__(self) -> None:
+        self.reset()
+
+    ## New stream, device timestamps restart from 0
+    def reset(self, startTime=None):
+        self.startTime = startTime
+        self.offsetMs = None
+
+    ## A chunk whose newest sample has timestamp newestTimestampMs arrived at arrivalTime
+    def observe(self, arrivalTime, newestTimestampMs):
+        offsetMs = arrivalTime * 1000 - float(newestTimestampMs)
+        if self.offsetMs is None or offsetMs < self.offsetMs:
+            self.offsetMs = offsetMs
+
+    ## Device timestamp (ms) of a host time, now when not given. NaN before the stream started
+    def deviceTime(self, hostTime=None):
+        hostTime = time.perf_counter() if hostTime is None else hostTime
+        if self.offsetMs is not None:
+            return hostTime * 1000 - self.offsetMs
+        if self.startTime is not None:
+            return (hostTime - self.startTime) * 1000
+        return np.nan
+
+
+## Windows of the captured power levels, in device time (ms)
+## A window opens when the PLC initializes a pixel or switches the power level and closes when it captures the level.
+## Windows are appended in time order and never overlap; samples outside every window (gantry moves, idle laser) belong to no level
+class StreamTimeline:
+
+    def __init__(self) -> None:
+        self.clear()
+
+    def __len__(self):
+        return len(self.starts)
+
+    def clear(self):
+        self.starts = []        ## window start per captured level (ms)
+        self.stops = []         ## window stop (capture time) per captured level (ms)
+        self.pixels = []        ## 0-indexed pixel per captured level
+        self.powerLevels = []   ## power level index per captured level, -1 when the commanded power isn't one of the test levels
+        self.openStart = None   ## start of the window being fired, None between a capture and the next transition
+
+    ## PLC transition that starts firing a level, a later transition before the capture moves the start
+    def openWindow(self, startMs):
+        if np.isfinite(startMs):
+            self.openStart = startMs
+
+    ## Capture of a level, returns its (start, stop). Without a transition since the last capture the window starts at the previous capture.
+    ## A start estimated before the previous stop is moved to it so windows never overlap, unless it is before the previous start (new stream)
+    def closeWindow(self, stopMs, pixel, powerLevel):
+        if self.openStart is not None:
+            start = self.openStart
+            if len(self.stops) > 0 and self.starts[-1] <= start < self.stops[-1]:
+                start = self.stops[-1]
+        elif len(self.stops) > 0:
+            start = self.stops[-1]
+        else:
+            start = -np.inf
+        start = min(start, stopMs)
+        self.starts.append(start)
+        self.stops.append(stopMs)
+        self.pixels.append(pixel)
+        self.powerLevels.append(-1 if powerLevel is None else powerLevel)
+        self.openStart = None
+        return start, stopMs
+
+    ## False when the windows went back in time, i.e. the stream was restarted and its timestamps started over
+    @property
+    def ordered(self):
+        return bool(np.all(np.diff(self.starts) >= 0))
+
+    ## (starts, stops, pixels, powerLevels) as numpy arrays
+    def arrays(self):
+        return (np.array(self.starts, dtype=float), np.array(self.stops, dtype=float),
+                np.array(self.pixels, dtype=np.intp), np.array(self.powerLevels, dtype=np.intp))
+
+
+## Index range [first, last) of the samples in every window [start, stop); timestamps must be sorted, as they are within a stream
+def windowSampleRanges(timestamps, starts, stops):
+    timestamps = np.asarray(timestamps, dtype=float)
+    first = np.searchsorted(timestamps, np.asarray(starts, dtype=float), side='left')
+    last = np.searchsorted(timestamps, np.asarray(stops, dtype=float), side='left')
+    return first, np.maximum(last, first)
+
+
+## Closes the window of the level being captured and returns the index range [first, last) of its samples in the sorted timestamps received so far
+## The window ends just after the newest sample instead of at the capture time, a host clock estimate would cut off the last pulses of the level
+def closeLevelWindow(timeline, timestamps, pixel, powerLevel):
+    timestamps = np.asarray(timestamps, dtype=float)
+    if len(timestamps) > 0:
+        stopMs = np.nextafter(timestamps[-1], np.inf)
+    elif timeline.openStart is not None:
+        stopMs = timeline.openStart
+    else:
+        stopMs = timeline.stops[-1] if len(timeline) > 0 else -np.inf
+    start, stop = timeline.closeWindow(stopMs, pixel, powerLevel)
+    first, last = windowSampleRanges(timestamps, [start], [stop])
+    return first[0], last[0]
+
+
+## Window index of every sample, -1 for the samples outside every window. Works for unsorted timestamps, e.g. several streams appended
+def sampleWindows(timestamps, starts, stops):
+    timestamps = np.asarray(timestamps, dtype=float)
+    stops = np.asarray(stops, dtype=float)
+    window = np.searchsorted(np.asarray(starts, dtype=float), timestamps, side='right') - 1
+    inside = window >= 0
+    inside[inside] = timestamps[inside] < stops[window[inside]]
+    return np.where(inside, window, -1)
+
+
+## Per (pixel, power level) statistics of samples split by the windows of a timeline
+## Samples outside the windows or in a window without a power level are left out; windows of the same pixel and level (a level captured twice) are pooled
+def timelineStatistics(timestamps, measuredPower, timeline, numberOfPixels, commandedPowerLevels):
+    numLevels = len(commandedPowerLevels)
+    shape = (numberOfPixels, numLevels)
+    starts, stops, pixels, powerLevels = timeline.arrays()
+    window = sampleWindows(timestamps, starts, stops)
+    inside = window >= 0
+    if len(starts) > 0:
+        inside[inside] = (pixels[window[inside]] < numberOfPixels) & (powerLevels[window[inside]] >= 0) & (powerLevels[window[inside]] < numLevels)
+    keys = pixels[window[inside]] * numLevels + powerLevels[window[inside]]
+    values = np.asarray(measuredPower, dtype=np.float32).astype(float)[inside]
+    count = np.bincount(keys, minlength=numberOfPixels * numLevels)
+    sums = np.bincount(keys, weights=values, minlength=numberOfPixels * numLevels)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(count > 0, sums / count, np.nan)
+    # two passes: squared deviations from the level mean keep the variance exact for values far from zero
+    deviations = values - mean[keys]
+    sumOfSquares = np.bincount(keys, weights=deviations * deviations, minlength=numberOfPixels * numLevels)
+    stdev = np.full(numberOfPixels * numLevels, np.nan)
+    multiple = count > 1
+    stdev[multiple] = np.sqrt(sumOfSquares[multiple] / (count[multiple] - 1))
+    return PulseLevelStatistics(mean.reshape(shape), stdev.reshape(shape), count.reshape(shape), commandedPowerLevels)
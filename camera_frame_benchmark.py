@@ -0,0 +1,32 @@
+import array
+import time
+import numpy as np
+from Model.FrameBuffer import FrameBuffer, safearray_as_ndarray
+
+# Time to turn a DataRay frame into a uint16 image: the old np.array(rawData, dtype=np.uint16) on the tuple of Python ints
+# GetWinCamDataAsVariant returns by default, against FrameBuffer on the same tuple and on the SAFEARRAY read as an array (comtypes)
+# Synthetic 2048x2048 frame, no camera needed
+FRAME_SHAPE = (2048, 2048)
+REPEATS = 5
+
+def bestOf(convert, rawData):
+    times = []
+    for repeat in range(REPEATS):
+        start = time.perf_counter()
+        frame = convert(rawData)
+        times.append(time.perf_counter() - start)
+    return frame, min(times) * 1000
+
+if __name__ == '__main__':
+    values = np.random.default_rng(0).integers(0, 4096, FRAME_SHAPE[0] * FRAME_SHAPE[1])
+    rawTuple = tuple(values.tolist())
+    rawSafearray = values.astype(np.int32) # comtypes reads the VT_I4 SAFEARRAY into an int32 array
+    rawBuffer = array.array('H', values.astype(np.uint16).tobytes())
+    frameBuffer = FrameBuffer()
+
+    reference, oldMs = bestOf(lambda rawData: np.array(rawData, dtype=np.uint16), rawTuple)
+    print("np.array on tuple".ljust(32) + str(round(oldMs, 2)).rjust(8) + " ms")
+    for name, rawData in (("FrameBuffer, tuple", rawTuple), ("FrameBuffer, SAFEARRAY ndarray", rawSafearray), ("FrameBuffer, buffer protocol", rawBuffer)):
+        frame, ms = bestOf(frameBuffer.convert, rawData)
+        print(name.ljust(32) + str(round(ms, 2)).rjust(8) + " ms   x" + str(round(oldMs / ms, 1)).ljust(6) + " identical: " + str(np.array_equal(frame, reference)))
+    print("comtypes SAFEARRAY as ndarray available: " + str(safearray_as_ndarray is not None))
@@ -0,0 +1,62 @@
+import time
+import numpy as np
+from Model.CameraDriver import CameraDriver
+from Model.DeviceSimulators import FakeDataRayCOM
+
+# Capture time of CameraDriver.fetchFrame reading the frame right away (retrying after a fixed 5 s sleep) against waiting for the
+# DataReady event, on the fake DataRay control. Persistent session, no camera needed
+#   triggered: the capture command comes right after the laser fired, the frame is ready READY_DELAY_SEC later
+#   failed read: the first read returns half a frame while the laser keeps pulsing every PULSE_INTERVAL_SEC
+FRAMES = 10
+FRAME_SIZE = 512
+READY_DELAY_SEC = 0.05
+PULSE_INTERVAL_SEC = 0.1
+
+class FakeGetDataCtrl:
+
+    def __init__(self) -> None:
+        self.ctrl = FakeDataRayCOM(FRAME_SIZE, FRAME_SIZE, comCallDelaySec=0.0, restartDelaySec=0.0, seed=0)
+
+def newCamera(frameEvents):
+    gdCtrl = FakeGetDataCtrl()
+    camera = CameraDriver(persistentSession=True)
+    if frameEvents:
+        camera.connectFrameEvents(gdCtrl, getEvents=FakeDataRayCOM.GetEvents)
+    camera.initialize(gdCtrl, dimensions=(FRAME_SIZE, FRAME_SIZE))
+    return camera, gdCtrl
+
+def fetch(camera, gdCtrl):
+    start = time.perf_counter()
+    metadata, imageData = camera.fetchFrame(1, 0.0, 0.0, 0.0, 5.0, 100.0, "SIM", gdCtrl)
+    return time.perf_counter() - start, imageData
+
+## fresh: the frame of this trigger was returned, not the one before it
+def triggered(frameEvents):
+    camera, gdCtrl = newCamera(frameEvents)
+    times, fresh = [], 0
+    for frame in range(FRAMES):
+        expectedFrame = gdCtrl.ctrl.frameNumber + 1
+        gdCtrl.ctrl.triggerFrame(READY_DELAY_SEC)
+        captureSec, imageData = fetch(camera, gdCtrl)
+        times.append(captureSec)
+        fresh += imageData is not None and imageData.flat[0] == expectedFrame
+        time.sleep(2 * READY_DELAY_SEC)
+    return np.array(times) * 1000, fresh
+
+def failedRead(frameEvents):
+    camera, gdCtrl = newCamera(frameEvents)
+    gdCtrl.ctrl.startTrigger(PULSE_INTERVAL_SEC)
+    gdCtrl.ctrl.failReads = 1
+    captureSec, imageData = fetch(camera, gdCtrl)
+    gdCtrl.ctrl.stopTrigger()
+    return np.array([captureSec]) * 1000, int(imageData is not None)
+
+def report(name, timesMs, frames):
+    print(name.ljust(34) + "capture ms: median " + str(round(np.median(timesMs), 1)).rjust(7) + ", max " + str(round(np.max(timesMs), 1)).rjust(7)
+          + "   good frames " + str(frames) + "/" + str(len(timesMs)))
+
+if __name__ == '__main__':
+    report("triggered, read right away", *triggered(False))
+    report("triggered, wait for DataReady", *triggered(True))
+    report("failed read, sleep and retry", *failedRead(False))
+    report("failed read, retry on DataReady", *failedRead(True))
@@ -0,0 +1,45 @@
+import time
+import numpy as np
+from Model.CameraDriver import CameraDriver
+from Model.DeviceSimulators import FakeDataRayCOM
+
+# Frame to frame latency of CameraDriver.fetchFrame re-initializing the camera after every frame (the old workaround)
+# against the persistent session, on the fake DataRay control. Driver and device restarts are simulated with RESTART_DELAY_SEC
+# and every other COM call with COM_CALL_DELAY_SEC; the session run also has a failed health check in the middle. No camera needed
+# The exposure is set to 3 ms before the first frame, the exposures column lists what the frame metadata reported
+FRAMES = 8
+FRAME_SIZE = 2048 # the initialize default
+COM_CALL_DELAY_SEC = 0.002
+RESTART_DELAY_SEC = 0.5
+
+class FakeGetDataCtrl:
+
+    def __init__(self) -> None:
+        self.ctrl = FakeDataRayCOM(FRAME_SIZE, FRAME_SIZE, comCallDelaySec=COM_CALL_DELAY_SEC, restartDelaySec=RESTART_DELAY_SEC, seed=0)
+
+def fetchFrames(persistentSession, failAtFrame=None):
+    gdCtrl = FakeGetDataCtrl()
+    camera = CameraDriver(persistentSession=persistentSession)
+    camera.initialize(gdCtrl, exposure=2.0)
+    camera.setExposure(3.0, gdCtrl)
+    gdCtrl.ctrl.calls = {}
+    latencies = []
+    exposures = []
+    for frame in range(FRAMES):
+        if frame == failAtFrame:
+            gdCtrl.ctrl.failStarts = 1
+        start = time.perf_counter()
+        metadata, imageData = camera.fetchFrame(1, 0.0, 0.0, 0.0, 5.0, 100.0, "SIM", gdCtrl)
+        latencies.append(time.perf_counter() - start)
+        assert imageData is not None and imageData.shape == (FRAME_SIZE, FRAME_SIZE)
+        exposures.append(metadata['Exposure'])
+    return np.array(latencies) * 1000, sum(gdCtrl.ctrl.calls.values()), camera.initializations - 1, exposures
+
+def report(name, latenciesMs, comCalls, initializations, exposures):
+    print(name.ljust(28) + "frame ms: median " + str(round(np.median(latenciesMs), 1)).rjust(7) + ", max " + str(round(np.max(latenciesMs), 1)).rjust(7)
+          + "   COM calls " + str(comCalls).rjust(4) + ", re-initializations " + str(initializations).rjust(2) + ", exposures " + str(sorted(set(exposures))))
+
+if __name__ == '__main__':
+    report("re-initialize every frame", *fetchFrames(False))
+    report("persistent session", *fetchFrames(True))
+    report("session, one failed check", *fetchFrames(True, failAtFrame=FRAMES // 2))
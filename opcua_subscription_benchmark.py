@@ -0,0 +1,63 @@
+import time
+import logging
+from opcua import Server, Client
+from Model.BNRopcuaTag import BNRopcuaTag, BNRopcuaSubscription
+
+# Compares the startup of one subscription per tag (the old _setAsUpdating) against the shared BNRopcuaSubscription
+# on a local server, and checks that notifications still reach the right tag
+ENDPOINT = "opc.tcp://127.0.0.1:4841"
+NUM_TAGS = 27
+
+def serverSubscriptionCount(server):
+    return len(server.iserver.subscription_service.subscriptions)
+
+def connectTags(server, names):
+    client = Client(ENDPOINT, timeout=5)
+    client.connect()
+    tags = [BNRopcuaTag(client, name) for name in names]
+    return client, tags
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    server = Server()
+    server.set_endpoint(ENDPOINT)
+    idx = server.register_namespace("urn:benchmark")
+    folder = server.get_objects_node().add_object(idx, "Benchmark")
+    variables = [folder.add_variable("ns=" + str(idx) + ";s=Tag" + str(i), "Tag" + str(i), False) for i in range(NUM_TAGS)]
+    for variable in variables:
+        variable.set_writable()
+    names = [variable.nodeid.to_string() for variable in variables]
+    server.start()
+    try:
+        client, tags = connectTags(server, names)
+        start = time.perf_counter()
+        for tag in tags:
+            tag._setAsUpdating()
+        perTagSec = time.perf_counter() - start
+        perTagSubscriptions = serverSubscriptionCount(server)
+        for tag in tags:
+            tag._removeUpdates()
+        client.disconnect()
+
+        client, tags = connectTags(server, names)
+        subscription = BNRopcuaSubscription(client, 200)
+        start = time.perf_counter()
+        subscription.subscribe(tags)
+        sharedSec = time.perf_counter() - start
+        sharedSubscriptions = serverSubscriptionCount(server)
+
+        # every tag should see its own change and nothing else
+        time.sleep(0.5)
+        for variable in variables[::2]:
+            variable.set_value(True)
+        time.sleep(1)
+        routed = all(tag.value == (i % 2 == 0) for i, tag in enumerate(tags))
+        subscription.delete()
+        client.disconnect()
+
+        print("tags: " + str(NUM_TAGS))
+        print("one subscription per tag: " + str(round(perTagSec, 3)) + " s, " + str(perTagSubscriptions) + " server subscriptions")
+        print("shared subscription: " + str(round(sharedSec, 3)) + " s, " + str(sharedSubscriptions) + " server subscriptions")
+        print("notifications routed to the right tags: " + str(routed))
+    finally:
+        server.stop()
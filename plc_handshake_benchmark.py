@@ -0,0 +1,45 @@
+import time
+from ConfigFiles.MachineSettings import MachineSettings
+from ConfigFiles.TestSettings import TestSettings
+from Model.LaserSettings import LaserSettings
+from Model.PlcSimulator import PlcSimulator
+
+# Runs a scripted calibration against the local PLC simulator and reports the command to response latency per command type
+# The app runs in simulation mode: it connects to 127.0.0.1 and uses the fake Juno, the simulator sets the fake pulse power per level
+NUM_PIXELS = 8
+NUM_POWER_LEVELS = 5
+NUM_PULSES_PER_LEVEL = 15
+CAPTURE_DELAY_SEC = 1.0  # time the PLC spends firing a power level before asking for the capture
+UPLOAD_LUTS = False      # the LUT upload needs the VFLCRs on the network
+ADAPTIVE_SAMPLING = False # stop firing a level once the app reports LevelSampleComplete, CAPTURE_DELAY_SEC becomes the limit
+CONTINUOUS_STREAM = False # one pyrometer stream for the whole calibration, split into levels by timestamp
+
+if __name__ == '__main__':
+    MachineSettings._simulation = True
+    MachineSettings._simulatePyrometer = True
+    MachineSettings._pyroContinuousStream = CONTINUOUS_STREAM
+    simulator = PlcSimulator("opc.tcp://127.0.0.1:" + str(MachineSettings._portNumber), numberOfPixels=NUM_PIXELS)
+    simulator.start()
+    try:
+        from Model.Model import Model
+        testSettings = TestSettings()
+        testSettings._adaptiveSampling = ADAPTIVE_SAMPLING
+        m = Model(MachineSettings(), testSettings, LaserSettings())
+        m.connectToPlc()
+        simulator.onPowerLevel = lambda watts: setattr(m.pyrometer.OphirCOM, "powerWatts", watts)
+        time.sleep(1) # subscriptions settle
+        totalSec = simulator.runCalibration(numPulsesPerLevel=NUM_PULSES_PER_LEVEL, numPowerLevelSteps=NUM_POWER_LEVELS,
+                                            captureDelaySec=CAPTURE_DELAY_SEC, uploadLuts=UPLOAD_LUTS, adaptive=ADAPTIVE_SAMPLING)
+        print("calibration of " + str(NUM_PIXELS) + " pixels took " + str(round(totalSec, 2)) + " s")
+        simulator.printLatencyReport()
+        print("Reaction dispatcher: " + str(m.reactionDispatcher.stats()))
+        print("Pyrometer stream starts: " + str(m.pyrometer.streamStarts))
+        for log in m.logger.getAllLogs():
+            if log.startswith("Adaptive sampling"):
+                print(log)
+        if m.postProcessing is not None:
+            print("Post processing worker: " + str(m.postProcessing.stats()))
+            m.postProcessing.stop()
+        m.client.disconnect()
+    finally:
+        simulator.stop()
@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from datetime import datetime
+import numpy as np
+from ConfigFiles.TestSettings import TestSettings
+from Model.LaserSettings import LaserSettings
+from Model.PostProcessing import PostProcessingJob, PostProcessingWorker, runPostProcessing
+from Model.PulseStatistics import RunningPulseStatistics
+from Model.ReactionDispatcher import ReactionDispatcher
+
+# Heartbeat latency while the end of test processing of a full machine runs inline in a reaction thread (the old processCalibration)
+# against the PostProcessingWorker process. The heartbeat is a reaction queued on its own key every HEARTBEAT_PERIOD_SEC like the app does,
+# its latency is the time from the scheduled heartbeat change to the end of the reaction. Synthetic data, no PLC or devices needed.
+NUM_PIXELS = 147
+NUM_PULSES_PER_LEVEL = 100
+HEARTBEAT_PERIOD_SEC = 0.02
+IDLE_SEC = 1.0
+OUTPUT_FOLDER = os.path.join(".", "tmp", "postprocessing_benchmark")
+
+def makeJob(testSettings):
+    laserSettings = LaserSettings()
+    laserSettings.vfpMap = [[pixel + 1, 1, pixel // 21 + 1, pixel % 21 + 1] for pixel in range(NUM_PIXELS)]
+    levels = [(testSettings._startingPowerLevel + testSettings._powerLevelIncrement * level) * 525/255 for level in range(testSettings._numPowerLevelSteps)]
+    random = np.random.default_rng(0)
+    statistics = RunningPulseStatistics(NUM_PIXELS, levels)
+    measuredPower = []
+    for pixel in range(NUM_PIXELS):
+        pixelPower = [level * (1 + random.normal(0, 0.01, NUM_PULSES_PER_LEVEL)) for level in levels]
+        for levelIdx, power in enumerate(pixelPower):
+            statistics.addChunk(pixel, levelIdx, power)
+        measuredPower.append(np.concatenate(pixelPower).astype(np.float32))
+    saveLocation = os.path.join(OUTPUT_FOLDER, "output")
+    saveLocationNetwork = os.path.join(OUTPUT_FOLDER, "network")
+    for location in ["tmp", saveLocation, saveLocationNetwork]:
+        os.makedirs(location, exist_ok=True)
+    return PostProcessingJob(measuredPower, [1] * NUM_PIXELS, statistics.statistics(), levels, testSettings, laserSettings, "TestType.CALIBRATION",
+                             datetime.utcnow(), saveLocation, saveLocationNetwork, ["In Progress", "Passed"], True)
+
+## Queues a heartbeat reaction every HEARTBEAT_PERIOD_SEC and records its latency until stopped
+class HeartbeatProbe:
+
+    def __init__(self, dispatcher) -> None:
+        self.dispatcher = dispatcher
+        self.latencies = []
+        self._stopEvent = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _reaction(self, changeTime):
+        value = sum(range(100)) # a little bit of python work, like writing HeartbeatIn
+        self.latencies.append(time.perf_counter() - changeTime)
+
+    ## The PLC changes the heartbeat on a fixed schedule, latency counts from the scheduled time so a starved probe thread shows up too
+    def _run(self):
+        changeTime = time.perf_counter()
+        while True:
+            changeTime += HEARTBEAT_PERIOD_SEC
+            if self._stopEvent.wait(max(changeTime - time.perf_counter(), 0)):
+                return
+            self.dispatcher.submit("heartbeat", self._reaction, changeTime)
+
+    def measure(self, work):
+        self.latencies = []
+        self._stopEvent.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        start = time.perf_counter()
+        work()
+        durationSec = time.perf_counter() - start
+        self._stopEvent.set()
+        self._thread.join()
+        time.sleep(2 * HEARTBEAT_PERIOD_SEC)
+        return durationSec, np.array(self.latencies) * 1000
+
+def report(name, durationSec, latenciesMs):
+    print(name.ljust(18) + "processing " + str(round(durationSec, 3)).rjust(7) + " s   heartbeat ms: median " + str(round(np.median(latenciesMs), 2)).rjust(6)
+          + ", p95 " + str(round(np.percentile(latenciesMs, 95), 2)).rjust(6) + ", max " + str(round(np.max(latenciesMs), 2)).rjust(7) + " (" + str(len(latenciesMs)) + " beats)")
+
+if __name__ == '__main__':
+    job = makeJob(TestSettings())
+    dispatcher = ReactionDispatcher()
+    probe = HeartbeatProbe(dispatcher)
+
+    def inline():
+        done = threading.Event()
+        dispatcher.submit("command", lambda: (runPostProcessing(job), done.set()))
+        done.wait()
+
+    resultEvent = threading.Event()
+    worker = PostProcessingWorker(onResult=lambda result: resultEvent.set(), onError=lambda jobId, message: print(message))
+    def inWorker():
+        resultEvent.clear()
+        worker.submit(job)
+        resultEvent.wait()
+
+    worker.start()
+    inWorker() # warm up the worker process (imports) and the output files
+    runPostProcessing(job)
+
+    report("idle", *probe.measure(lambda: time.sleep(IDLE_SEC)))
+    report("inline", *probe.measure(inline))
+    report("worker process", *probe.measure(inWorker))
+    print("worker stats: " + str(worker.stats()))
+    worker.stop()
+    dispatcher.shutdown()
@@ -0,0 +1,57 @@
+import time
+import numpy as np
+from Model.OphirCom import OphirJunoCOM
+from Model.PyroAcquisition import PyroAcquisitionWorker
+from Model.DeviceSimulators import FakeOphirCOM
+
+# Time initializePixel spends before the pyrometer stream runs: the fixed 5 s wait against the readiness probe,
+# inline and with the background acquisition, and the fallback when the Juno never accepts the stream. Runs on the fake Juno, no hardware needed.
+PIXELS = 3
+FIXED_DELAY_SEC = 5.0
+READY_TIMEOUT_SEC = 1.0
+ARM_DELAY_SEC = 0.15 # simulated time from StartStream until GetData returns pulses from the Juno
+RACK_PIXELS = 84
+
+def startTimes(pyrometer, probe, failStarts=0):
+    times = []
+    armed = 0
+    for pixel in range(PIXELS):
+        pyrometer.OphirCOM.failStarts = failStarts
+        pyrometer.clearData()
+        start = time.perf_counter()
+        if probe and pyrometer.startDataCollectionWhenReady(READY_TIMEOUT_SEC):
+            armed += 1
+        else:
+            pyrometer.OphirCOM.failStarts = 0 # the device recovers during the fixed wait
+            time.sleep(FIXED_DELAY_SEC)
+            pyrometer.startDataCollection()
+        times.append(time.perf_counter() - start)
+        time.sleep(0.3)
+        values, timestamps, statuses = pyrometer.getFullDataArrays()
+        assert len(values) > 0, "no pyrometer data after the stream start"
+        pyrometer.endDataCollection()
+    return np.array(times), armed
+
+def report(name, times, armed):
+    print(name.ljust(36) + "median " + str(round(np.median(times) * 1000, 1)).rjust(7) + " ms, armed " + str(armed) + "/" + str(PIXELS)
+          + ", " + str(round((FIXED_DELAY_SEC - np.median(times)) * RACK_PIXELS / 60, 1)) + " min reclaimed per " + str(RACK_PIXELS) + " pixel rack")
+
+def newPyrometer():
+    pyrometer = OphirJunoCOM(FakeOphirCOM(armDelaySec=ARM_DELAY_SEC, seed=0))
+    pyrometer.connectToJuno()
+    return pyrometer
+
+if __name__ == '__main__':
+    report("fixed wait", *startTimes(newPyrometer(), probe=False))
+    report("probe, inline GetData", *startTimes(newPyrometer(), probe=True))
+
+    background = newPyrometer()
+    worker = PyroAcquisitionWorker(background, pollIntervalSec=0.05)
+    background.attachAcquisitionWorker(worker)
+    worker.start()
+    report("probe, background acquisition", *startTimes(background, probe=True))
+    worker.stop()
+
+    failing = newPyrometer()
+    report("probe failing, fixed wait fallback", *startTimes(failing, probe=True, failStarts=1000))
+    print("last probe error: " + str(failing.lastStartError))
@@ -0,0 +1,44 @@
+import time
+import numpy as np
+from Model.OphirCom import OphirJunoCOM
+from Model.PyroAcquisition import PyroAcquisitionWorker
+from Model.DeviceSimulators import FakeOphirCOM
+
+# Compares the time a capture command spends getting pyrometer data with inline GetData polling
+# against draining the background acquisition worker. Runs on the fake Juno, no hardware needed.
+PULSE_RATE_HZ = 2000        # fast enough to make the COM decode cost visible
+GET_DATA_DELAY_SEC = 0.002  # simulated COM round trip per GetData call
+CAPTURES = 20
+CAPTURE_INTERVAL_SEC = 0.25
+
+def runCaptures(pyrometer):
+    captureTimes = []
+    samples = 0
+    pyrometer.clearData()
+    pyrometer.startDataCollection()
+    for capture in range(CAPTURES):
+        time.sleep(CAPTURE_INTERVAL_SEC)
+        start = time.perf_counter()
+        values, timestamps, statuses = pyrometer.getFullDataArrays()
+        captureTimes.append(time.perf_counter() - start)
+        samples += len(values)
+        pyrometer.clearData()
+    pyrometer.endDataCollection()
+    return np.array(captureTimes) * 1000, samples
+
+def report(name, captureTimesMs, samples):
+    print(name + ": samples " + str(samples) + ", capture path ms: median " + str(round(np.median(captureTimesMs), 3)) + ", max " + str(round(np.max(captureTimesMs), 3)))
+
+if __name__ == '__main__':
+    inline = OphirJunoCOM(FakeOphirCOM(pulseRateHz=PULSE_RATE_HZ, getDataDelaySec=GET_DATA_DELAY_SEC, seed=0))
+    inline.connectToJuno()
+    report("inline GetData", *runCaptures(inline))
+
+    background = OphirJunoCOM(FakeOphirCOM(pulseRateHz=PULSE_RATE_HZ, getDataDelaySec=GET_DATA_DELAY_SEC, seed=0))
+    background.connectToJuno()
+    worker = PyroAcquisitionWorker(background, pollIntervalSec=0.02)
+    background.attachAcquisitionWorker(worker)
+    worker.start()
+    report("background worker", *runCaptures(background))
+    worker.stop()
+    print("worker stats: " + str(worker.stats()))
@@ -0,0 +1,61 @@
+import time
+import numpy as np
+from Model.StreamSegmenter import StreamTimeline, sampleWindows, timelineStatistics
+
+# Splits one synthetic pyrometer stream of a whole calibration into pixels and levels by device timestamp and compares
+# the vectorized segmenter (searchsorted + bincount) with masking the stream window by window. Between the levels the stream carries
+# pulses that belong to no level (laser settling, gantry moves), which the windows have to leave out. No hardware needed.
+NUM_PIXELS = 84
+NUM_LEVELS = 5
+PULSE_RATE_HZ = 1000
+LEVEL_SEC = 1.0
+GAP_SEC = 0.2
+REPEATS = 5
+
+def syntheticStream(random):
+    levels = np.arange(1, NUM_LEVELS + 1) * 50.0
+    timeline = StreamTimeline()
+    timestamps, power = [], []
+    nowMs = 0.0
+    for pixel in range(NUM_PIXELS):
+        for level in range(NUM_LEVELS):
+            gap = np.arange(nowMs, nowMs + GAP_SEC * 1000, 1000 / PULSE_RATE_HZ)
+            timestamps.append(gap)
+            power.append(random.uniform(0, 300, len(gap))) # not part of any level
+            nowMs += GAP_SEC * 1000
+            timeline.openWindow(nowMs)
+            pulses = np.arange(nowMs, nowMs + LEVEL_SEC * 1000, 1000 / PULSE_RATE_HZ)
+            timestamps.append(pulses)
+            power.append(levels[level] * (1 + random.normal(0, 0.01, len(pulses))))
+            nowMs += LEVEL_SEC * 1000
+            timeline.closeWindow(nowMs, pixel, level)
+    return np.concatenate(timestamps), np.concatenate(power).astype(np.float32), timeline, levels
+
+def loopStatistics(timestamps, power, timeline, levels):
+    mean = np.full((NUM_PIXELS, NUM_LEVELS), np.nan)
+    count = np.zeros((NUM_PIXELS, NUM_LEVELS), dtype=int)
+    for start, stop, pixel, level in zip(timeline.starts, timeline.stops, timeline.pixels, timeline.powerLevels):
+        inside = power[(timestamps >= start) & (timestamps < stop)].astype(float)
+        count[pixel, level] = len(inside)
+        mean[pixel, level] = np.mean(inside)
+    return mean, count
+
+if __name__ == '__main__':
+    timestamps, power, timeline, levels = syntheticStream(np.random.default_rng(0))
+    print("stream: " + str(len(timestamps)) + " samples, " + str(len(timeline)) + " level windows")
+
+    times = []
+    for repeat in range(REPEATS):
+        start = time.perf_counter()
+        stats = timelineStatistics(timestamps, power, timeline, NUM_PIXELS, levels)
+        times.append(time.perf_counter() - start)
+    print("searchsorted segmenter".ljust(24) + str(round(min(times) * 1000, 2)).rjust(10) + " ms")
+
+    start = time.perf_counter()
+    loopMean, loopCount = loopStatistics(timestamps, power, timeline, levels)
+    loopMs = (time.perf_counter() - start) * 1000
+    print("mask per window".ljust(24) + str(round(loopMs, 2)).rjust(10) + " ms")
+
+    outside = np.count_nonzero(sampleWindows(timestamps, *timeline.arrays()[:2]) < 0)
+    print("identical counts: " + str(np.array_equal(stats.count, loopCount)) + ", means: " + str(np.allclose(stats.mean, loopMean))
+          + ", samples left out between levels: " + str(outside) + ", max deviation " + str(round(float(np.nanmax(stats.deviation)), 3)) + " %")
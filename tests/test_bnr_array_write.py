@@ -0,0 +1,40 @@
+import socket
+import pytest
+from opcua import Client, Server, ua
+from Model.BNRopcuaTag import BNRopcuaTag
+
+ARRAY_LENGTH = 10
+
+def freePort():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+## Local freeopcua server with a UInt16 array declared like the PLC arrays, and a client connected to it
+@pytest.fixture
+def arrayNode():
+    endpoint = "opc.tcp://127.0.0.1:" + str(freePort())
+    server = Server()
+    server.set_endpoint(endpoint)
+    idx = server.register_namespace("test")
+    node = server.get_objects_node().add_variable(ua.NodeId("Array", idx), "Array", ua.Variant([0] * ARRAY_LENGTH, ua.VariantType.UInt16))
+    node.set_attribute(ua.AttributeIds.ValueRank, ua.DataValue(ua.Variant(ua.ValueRank.OneDimension, ua.VariantType.Int32)))
+    node.set_attribute(ua.AttributeIds.ArrayDimensions, ua.DataValue(ua.Variant([ARRAY_LENGTH], ua.VariantType.UInt32)))
+    node.set_writable()
+    server.start()
+    client = Client(endpoint, timeout=5)
+    client.connect()
+    try:
+        yield client, node
+    finally:
+        client.disconnect()
+        server.stop()
+
+def test_index_range_ignored_keeps_the_array(arrayNode):
+    client, node = arrayNode
+    tag = BNRopcuaTag(client, node.nodeid.to_string())
+    tag.setPlcValue([1, 2, 3])
+    assert node.get_value() == [1, 2, 3] + [0] * (ARRAY_LENGTH - 3)
+    assert tag._indexRangeWrites is False # freeopcua answers Good but truncates the array
+    tag.setPlcValue([4, 5])
+    assert node.get_value() == [4, 5, 3] + [0] * (ARRAY_LENGTH - 3)
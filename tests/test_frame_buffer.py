@@ -0,0 +1,42 @@
+import numpy as np
+from Model.FrameBuffer import FrameBuffer
+
+def frame(number, size=16):
+    data = np.arange(size, dtype=np.int32)
+    data[0] = number
+    return data
+
+## One fetchFrame: failed reads are converted and dropped, the good frame is kept
+def fetch(frameBuffer, *reads):
+    for rawData in reads:
+        converted = frameBuffer.convert(rawData)
+        if converted.size == 16:
+            frameBuffer.keepFrame()
+            return converted
+    return None
+
+def test_retry_keeps_previous_frame():
+    frameBuffer = FrameBuffer()
+    fetch(frameBuffer, frame(1))
+    previous = fetch(frameBuffer, frame(2))
+    new = fetch(frameBuffer, frame(3)[:8], frame(3)) # failed read, retried on the next frame
+    assert previous[0] == 2 and new[0] == 3
+    assert not np.shares_memory(previous, new)
+    assert np.array_equal(previous, frame(2))
+
+def test_frames_alternate_between_buffers():
+    frameBuffer = FrameBuffer(numberOfBuffers=2)
+    first = fetch(frameBuffer, frame(1))
+    second = fetch(frameBuffer, frame(2))
+    third = fetch(frameBuffer, frame(3))
+    assert np.shares_memory(first, third)
+    assert not np.shares_memory(second, third)
+
+def test_sequence_and_buffer_inputs_match():
+    frameBuffer = FrameBuffer()
+    values = np.random.default_rng(0).integers(0, 4096, 200000)
+    fromTuple = frameBuffer.convert(tuple(values.tolist())).copy()
+    fromArray = frameBuffer.convert(values.astype(np.int32))
+    assert np.array_equal(fromTuple, fromArray)
+    assert fromArray.dtype == np.uint16
+    assert frameBuffer.sequenceFrames == 1 and frameBuffer.bufferFrames == 1
@@ -0,0 +1,69 @@
+import threading
+import time
+import pytest
+from Model.DeviceSimulators import FakeDataRayCOM
+from Model.FrameReadyEvent import FrameReadyEvent
+
+def test_wait_returns_the_frame_number_once_data_ready_fires():
+    frameReady = FrameReadyEvent()
+    threading.Timer(0.05, frameReady.DataReady).start()
+    start = time.perf_counter()
+    assert frameReady.waitForFrame(0, 5.0) == 1
+    assert time.perf_counter() - start < 1.0 and frameReady.lastTime is not None
+    assert frameReady.waitForFrame(0, 0.0) == 1 # a frame that already came is returned without waiting
+
+def test_wait_times_out_without_a_new_frame():
+    frameReady = FrameReadyEvent()
+    frameReady.DataReady()
+    start = time.perf_counter()
+    assert frameReady.waitForFrame(1, 0.1) is None
+    assert time.perf_counter() - start >= 0.09
+
+def test_fake_control_fires_data_ready_for_every_frame():
+    ctrl = FakeDataRayCOM(4, 4, comCallDelaySec=0.0, restartDelaySec=0.0, seed=0)
+    frameReady = FrameReadyEvent()
+    FakeDataRayCOM.GetEvents(ctrl, frameReady)
+    ctrl.startTrigger(0.01)
+    try:
+        assert frameReady.waitForFrame(2, 5.0) >= 3
+    finally:
+        ctrl.stopTrigger()
+    assert frameReady.count == ctrl.frameNumber
+
+
+## CameraDriver needs the camera and positioner packages (wx, zaber, png)
+@pytest.fixture
+def camera(tmp_path, monkeypatch):
+    for module in ["wx", "zaber.serial", "png"]:
+        pytest.importorskip(module)
+    monkeypatch.chdir(tmp_path) # camera_driver.log
+    from Model.CameraDriver import CameraDriver
+    class FakeGetDataCtrl:
+        def __init__(self) -> None:
+            self.ctrl = FakeDataRayCOM(16, 16, comCallDelaySec=0.0, restartDelaySec=0.0, seed=0)
+    gdCtrl = FakeGetDataCtrl()
+    camera = CameraDriver(persistentSession=True, frameTimeoutSec=0.2)
+    assert camera.connectFrameEvents(gdCtrl, getEvents=FakeDataRayCOM.GetEvents)
+    camera.initialize(gdCtrl, dimensions=(16, 16))
+    return camera, gdCtrl
+
+def fetch(camera, gdCtrl):
+    return camera.fetchFrame(1, 0.0, 0.0, 0.0, 5.0, 100.0, "SIM", gdCtrl)
+
+def test_fetch_waits_for_the_frame_of_the_trigger(camera):
+    camera, gdCtrl = camera
+    gdCtrl.ctrl.triggerFrame(0.05)
+    metadata, imageData = fetch(camera, gdCtrl)
+    assert imageData[0, 0] == 1 # the frame of this trigger, not the one before it
+    assert 0.04 <= camera.captureTimes['wait'] < 0.2
+    assert camera.captureTimes['total'] >= camera.captureTimes['wait'] + camera.captureTimes['read']
+    # the frame was fetched, the next wait needs a new DataReady
+    assert not camera.waitForNextFrame(0.05)
+    gdCtrl.ctrl.triggerFrame()
+    assert camera.waitForNextFrame(1.0)
+
+def test_fetch_reads_the_last_frame_when_no_data_ready_comes(camera):
+    camera, gdCtrl = camera
+    metadata, imageData = fetch(camera, gdCtrl)
+    assert imageData is not None and imageData.shape == (16, 16)
+    assert camera.captureTimes['wait'] >= camera.frameTimeoutSec * 0.9
@@ -0,0 +1,25 @@
+import numpy as np
+import pytest
+from Model.LUTBankStore import LUTBankStore
+
+def saveBank(store, calId, value):
+    return store.saveCalibration("M1", calId, np.full((2, 3), value), np.full((2, 256), value), ["Power Scaled"] * 2, np.ones((2, 4)))
+
+def test_saving_a_stored_calibration_id_keeps_the_earlier_bank(tmp_path):
+    store = LUTBankStore(str(tmp_path / "LUT_Bank.sqlite"))
+    assert saveBank(store, 120, 1) == 1
+    assert saveBank(store, 120, 2) == 2
+    assert saveBank(store, 121, 3) == 1
+    newest = store.loadCalibration("M1", 120)
+    assert newest["version"] == 2 and np.all(newest["luts"] == 2)
+    earlier = store.loadCalibration("M1", 120, version=1)
+    assert earlier["version"] == 1 and np.all(earlier["luts"] == 1) and np.all(earlier["coefficients"] == 1)
+    assert store.loadCalibration("M1", 120, version=3) is None and store.loadCalibration("M2", 120) is None
+    assert sorted((row["calId"], row["version"]) for row in store.calibrations("M1")) == [(120, 1), (120, 2), (121, 1)]
+
+def test_corrupt_bank_is_reported(tmp_path):
+    store = LUTBankStore(str(tmp_path / "LUT_Bank.sqlite"))
+    saveBank(store, 7, 1)
+    store._execute("UPDATE calibrations SET luts = ? WHERE calId = 7", (np.full((2, 256), 9, dtype="<u2").tobytes(),))
+    with pytest.raises(ValueError):
+        store.loadCalibration("M1", 7)
@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+from ConfigFiles.MachineSettings import MachineSettings
+from ConfigFiles.TestSettings import TestSettings as CalibrationSettings
+from Model.LUTDataGeneration import LUTDataManager
+from Model.LaserSettings import LaserSettings
+
+## Per pixel LUT scaling as LUTDataManager did it before scaledLUTBankFromCoeff: returns the LUT, the index where it first
+## reaches the power modified limit (the LUT length if never) and the LUT status it sets
+def referenceLut(testSettings, coefficients, status="Untested"):
+    powerperct = np.linspace(0, 1, 256)
+    powerModifiedLimit16Bit = int(MachineSettings._16BitAnalogMaxPower * testSettings._powerModifiedLimit) - 1
+    adjpower = coefficients[0]*powerperct*powerperct + coefficients[1]*powerperct + coefficients[2]
+    scaledpower = np.round(adjpower*MachineSettings._16BitAnalogMaxPower, 0)
+    scaledpower[scaledpower > powerModifiedLimit16Bit] = powerModifiedLimit16Bit
+    scaledpower[scaledpower < 0] = 0
+    scaledpower = scaledpower.astype(np.uint16)
+    if powerModifiedLimit16Bit in scaledpower:
+        powerCalledIndex = list(scaledpower).index(powerModifiedLimit16Bit)
+    else:
+        powerCalledIndex = len(scaledpower)
+    if coefficients[1] != 1:
+        status = "Power Scaled"
+    if powerCalledIndex < int(np.round(testSettings._powerCalledLimit*255, 0)):
+        status = "Power Called Failure"
+    return scaledpower, powerCalledIndex, status
+
+@pytest.fixture
+def lutDataManager(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return LUTDataManager(CalibrationSettings())
+
+def edgeCoefficients():
+    coefficients = [[0, 1, 0], [0, 0, 0], [0, 1, -1], [0, -1, 0], [0, 0, 1], [1e6, 1e6, 1e6], [-1e6, 0, 0], [0.5, 0.5, 0], [0, 1 + 1e-12, 0]]
+    coefficients += [[0, slope, 0] for slope in np.linspace(0.9, 3.0, 211)] # the limit is first reached at every index around the power called threshold
+    return np.array(coefficients, dtype=float)
+
+def randomCoefficients():
+    random = np.random.default_rng(0)
+    return np.column_stack([random.normal(0, 0.3, 500), random.normal(1, 0.3, 500), random.normal(0, 0.05, 500)])
+
+@pytest.mark.parametrize("coefficients", [edgeCoefficients(), randomCoefficients()], ids=["edge", "random"])
+def test_lut_bank_matches_the_per_pixel_luts(lutDataManager, coefficients):
+    luts, powerScaled, powerCalledFailure = lutDataManager.scaledLUTBankFromCoeff(coefficients)
+    lutDataManager.lutStatus = ["Untested" for pixel in range(len(coefficients))]
+    powerModifiedLimit16Bit = int(MachineSettings._16BitAnalogMaxPower * lutDataManager.testSettings._powerModifiedLimit) - 1
+    thresholdIndex = int(np.round(lutDataManager.testSettings._powerCalledLimit*255, 0))
+    calledIndices = []
+    for pixel, pixelCoefficients in enumerate(coefficients):
+        lut, powerCalledIndex, status = referenceLut(lutDataManager.testSettings, pixelCoefficients)
+        calledIndices.append(powerCalledIndex)
+        assert luts.dtype == np.uint16 and np.array_equal(luts[pixel], lut)
+        assert powerScaled[pixel] == (pixelCoefficients[1] != 1)
+        assert powerCalledFailure[pixel] == (powerCalledIndex < thresholdIndex)
+        assert np.array_equal(lutDataManager.scaledLUTfromCoeff(pixelCoefficients, pixel), lut)
+        assert lutDataManager.lutStatus[pixel] == status
+    # the bank's clamp index, the first index at the power modified limit, is the one of the per pixel scan
+    reachesLimit = luts == powerModifiedLimit16Bit
+    bankIndices = np.where(reachesLimit.any(axis=1), reachesLimit.argmax(axis=1), luts.shape[1])
+    assert np.array_equal(bankIndices, calledIndices)
+    assert np.any(powerCalledFailure) and not np.all(powerCalledFailure)
+
+def laserSettingsOf(numberOfPixels, rack=1):
+    laserSettings = LaserSettings()
+    laserSettings.vfpMap = [[pixel + 1, 1, rack, pixel + 1] for pixel in range(numberOfPixels)]
+    return laserSettings
+
+## Test data of the pixels: gains[pixel] times the commanded power of every level, no data and untested status where the gain is None
+def pixelDataOf(testSettings, gains):
+    commandedPowerLevels = [(testSettings._startingPowerLevel + testSettings._powerLevelIncrement * powerLevel) * 525/255 for powerLevel in range(testSettings._numPowerLevelSteps)]
+    commanded = np.repeat(commandedPowerLevels, 3)
+    laserTestData = [[] if gain is None else (gain * commanded).tolist() for gain in gains]
+    commandedPowerData = [[] if gain is None else commanded.tolist() for gain in gains]
+    return laserTestData, commandedPowerData
+
+@pytest.fixture
+def recalibrationManager(lutDataManager):
+    lutDataManager.testSettings._numPowerLevelSteps = 5
+    lutDataManager.testSettings._powerLevelIncrement = 20
+    return lutDataManager
+
+def test_recalibration_replaces_only_the_retested_pixels(recalibrationManager):
+    manager = recalibrationManager
+    laserSettings = laserSettingsOf(6)
+    laserTestData, commandedPowerData = pixelDataOf(manager.testSettings, [0.95, 1.0, 0.97, 1.02, 0.99, 1.03])
+    manager.convertLaserDataToLUTData(laserTestData, commandedPowerData, [1, 1, 3, 1, 1, 1], 120, laserSettings)
+    baseBinaries = manager.convertLUTDataToBinaries()
+    base = {key: np.copy(value) for key, value in manager.lutBank.items()}
+    assert manager.lutStatus[2] == "Power Tolerance Failure"
+
+    # the failed pixel and the selected pixel 2 are retested, pixel list entries outside 1..6 are ignored
+    baseLutBank, retestPixels = manager.recalibrationPixels(np.asarray(laserSettings.vfpMap), [0, 2, 7, -1, 99])
+    assert baseLutBank is manager.lutBank and retestPixels == [1, 2]
+    gains = [None, 1.05, 0.98, None, None, None]
+    laserTestData, commandedPowerData = pixelDataOf(manager.testSettings, gains)
+    testStatus = [1 if gain is not None else 5 for gain in gains]
+    luts = manager.convertLaserDataToLUTData(laserTestData, commandedPowerData, testStatus, 121, laserSettings, baseLutBank=baseLutBank, retestPixels=retestPixels)
+    binaries = manager.convertLUTDataToBinaries()
+
+    # the retested pixels get the fit of a full calibration with the same data
+    full = LUTDataManager(manager.testSettings)
+    fullLuts = full.convertLaserDataToLUTData(laserTestData, commandedPowerData, testStatus, 122, laserSettings)
+    fullBinaries = full.convertLUTDataToBinaries()
+    assert np.array_equal(manager.lutBank["coefficients"][retestPixels], full.lutBank["coefficients"][retestPixels])
+    assert np.array_equal(luts[retestPixels], fullLuts[retestPixels]) and not np.array_equal(luts[retestPixels], base["luts"][retestPixels])
+    assert [binaries[pixel] for pixel in retestPixels] == [fullBinaries[pixel] for pixel in retestPixels]
+    assert [manager.lutStatus[pixel] for pixel in retestPixels] == [full.lutStatus[pixel] for pixel in retestPixels]
+
+    # the other pixels are bit identical to the base calibration
+    keptPixels = [0, 3, 4, 5]
+    assert manager.lutBank["coefficients"][keptPixels].tobytes() == base["coefficients"][keptPixels].tobytes()
+    assert luts[keptPixels].tobytes() == base["luts"][keptPixels].tobytes()
+    assert [binaries[pixel] for pixel in keptPixels] == [baseBinaries[pixel] for pixel in keptPixels]
+    assert [manager.lutStatus[pixel] for pixel in keptPixels] == [base["lutStatus"][pixel] for pixel in keptPixels]
+    assert np.all(np.isnan(manager.fitResiduals[keptPixels]))
+
+def test_recalibration_keeps_the_stored_luts_when_the_lut_settings_changed(recalibrationManager):
+    manager = recalibrationManager
+    laserSettings = laserSettingsOf(3)
+    laserTestData, commandedPowerData = pixelDataOf(manager.testSettings, [1.2, 1.2, 1.2])
+    baseLuts = manager.convertLaserDataToLUTData(laserTestData, commandedPowerData, [1, 1, 1], 120, laserSettings).copy()
+    manager.testSettings._powerModifiedLimit = 0.5
+    luts = manager.convertLaserDataToLUTData([[], [], []], [[], [], []], [5, 5, 5], 121, laserSettings, baseLutBank=manager.lutBank, retestPixels=[])
+    assert np.array_equal(luts, baseLuts)
+
+def test_recalibration_of_another_pixel_map_retests_every_pixel(recalibrationManager):
+    manager = recalibrationManager
+    assert manager.recalibrationPixels(np.asarray(laserSettingsOf(4).vfpMap), [1]) == (None, [0, 1, 2, 3]) # no calibration yet
+    laserSettings = laserSettingsOf(4)
+    laserTestData, commandedPowerData = pixelDataOf(manager.testSettings, [1.0] * 4)
+    manager.convertLaserDataToLUTData(laserTestData, commandedPowerData, [1, 1, 1, 1], 120, laserSettings)
+    assert manager.recalibrationPixels(np.asarray(laserSettings.vfpMap), []) == (manager.lutBank, [])
+    assert manager.recalibrationPixels(np.asarray(laserSettingsOf(4, rack=2).vfpMap), []) == (None, [0, 1, 2, 3])
+    assert manager.recalibrationPixels(np.asarray(laserSettingsOf(5).vfpMap), [2]) == (None, [0, 1, 2, 3, 4])
+    # the latest calibration in the store is the base of a new session
+    assert LUTDataManager(manager.testSettings).recalibrationPixels(np.asarray(laserSettings.vfpMap), [3])[1] == [2]
@@ -0,0 +1,67 @@
+import time
+from Model.DeviceSimulators import FakeOphirCOM
+from Model.OphirCom import OphirJunoCOM
+from Model.PyroAcquisition import PyroAcquisitionWorker
+
+def test_ready_start_restarts_a_stream_left_running_with_the_worker():
+    pyrometer = OphirJunoCOM(FakeOphirCOM(seed=0))
+    pyrometer.connectToJuno()
+    worker = PyroAcquisitionWorker(pyrometer, pollIntervalSec=0.01)
+    pyrometer.attachAcquisitionWorker(worker)
+    worker.start()
+    try:
+        pyrometer.startDataCollection()
+        start = time.perf_counter()
+        assert pyrometer.startDataCollectionWhenReady(timeoutSec=2.0)
+        assert time.perf_counter() - start < 1.0
+        assert pyrometer.lastStartError is None
+        assert pyrometer.isStreaming and pyrometer.streamStarts == 2
+    finally:
+        worker.stop()
+        pyrometer.endDataCollection()
+
+def connectedPyrometer(**fakeSettings):
+    pyrometer = OphirJunoCOM(FakeOphirCOM(pulseRateHz=200.0, seed=0, **fakeSettings))
+    pyrometer.connectToJuno()
+    return pyrometer
+
+def test_ready_start_waits_for_pulse_data_not_just_an_answer():
+    pyrometer = connectedPyrometer(armDelaySec=0.2) # GetData answers with empty data until armed, like a Juno
+    start = time.perf_counter()
+    assert pyrometer.startDataCollectionWhenReady(timeoutSec=2.0, pollIntervalSec=0.01)
+    assert time.perf_counter() - start >= 0.2
+    assert pyrometer.lastStartError is None and pyrometer.isStreaming
+    values, timestamps, statuses = pyrometer.getFullDataArrays()
+    assert len(values) > 0 and timestamps[0] >= 200.0 # the pulses before the stream was armed are lost
+    pyrometer.endDataCollection()
+
+def test_ready_start_times_out_on_a_stream_that_returns_no_data():
+    pyrometer = connectedPyrometer(armDelaySec=10.0)
+    start = time.perf_counter()
+    assert not pyrometer.startDataCollectionWhenReady(timeoutSec=0.2, pollIntervalSec=0.01)
+    assert 0.2 <= time.perf_counter() - start < 1.0
+    assert isinstance(pyrometer.lastStartError, TimeoutError) and not pyrometer.isStreaming
+    assert len(pyrometer.getFullDataArrays()[0]) == 0
+
+def test_ready_start_with_the_worker_needs_samples_of_the_new_stream():
+    pyrometer = connectedPyrometer(armDelaySec=10.0)
+    worker = PyroAcquisitionWorker(pyrometer, pollIntervalSec=0.01)
+    pyrometer.attachAcquisitionWorker(worker)
+    worker.start()
+    try:
+        assert not pyrometer.startDataCollectionWhenReady(timeoutSec=0.2, pollIntervalSec=0.01)
+        assert worker.lastAnswerTime is not None and worker.lastSampleTime is None # answered, but never with data
+        pyrometer.OphirCOM.armDelaySec = 0.1
+        assert pyrometer.startDataCollectionWhenReady(timeoutSec=2.0, pollIntervalSec=0.01)
+        assert worker.lastSampleTime > pyrometer.streamClock.startTime
+    finally:
+        worker.stop()
+        pyrometer.endDataCollection()
+
+def test_ready_start_gives_up_on_a_device_that_keeps_failing():
+    pyrometer = connectedPyrometer(armDelaySec=10.0, raiseWhileArming=True)
+    assert not pyrometer.startDataCollectionWhenReady(timeoutSec=0.1, pollIntervalSec=0.01)
+    assert isinstance(pyrometer.lastStartError, RuntimeError) and not isinstance(pyrometer.lastStartError, TimeoutError)
+    pyrometer.OphirCOM.failStarts = 1000
+    assert not pyrometer.startDataCollectionWhenReady(timeoutSec=0.1, pollIntervalSec=0.01)
+    assert "StartStream failed" in str(pyrometer.lastStartError) and not pyrometer.isStreaming
@@ -0,0 +1,204 @@
+import statistics as stat
+import numpy as np
+import pytest
+from Model.PulseStatistics import LevelConfidenceTracker, RunningPulseStatistics, computePulseLevelStatistics, evaluatePulseCapture, powerLevelIndex, studentQuantile
+from Model.SampleStore import PyrometerSampleStore
+from Model.StreamSegmenter import StreamTimeline, timelineStatistics
+
+LEVELS = [(24 + 20 * powerLevel) * 525/255 for powerLevel in range(5)]
+
+def test_power_level_index_is_none_off_the_test_levels():
+    assert [powerLevelIndex(np.float32(watts), LEVELS) for watts in LEVELS] == [0, 1, 2, 3, 4]
+    assert powerLevelIndex((LEVELS[1] + LEVELS[2]) / 2, LEVELS) is None # between two steps
+    assert powerLevelIndex(LEVELS[-1] + LEVELS[1] - LEVELS[0], LEVELS) is None # a step past the last level
+    assert powerLevelIndex(0, LEVELS) is None
+    assert powerLevelIndex(LEVELS[0], []) is None
+
+def test_add_chunk_skips_captures_without_a_power_level():
+    statistics = RunningPulseStatistics(2, LEVELS)
+    statistics.addChunk(0, None, [100.0, 101.0])
+    statistics.addChunk(0, len(LEVELS), [100.0])
+    statistics.addChunk(1, 1, [LEVELS[1], LEVELS[1]])
+    assert statistics.count.sum() == 2 and statistics.count[1, 1] == 2
+
+    store = PyrometerSampleStore(2)
+    store.appendChunk(0, None, [100.0], 0, 100.0)
+    assert store.column("powerLevel")[0] == PyrometerSampleStore.noPowerLevel
+
+def test_timeline_statistics_leave_out_windows_without_a_power_level():
+    timeline = StreamTimeline()
+    timeline.openWindow(0)
+    timeline.closeWindow(10, 0, 0)
+    timeline.openWindow(10)
+    timeline.closeWindow(20, 0, None)
+    timestamps = np.arange(20, dtype=float)
+    power = np.where(timestamps < 10, LEVELS[0], 999.0)
+    statistics = timelineStatistics(timestamps, power, timeline, 1, LEVELS)
+    assert statistics.count[0].tolist() == [10, 0, 0, 0, 0]
+    assert np.isclose(statistics.mean[0, 0], LEVELS[0], rtol=1e-6)
+
+## two sided Student t quantiles from the usual tables: (confidence, degrees of freedom, t)
+STUDENT_T = [(0.95, 1, 12.7062), (0.95, 2, 4.3027), (0.95, 3, 3.1824), (0.95, 4, 2.7764), (0.95, 5, 2.5706), (0.95, 10, 2.2281),
+             (0.95, 30, 2.0423), (0.95, 31, 2.0395), (0.95, 60, 2.0003), (0.95, 120, 1.9799), (0.99, 1, 63.6567), (0.99, 5, 4.0321),
+             (0.99, 30, 2.7500), (0.99, 40, 2.7045), (0.90, 7, 1.8946)]
+
+@pytest.mark.parametrize("confidence, degreesOfFreedom, t", STUDENT_T)
+def test_student_quantile_matches_the_t_table(confidence, degreesOfFreedom, t):
+    assert studentQuantile(confidence, degreesOfFreedom) == pytest.approx(t, rel=2e-4)
+
+def test_half_width_of_two_pulses_uses_one_degree_of_freedom():
+    tracker = LevelConfidenceTracker(100.0, 5.0, minPulses=2)
+    tracker.addPulses([99.0, 101.0])
+    assert tracker.halfWidth() == pytest.approx(12.7062, rel=2e-4) # stdev sqrt(2) over sqrt(2) pulses
+
+def test_tracker_passes_a_level_inside_the_band_once_precise_enough():
+    random = np.random.default_rng(0)
+    tracker = LevelConfidenceTracker(100.0, 5.0, minPulses=5, precisionPercent=1.0)
+    tracker.addPulses(100.0 + random.normal(0, 0.5, 4))
+    assert tracker.evaluate() is None # fewer than minPulses
+    tracker.addPulses(100.0 + random.normal(0, 0.5, 46))
+    assert tracker.evaluate() == "pass"
+    tracker.addPulses([0.0] * 100)
+    assert tracker.evaluate() == "pass" # the decision is final
+
+def test_tracker_fails_a_level_outside_the_band():
+    random = np.random.default_rng(1)
+    tracker = LevelConfidenceTracker(100.0, 5.0)
+    tracker.addPulses(80.0 + random.normal(0, 0.5, 20))
+    assert tracker.evaluate() == "fail"
+    tracker = LevelConfidenceTracker(100.0, 5.0)
+    tracker.addPulses(120.0 + random.normal(0, 0.5, 20))
+    assert tracker.evaluate() == "fail"
+
+def test_tracker_stays_undecided_while_the_interval_straddles_the_band():
+    random = np.random.default_rng(2)
+    tracker = LevelConfidenceTracker(100.0, 5.0)
+    tracker.addPulses(105.0 + random.normal(0, 3.0, 10)) # mean on the upper edge of the band
+    assert tracker.evaluate() is None
+    tracker = LevelConfidenceTracker(100.0, 5.0, precisionPercent=1.0)
+    tracker.addPulses(100.0 + random.normal(0, 10.0, 6)) # inside the band but not precise enough
+    assert tracker.evaluate() is None and tracker.decision is None
+
+## Per pixel split, mean and stdev as Model.generateTestResultDataFrame did them before computePulseLevelStatistics
+def referenceLevelStatistics(laserTestData, commandedPowerData, commandedPowerLevels):
+    pulseSplitData = []
+    for pixelIdx, pixelrawdata in enumerate(laserTestData):
+        if len(pixelrawdata) == 0:
+            pulseSplitData.append([])
+        else:
+            pulseChangeIndexes = [pwrIdx + 1 for pwrIdx, powerDiff in enumerate(np.diff(commandedPowerData[pixelIdx])) if powerDiff > 0]
+            pulseChangeIndexes.insert(0, 0)
+            pulseChangeIndexes.append(len(pixelrawdata) + 1)
+            pulseSplitData.append([pixelrawdata[pulseChangeIndexes[idx]:pulseChangeIndexes[idx+1]] for idx in range(len(pulseChangeIndexes)-1)])
+    levels = range(len(commandedPowerLevels))
+    mean = np.array([[stat.mean(pixelData[levelNum]) if levelNum < len(pixelData) and len(pixelData[levelNum]) > 0 else np.nan for levelNum in levels] for pixelData in pulseSplitData])
+    stdev = np.array([[stat.stdev(pixelData[levelNum]) if levelNum < len(pixelData) and len(pixelData[levelNum]) > 1 else np.nan for levelNum in levels] for pixelData in pulseSplitData])
+    count = np.array([[len(pixelData[levelNum]) if levelNum < len(pixelData) else 0 for levelNum in levels] for pixelData in pulseSplitData])
+    deviation = np.array([[np.nan if np.isnan(average) else 0 if average == level else abs(average - level) / level * 100.0
+                           for average, level in zip(pixelMean, commandedPowerLevels)] for pixelMean in mean])
+    return mean, stdev, count, deviation
+
+def assertMatchesReference(laserTestData, commandedPowerData, commandedPowerLevels):
+    statistics = computePulseLevelStatistics(laserTestData, commandedPowerData, commandedPowerLevels)
+    mean, stdev, count, deviation = referenceLevelStatistics(laserTestData, commandedPowerData, commandedPowerLevels)
+    np.testing.assert_array_equal(statistics.count, count)
+    np.testing.assert_allclose(statistics.mean, mean, rtol=1e-12, equal_nan=True)
+    np.testing.assert_allclose(statistics.stdev, stdev, rtol=1e-7, atol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(statistics.deviation, deviation, rtol=1e-9, atol=1e-9, equal_nan=True)
+    return statistics
+
+def test_level_statistics_match_the_per_level_split_on_random_tests():
+    random = np.random.default_rng(3)
+    laserTestData, commandedPowerData = [], []
+    for pixel in range(40):
+        pulses = random.integers(1, 12, len(LEVELS))
+        commandedPowerData.append(np.repeat(LEVELS, pulses).tolist())
+        laserTestData.append((np.repeat(LEVELS, pulses) * random.normal(1, 0.02, pulses.sum())).tolist())
+    statistics = assertMatchesReference(laserTestData, commandedPowerData, LEVELS)
+    assert statistics.completePixels().all()
+
+def test_level_statistics_keep_their_precision_far_from_zero():
+    random = np.random.default_rng(4)
+    commanded = np.repeat(LEVELS, 20)
+    measured = 1e6 + commanded + random.normal(0, 1e-3, len(commanded))
+    assertMatchesReference([measured.tolist()], [commanded.tolist()], (1e6 + np.array(LEVELS)).tolist())
+
+def test_level_statistics_of_empty_short_and_irregular_pixels():
+    laserTestData = [
+        [],                                                         # untested pixel
+        [100.0, 101.0, 150.0],                                      # aborted after two levels, a single pulse level
+        [50.0, 51.0, 40.0, 41.0, 60.0],                             # commanded power goes down: no new level, like the per level split
+        [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0],                        # more power steps than levels: the extra ones are left out
+        [7.0, 8.0],                                                 # commanded data shorter than the measured data
+        ]
+    commandedPowerData = [
+        [],
+        [LEVELS[0], LEVELS[0], LEVELS[1]],
+        [LEVELS[1], LEVELS[1], LEVELS[0], LEVELS[0], LEVELS[2]],
+        [1, 2, 3, 4, 5, 6, 7],
+        [LEVELS[0]],
+        ]
+    statistics = assertMatchesReference(laserTestData, commandedPowerData, LEVELS)
+    assert statistics.count[0].tolist() == [0, 0, 0, 0, 0] and statistics.count[2].tolist() == [4, 1, 0, 0, 0]
+    assert statistics.completePixels().tolist() == [False, False, False, True, False]
+    empty = computePulseLevelStatistics([], [], LEVELS)
+    assert empty.mean.shape == (0, len(LEVELS))
+
+## Per pulse checks as Model._capturePowerData did them before evaluatePulseCapture: returns the kept powers, the max power and the pixel status
+def referencePulseCapture(pulses, multiplicationFactor, pulseOnMsec, expectedPower, tolerancePercent):
+    allPulsesOkay, lastError, measuredPowerMax, pulsePowers = True, 0, 0, []
+    for value, timestamp, status in pulses:
+        energy = value * multiplicationFactor
+        if status == 0:
+            measuredPower = energy/(pulseOnMsec / 1000)
+            pulsePowers.append(measuredPower)
+            measuredPowerMax = max([measuredPower, measuredPowerMax])
+            if measuredPower > (expectedPower * (1 + tolerancePercent/100)):
+                lastError, allPulsesOkay = 2, False
+            elif measuredPower < (expectedPower * (1 - tolerancePercent/100)):
+                lastError, allPulsesOkay = 3, False
+            elif measuredPower < (expectedPower * 0.05):
+                lastError, allPulsesOkay = 4, False
+    return pulsePowers, measuredPowerMax, 1 if allPulsesOkay else lastError
+
+def assertCaptureMatchesReference(pulses, expectedPower, tolerancePercent, multiplicationFactor=2.0, pulseOnMsec=5):
+    values, timestamps, statuses = (np.array(column, dtype=float) for column in zip(*pulses)) if pulses else ([], [], [])
+    evaluation = evaluatePulseCapture(values, timestamps, statuses, multiplicationFactor, pulseOnMsec, expectedPower, tolerancePercent)
+    pulsePowers, measuredPowerMax, status = referencePulseCapture(pulses, multiplicationFactor, pulseOnMsec, expectedPower, tolerancePercent)
+    np.testing.assert_allclose(evaluation.power, pulsePowers, rtol=1e-12)
+    assert evaluation.maxPower == pytest.approx(measuredPowerMax, rel=1e-12) and evaluation.status == status
+    assert evaluation.rejectedPulses == sum(1 for pulse in pulses if pulse[2] != 0) and len(evaluation) == len(pulsePowers)
+    return evaluation
+
+def test_pulse_capture_matches_the_per_pulse_checks_on_random_captures():
+    random = np.random.default_rng(5)
+    for capture in range(50):
+        numPulses = random.integers(1, 30)
+        values = 0.25 * random.normal(1, 0.08, numPulses) * random.choice([1, 1, 1, 0.01], numPulses)
+        statuses = random.choice([0, 0, 0, 0, 1, 4], numPulses)
+        assertCaptureMatchesReference(list(zip(values, range(numPulses), statuses)), 100.0, 5.0)
+
+def test_pulse_capture_rejects_pulses_with_a_device_status():
+    evaluation = assertCaptureMatchesReference([(0.25, 0, 0), (5.0, 1, 1), (0.0, 2, 2), (0.25, 3, 0)], 100.0, 5.0)
+    assert evaluation.status == 1 and evaluation.rejectedPulses == 2 and evaluation.timestamps.tolist() == [0, 3]
+
+def test_pulse_capture_reports_the_status_of_the_last_failing_pulse():
+    high, low, good = (0.3, 0, 0), (0.2, 0, 0), (0.25, 0, 0)
+    assert assertCaptureMatchesReference([high, low, good], 100.0, 5.0).status == 3
+    assert assertCaptureMatchesReference([low, high, good, good], 100.0, 5.0).status == 2
+    assert assertCaptureMatchesReference([good, good], 100.0, 5.0).status == 1
+
+def test_pulse_capture_no_power_threshold():
+    # the low power check comes first, so no power is only reported once the tolerance band reaches below 5%
+    nearZero = [(0.25 * 0.049, 0, 0)]
+    assert assertCaptureMatchesReference(nearZero, 100.0, 5.0).status == 3
+    assert assertCaptureMatchesReference(nearZero, 100.0, 96.0).status == 4
+    assert assertCaptureMatchesReference([(0.25 * 0.051, 0, 0)], 100.0, 96.0).status == 1
+    evaluation = assertCaptureMatchesReference([(-0.01, 0, 0)], 100.0, 96.0)
+    assert evaluation.status == 3 and evaluation.maxPower == 0.0 # a negative reading is low power, the max power starts at zero
+
+def test_empty_and_fully_rejected_captures():
+    empty = assertCaptureMatchesReference([], 100.0, 5.0)
+    assert empty.status == 1 and empty.maxPower == 0.0 and len(empty) == 0
+    rejected = assertCaptureMatchesReference([(0.25, 0, 3), (0.25, 1, 3)], 100.0, 5.0)
+    assert rejected.status == 1 and rejected.maxPower == 0.0 and rejected.rejectedPulses == 2
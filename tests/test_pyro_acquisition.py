@@ -0,0 +1,46 @@
+import time
+import numpy as np
+from Model.DeviceSimulators import FakeOphirCOM
+from Model.OphirCom import OphirJunoCOM
+from Model.PyroAcquisition import PyroAcquisitionWorker
+
+def streamingPyrometer():
+    pyrometer = OphirJunoCOM(FakeOphirCOM(pulseRateHz=1000.0, seed=0))
+    pyrometer.connectToJuno()
+    pyrometer.startDataCollection()
+    return pyrometer
+
+def test_full_queue_drops_the_oldest_chunks_and_counts_them():
+    pyrometer = streamingPyrometer()
+    worker = PyroAcquisitionWorker(pyrometer, maxQueuedChunks=3)
+    sizes = []
+    for chunk in range(5):
+        time.sleep(0.01)
+        sizes.append(worker.poll())
+    assert min(sizes) > 0 and worker.chunks == 5 and worker.samples == sum(sizes)
+    assert worker.overruns == 2 and worker.droppedSamples == sizes[0] + sizes[1]
+    chunks = worker.drain()
+    assert [len(values) for values, timestamps, statuses in chunks] == sizes[2:]
+    timestamps = np.concatenate([chunk[1] for chunk in chunks])
+    assert timestamps[0] == sizes[0] + sizes[1] and np.all(np.diff(timestamps) == 1.0) # the newest chunks are kept, in order
+    assert worker.queueDepth == 0 and worker.drain() == []
+    pyrometer.endDataCollection()
+
+def test_update_data_drains_every_queued_sample_into_the_buffer():
+    pyrometer = streamingPyrometer()
+    worker = PyroAcquisitionWorker(pyrometer, pollIntervalSec=0.01)
+    pyrometer.attachAcquisitionWorker(worker)
+    worker.start()
+    try:
+        time.sleep(0.2)
+        pyrometer.updateData()
+        time.sleep(0.05)
+        pyrometer.updateData()
+    finally:
+        worker.stop()
+        pyrometer.endDataCollection()
+    pyrometer.updateData()
+    values, timestamps, statuses = pyrometer.getFullDataArrays()
+    assert worker.overruns == 0 and worker.errors == 0 and worker.samples > 0
+    assert len(values) + worker.queueDepth == worker.samples
+    assert np.array_equal(timestamps, np.arange(len(timestamps), dtype=float))
@@ -0,0 +1,63 @@
+import warnings
+import numpy as np
+from Model.QuadraticFit import fitQuadratics
+
+## np.polyfit of every row with its residual sum of squares and the condition number of the column scaled Vandermonde matrix
+def polyfitRows(x, y):
+    coefficients, residuals, conditionNumbers = [], [], []
+    for xRow, yRow in zip(x, y):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", np.exceptions.RankWarning)
+            rowCoefficients = np.polyfit(xRow, yRow, 2)
+        vandermonde = np.vander(xRow, 3)
+        scale = np.sqrt((vandermonde * vandermonde).sum(axis=0))
+        scale[scale == 0] = 1
+        coefficients.append(rowCoefficients)
+        residuals.append(((np.polyval(rowCoefficients, xRow) - yRow) ** 2).sum())
+        conditionNumbers.append(np.linalg.cond(vandermonde / scale))
+    return np.array(coefficients), np.array(residuals), np.array(conditionNumbers)
+
+def test_random_rows_match_polyfit():
+    random = np.random.default_rng(0)
+    x = random.uniform(0, 1, (200, 5))
+    y = np.linspace(0.1, 0.9, 5) # shared y like the LUT fit, the commanded levels
+    fit = fitQuadratics(x, y)
+    coefficients, residuals, conditionNumbers = polyfitRows(x, np.broadcast_to(y, x.shape))
+    np.testing.assert_allclose(fit.coefficients, coefficients, rtol=1e-8, atol=1e-10)
+    np.testing.assert_allclose(fit.residuals, residuals, rtol=1e-6, atol=1e-20)
+    np.testing.assert_allclose(fit.conditionNumbers, conditionNumbers, rtol=1e-8)
+    assert np.all(fit.rank == 3) and len(fit) == 200
+
+def test_ill_conditioned_rows_match_polyfit():
+    random = np.random.default_rng(1)
+    x = 1 + 1e-4 * np.sort(random.uniform(0, 1, (50, 5)), axis=1) # closely spaced levels far from zero
+    y = 3 * x * x - 2 * x + 1 + random.normal(0, 1e-9, x.shape)
+    fit = fitQuadratics(x, y)
+    coefficients, residuals, conditionNumbers = polyfitRows(x, y)
+    assert np.all(fit.conditionNumbers > 1e7)
+    np.testing.assert_allclose(fit.conditionNumbers, conditionNumbers, rtol=1e-6)
+    # the coefficients are only determined to about condition number * eps, the fitted values much better
+    np.testing.assert_allclose(fit.coefficients, coefficients, rtol=1e-4, atol=1e-4 * np.abs(coefficients).max())
+    np.testing.assert_allclose([np.polyval(row, xRow) for row, xRow in zip(fit.coefficients, x)], y, rtol=1e-8)
+    np.testing.assert_allclose(fit.residuals, residuals, rtol=1e-3, atol=1e-20)
+
+def test_rank_deficient_and_non_finite_rows():
+    x = np.array([[0.1, 0.3, 0.5, 0.7], [0.4, 0.4, 0.4, 0.4], [0.0, 0.0, 0.0, 0.0], [0.1, np.nan, 0.5, 0.7], [0.1, 0.3, 0.5, 0.7]])
+    y = np.array([[0.1, 0.3, 0.5, 0.7], [0.1, 0.2, 0.3, 0.4], [0.1, 0.2, 0.3, 0.4], [0.1, 0.2, 0.3, 0.4], [0.1, 0.2, np.inf, 0.4]])
+    fit = fitQuadratics(x, y)
+    assert fit.rank.tolist() == [3, 1, 1, 0, 0]
+    # a single repeated x: minimum norm solution like np.polyfit, through the mean of y at that x
+    coefficients, residuals, conditionNumbers = polyfitRows(x[:2], y[:2])
+    np.testing.assert_allclose(fit.coefficients[:2], coefficients, atol=1e-12)
+    np.testing.assert_allclose(fit.residuals[:2], residuals, atol=1e-12)
+    assert np.isclose(np.polyval(fit.coefficients[1], 0.4), 0.25)
+    # x all zero (np.polyfit fails on it): only the constant term is fitted
+    np.testing.assert_allclose(fit.coefficients[2], [0, 0, 0.25], atol=1e-12)
+    assert np.all(fit.conditionNumbers[1:] > 1e15)
+    # rows with a NaN or infinite value are not fitted and don't affect the others
+    assert np.all(np.isnan(fit.coefficients[3:])) and np.all(np.isnan(fit.residuals[3:])) and np.all(np.isinf(fit.conditionNumbers[3:]))
+    np.testing.assert_allclose(fitQuadratics(x[:1], y[:1]).coefficients, fit.coefficients[:1])
+
+def test_empty_input():
+    fit = fitQuadratics(np.empty((0, 5)), np.linspace(0, 1, 5))
+    assert fit.coefficients.shape == (0, 3) and len(fit.residuals) == 0 and len(fit.rank) == 0
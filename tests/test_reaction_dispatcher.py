@@ -0,0 +1,73 @@
+import threading
+import time
+from Model.ReactionDispatcher import ReactionDispatcher
+
+def test_tasks_of_a_key_run_in_submission_order_one_at_a_time():
+    dispatcher = ReactionDispatcher(numWorkers=4)
+    order = {"command": [], "heartbeat": []}
+    running = {"command": 0, "heartbeat": 0}
+    overlaps = []
+    def task(key, index):
+        running[key] += 1
+        overlaps.append(running[key])
+        time.sleep(0.001)
+        order[key].append(index)
+        running[key] -= 1
+    for index in range(50):
+        dispatcher.submit("command", task, "command", index)
+        dispatcher.submit("heartbeat", task, "heartbeat", index)
+    dispatcher.shutdown()
+    assert order["command"] == list(range(50)) and order["heartbeat"] == list(range(50))
+    assert max(overlaps) == 1
+    assert dispatcher.stats()["completed"] == 100
+
+def test_different_keys_run_in_parallel():
+    dispatcher = ReactionDispatcher(numWorkers=2)
+    release = threading.Event()
+    dispatcher.submit("command", release.wait, 5.0)
+    heartbeat = threading.Event()
+    dispatcher.submit("heartbeat", heartbeat.set)
+    assert heartbeat.wait(1.0) # not stuck behind the blocked command
+    release.set()
+    dispatcher.shutdown()
+
+def test_submit_blocks_while_the_queue_is_full():
+    dispatcher = ReactionDispatcher(numWorkers=1, maxPending=2)
+    release = threading.Event()
+    dispatcher.submit("command", release.wait, 5.0)
+    dispatcher.submit("command", lambda: None)
+    start = time.perf_counter()
+    assert not dispatcher.submit("command", lambda: None, timeout=0.1)
+    assert time.perf_counter() - start >= 0.09 and dispatcher.rejected == 1
+
+    # a blocked submit goes through once a running task frees its slot
+    submitted = []
+    blocked = threading.Thread(target=lambda: submitted.append(dispatcher.submit("command", lambda: None)))
+    blocked.start()
+    blocked.join(0.1)
+    assert blocked.is_alive() and submitted == []
+    release.set()
+    blocked.join(1.0)
+    assert submitted == [True]
+    dispatcher.shutdown()
+    assert dispatcher.stats()["completed"] == 3
+
+def test_stats_report_queue_depth_latency_and_errors():
+    dispatcher = ReactionDispatcher(numWorkers=1)
+    release = threading.Event()
+    dispatcher.submit("command", release.wait, 5.0)
+    for index in range(4):
+        dispatcher.submit("command", time.sleep, 0.01)
+    def failing():
+        raise RuntimeError("reaction failed")
+    dispatcher.submit("command", failing)
+    time.sleep(0.05)
+    assert dispatcher.depth == 5 # the running task is no longer queued
+    release.set()
+    dispatcher.shutdown()
+    stats = dispatcher.stats()
+    assert stats["submitted"] == 6 and stats["completed"] == 5 and stats["errors"] == 1 and stats["rejected"] == 0
+    assert stats["depth"] == 0 and stats["maxDepth"] == 6
+    # the last task waited behind the 0.05 s block and the four sleeps
+    assert stats["maxLatencySec"] >= 0.09 and 0 < stats["meanLatencySec"] <= stats["maxLatencySec"]
+    assert stats["maxRunSec"] >= 0.05
@@ -0,0 +1,106 @@
+import time
+import numpy as np
+from Model.OphirCom import OphirJunoCOM
+from Model.StreamSegmenter import StreamTimeline, closeLevelWindow, timelineStatistics
+
+## Juno stand-in that only streams the pulses the laser fired, with a GetData round trip of getDataDelaySec
+## Pulses of a level are scheduled by fireLevel; between the levels the stream is silent like the real device with the laser gated off
+class GatedJuno:
+
+    def __init__(self, getDataDelaySec=0.01) -> None:
+        self.getDataDelaySec = getDataDelaySec
+        self._startTime = None
+        self._fireTimes = []
+        self._powers = []
+        self._sent = 0
+
+    def ScanUSB(self):
+        return ("GATED",)
+
+    def OpenUSBDevice(self, device):
+        return 1
+
+    def IsSensorExists(self, deviceHandle, channel):
+        return True
+
+    def GetDeviceInfo(self, deviceHandle):
+        return ("Juno+", "1.0", "GATED")
+
+    def GetDeviceCalibrationDueDate(self, deviceHandle):
+        return "2099-01-01 00:00:00"
+
+    def GetSensorInfo(self, deviceHandle, channel):
+        return ("GATED", "Pyro", "Fake")
+
+    def GetSensorCalibrationDueDate(self, deviceHandle, channel):
+        return "2099-01-01 00:00:00"
+
+    def StartStream(self, deviceHandle, channel):
+        self._startTime = time.perf_counter()
+
+    def StopStream(self, deviceHandle, channel):
+        self._startTime = None
+
+    def StopAllStreams(self):
+        self.StopStream(0, 0)
+
+    def CloseAll(self):
+        self.StopStream(0, 0)
+
+    ## Fires count pulses of powerWatts at rateHz starting now, returns once the last one is fired
+    def fireLevel(self, count, rateHz, powerWatts):
+        now = time.perf_counter()
+        self._fireTimes.extend(now + np.arange(count) / rateHz)
+        self._powers.extend([powerWatts] * count)
+        time.sleep((count - 1) / rateHz)
+
+    def GetData(self, deviceHandle, channel):
+        time.sleep(self.getDataDelaySec)
+        now = time.perf_counter()
+        fired = int(np.searchsorted(self._fireTimes, now, side='right'))
+        first, self._sent = self._sent, fired
+        timestamps = (np.array(self._fireTimes[first:fired]) - self._startTime) * 1000
+        return tuple(self._powers[first:fired]), tuple(timestamps.tolist()), (0,) * (fired - first)
+
+
+def test_gated_levels_keep_every_pulse():
+    juno = GatedJuno(getDataDelaySec=0.01)
+    pyrometer = OphirJunoCOM(juno)
+    pyrometer.connectToJuno()
+    pyrometer.startDataCollection()
+    timeline = StreamTimeline()
+    pulsesPerLevel = 5
+    levels = [10.0, 20.0, 30.0, 40.0]
+    kept = []
+    for level, powerWatts in enumerate(levels):
+        timeline.openWindow(pyrometer.streamClock.deviceTime())
+        juno.fireLevel(pulsesPerLevel, 100.0, powerWatts)
+        time.sleep(0.05) # laser off, the PLC sends the capture command
+        values, timestamps, statuses = pyrometer.getFullDataArrays()
+        first, last = closeLevelWindow(timeline, timestamps, 0, level)
+        kept.append(values[first:last].copy())
+    assert [len(levelValues) for levelValues in kept] == [pulsesPerLevel] * len(levels)
+    for levelValues, powerWatts in zip(kept, levels):
+        assert np.all(levelValues == powerWatts)
+
+    values, timestamps, statuses = pyrometer.getFullDataArrays(update=False)
+    stats = timelineStatistics(timestamps, values, timeline, 1, levels)
+    assert stats.count.tolist() == [[pulsesPerLevel] * len(levels)]
+    assert np.allclose(stats.mean, [levels])
+
+
+def test_windows_never_overlap():
+    timeline = StreamTimeline()
+    assert timeline.closeWindow(100.0, 0, 0) == (-np.inf, 100.0)
+    timeline.openWindow(90.0) # start estimated before the previous capture
+    assert timeline.closeWindow(200.0, 0, 1) == (100.0, 200.0)
+    timeline.openWindow(5.0) # restarted stream, timestamps start over
+    assert timeline.closeWindow(50.0, 1, 0) == (5.0, 50.0)
+    assert not timeline.ordered
+
+
+def test_capture_without_samples_is_empty():
+    timeline = StreamTimeline()
+    timeline.openWindow(10.0)
+    assert closeLevelWindow(timeline, np.array([1.0, 2.0]), 0, 0) == (2, 2)
+    assert closeLevelWindow(timeline, np.array([]), 0, 1) == (0, 0)